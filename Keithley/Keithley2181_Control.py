@@ -1,4 +1,5 @@
 import time
+import numpy as np
 
 from PyQt5 import QtWidgets, QtGui
 from PyQt5.QtCore import pyqtSignal, pyqtSlot
@@ -26,9 +27,14 @@ class Keithley2182_Updater(AbstractLoopThread):
         The information from the device is collected in regular intervals (method "running"),
         and subsequently sent to the main thread. It is packed in a dict,
         the keys of which are displayed in the "sensors" dict in this class.
+
+        With setTrace, every cycle acquires a whole trace of readings
+        through the trace buffer instead, sent as numpy arrays via sig_Tracedata
+        (dict of timeseconds, Voltage_DC), the mean goes to sig_Infodata.
     """
 
     sig_Infodata = pyqtSignal(dict)
+    sig_Tracedata = pyqtSignal(dict)
     # sig_assertion = pyqtSignal(str)
     sig_visaerror = pyqtSignal(str)
     sig_visatimeout = pyqtSignal()
@@ -43,6 +49,10 @@ class Keithley2182_Updater(AbstractLoopThread):
         super().__init__(**kwargs)
 
         self.Keithley2182 = Keithley2182(InstrumentAddress=InstrumentAddress)
+        self.sensors = deepcopy(self.sensors)
+        # readings per trace (0: single readings), interval between them (s)
+        self.trace_points = 0
+        self.trace_interval = None
 
 #        self.delay1 = 1
 #        self.delay = 0.0
@@ -60,10 +70,19 @@ class Keithley2182_Updater(AbstractLoopThread):
 
         """
         try:
-            self.sensors['Voltage_DC'] = self.Keithley2182.measureVoltage()
-            self.sensors['Temperature_K'] = self.Keithley2182.measureTemperatre()
+            if self.trace_points:
+                started = time.time()
+                values = self.Keithley2182.acquire(self.trace_points, self.trace_interval)
+                # timed by the instrument: equidistant, or spread over the acquisition
+                interval = self.trace_interval or (time.time() - started) / len(values)
+                self.sig_Tracedata.emit(dict(timeseconds=started + interval * np.arange(len(values)),
+                                             Voltage_DC=values))
+                self.sensors['Voltage_DC'] = float(np.mean(values))
+            else:
+                self.sensors['Voltage_DC'] = self.Keithley2182.measureVoltage()
+                self.sensors['Temperature_K'] = self.Keithley2182.measureTemperature()
 
-            self.sig_Infodata.emit(deepcopy(sensors))
+            self.sig_Infodata.emit(deepcopy(self.sensors))
 
             # time.sleep(self.delay1)
         except AssertionError as e_ass:
@@ -73,3 +92,27 @@ class Keithley2182_Updater(AbstractLoopThread):
                 self.sig_visatimeout.emit()
             else:
                 self.sig_visaerror.emit(e_visa.args[0])
+
+    @pyqtSlot(int, float)
+    def setTrace(self, points, interval):
+        """acquire traces of points readings, interval (s) apart (0: as fast as possible),
+            points 0 switches back to single readings
+
+            configures binary transfers and the fastest integration for the traces
+        """
+        self.trace_points = points
+        self.trace_interval = interval or None
+        try:
+            self.Keithley2182.configureChannel(2, 'VOLT')
+            self.Keithley2182.setBinaryFormat(bool(points))
+            if points:
+                self.Keithley2182.setSpeed(0.01, autozero=False, filtered=False)
+            else:
+                self.Keithley2182.setSpeed(1.)
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                self.sig_visatimeout.emit()
+            else:
+                self.sig_visaerror.emit(e_visa.args[0])
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 """
 Driver for the Keithley 2182 Nano-Voltmeter
+
+Besides single readings, the 2182A can fill its internal trace buffer
+(up to 1024 readings) at a programmed rate, triggered by its own timer,
+the buffer is then transferred in one binary block (FORM REAL,32) and
+parsed straight into a numpy array.
 """
 
 import threading, visa
+import time
 
 import logging
+import numpy as np
+
+import simulation
+import connection_pool
+import gpib_bus
+import instrumentation
 
 # create a logger object for this module
 logger = logging.getLogger(__name__)
@@ -23,32 +35,225 @@ class Keithley2182(object):
 
     """
     The Keithley 2182 is a nano-voltmeter. You can find the full specifications
-    list in the `user's guide`_.
+    list in the user's guide.
 
     Example usage:
 
-    >>> import instruments as ik
-    >>> meter = ik.keithley.Keithley2182.open_gpibusb("/dev/ttyUSB0", 10)
-    >>> print meter.measure(meter.Mode.voltage_dc)
+    >>> meter = Keithley2182(InstrumentAddress='GPIB0::7::INSTR')
+    >>> meter.measureVoltage()
+    >>> meter.setBinaryFormat()
+    >>> meter.setSpeed(0.01, autozero=False, filtered=False)
+    >>> readings = meter.acquire(points=500, interval=0.005)   # numpy array, 200 readings/s
     """
+
+    # number of readings the trace buffer holds
+    trace_max = 1024
+    # fastest timer interval (s)
+    interval_min = 0.001
+    # power line frequency (Hz), the integration time is counted in its cycles
+    line_frequency = 50.
+
     def __init__(self, InstrumentAddress = 'GPIB0::12::INSTR'):
 
 
 
-        self._visa_resource = resource_manager.open_resource(InstrumentAddress)
+        manager = simulation.resource_manager if simulation.is_simulated(InstrumentAddress) else resource_manager
+        # the pool reconnects the session if it dies, and reuses it when opened again
+        self._visa_resource = connection_pool.open_resource(InstrumentAddress, manager)
         # self._visa_resource.read_termination = '\r'
-        self.CommunicationLock = threading.Lock()
+        # shared with all instruments on the same bus, readings run at trigger priority
+        self.CommunicationLock = gpib_bus.bus_for(InstrumentAddress).device(InstrumentAddress,
+                                                                             priority=gpib_bus.TRIGGER)
         self.device = self._visa_resource
+        # transactions are reported to instrumentation under this name
+        self.instrument_name = 'Keithley2182 {}'.format(InstrumentAddress)
+        self.binary = False
+        # as set by setSpeed (the defaults after a reset), for the duration of a trace
+        self.nplc = 1.
+
+    def query(self, command):
+        """Sends a query to the device, returns the answer (string)"""
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock,
+                                     len(command) + 1) as transaction:
+            answer = self.device.query(command)
+            transaction.received = len(answer)
+        return answer.strip()
+
+    def sendcmd(self, command):
+        """Sends a command to the device"""
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock, len(command) + 1):
+            self.device.write(command)
+
+    def query_values(self, command):
+        """Sends a query, returns the answer (several readings) as numpy array
+
+            in binary format (see setBinaryFormat) the block is parsed directly,
+            otherwise the comma separated values are
+        """
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock,
+                                     len(command) + 1) as transaction:
+            if self.binary:
+                values = np.asarray(self.device.query_binary_values(
+                    command, datatype='f', is_big_endian=False, container=np.array), dtype=float)
+                # header '#<n><length>', 4 bytes per reading, termination
+                transaction.received = 4 * len(values) + len(str(4 * len(values))) + 3
+            else:
+                answer = self.device.query(command)
+                transaction.received = len(answer)
+                values = np.array([float(value) for value in answer.strip().split(',') if value], dtype=float)
+        return values
+
+    def reset(self):
+        """Resets the instrument to its default settings, clears the status"""
+        self.sendcmd('*RST')
+        self.sendcmd('*CLS')
+        self.binary = False
+        self.nplc = 1.
+
+    def setBinaryFormat(self, binary=True):
+        """Selects the format of transferred readings: single precision binary
+        (little endian), or ASCII"""
+        if binary:
+            self.sendcmd('FORM:DATA REAL,32')
+            self.sendcmd('FORM:BORD SWAP')
+        else:
+            self.sendcmd('FORM:DATA ASC')
+        self.binary = binary
+
+    def configureChannel(self, channel=1, function='VOLT'):
+        """Selects the channel (1, 2) and function ('VOLT', 'TEMP')"""
+        if channel not in (1, 2):
+            raise AssertionError('Keithley2182: configureChannel: channel must be 1 or 2')
+        if function not in ('VOLT', 'TEMP'):
+            raise AssertionError('Keithley2182: configureChannel: function must be VOLT or TEMP')
+        self.sendcmd("SENS:FUNC '{}'".format(function))
+        self.sendcmd('SENS:CHAN {:d}'.format(channel))
+
+    def setSpeed(self, nplc=1., autozero=True, filtered=True):
+        """Sets the integration time, in power line cycles (0.01 to 50 (60 Hz: 60)),
+        switches autozero and the analog and digital filters
+
+        for the highest reading rates: nplc=0.01, autozero=False, filtered=False
+        """
+        if not 0.01 <= nplc <= 60:
+            raise AssertionError('Keithley2182: setSpeed: nplc must be within 0.01 and 60')
+        self.sendcmd('SENS:VOLT:NPLC {:g}'.format(nplc))
+        self.sendcmd('SYST:AZER {}'.format('ON' if autozero else 'OFF'))
+        self.sendcmd('SENS:VOLT:DFIL {}'.format('ON' if filtered else 'OFF'))
+        self.sendcmd('SENS:VOLT:LPAS {}'.format('ON' if filtered else 'OFF'))
+        self.nplc = nplc
+
+    def readingTime(self, interval=None):
+        """Returns the shortest time per reading of a trace (s):
+        the timer interval, or the integration time, if longer
+        (autozero and filters only add to it, waitTrace polls for the rest)"""
+        return max(interval or 0., self.nplc / self.line_frequency)
+
+    def setRange(self, voltage=None, channel=1):
+        """Sets the voltage range of a channel, None for autoranging"""
+        if voltage is None:
+            self.sendcmd('SENS:VOLT:CHAN{:d}:RANG:AUTO ON'.format(channel))
+        else:
+            self.sendcmd('SENS:VOLT:CHAN{:d}:RANG {:g}'.format(channel, voltage))
+
+    def setDisplay(self, enabled=True):
+        """Switches the front panel display, off it does not cost measurement time"""
+        self.sendcmd('DISP:ENAB {}'.format('ON' if enabled else 'OFF'))
+
+    def configureTrace(self, points, interval=None):
+        """Prepares the trace buffer to store the next points readings
+
+        :param points: number of readings, 2 to trace_max
+        :param interval: time between readings (s), timed by the instrument,
+            None: as fast as the integration time allows
+        """
+        if not 2 <= points <= self.trace_max:
+            raise AssertionError('Keithley2182: configureTrace: points must be within 2 and {}'.format(self.trace_max))
+        if interval is not None and interval < self.interval_min:
+            raise AssertionError('Keithley2182: configureTrace: interval must be at least {} s'.format(self.interval_min))
+        self.sendcmd('ABOR')
+        self.sendcmd('INIT:CONT OFF')
+        self.sendcmd('TRAC:CLE')
+        self.sendcmd('TRAC:POIN {:d}'.format(points))
+        self.sendcmd('TRAC:FEED SENS')
+        self.sendcmd('TRAC:FEED:CONT NEXT')
+        self.sendcmd('SAMP:COUN 1')
+        if interval is None:
+            self.sendcmd('TRIG:SOUR IMM')
+        else:
+            self.sendcmd('TRIG:SOUR TIM')
+            self.sendcmd('TRIG:TIM {:g}'.format(interval))
+        self.sendcmd('TRIG:COUN {:d}'.format(points))
+
+    def startTrace(self):
+        """Starts filling the trace buffer, see configureTrace"""
+        with instrumentation.measure(self.instrument_name, 'INIT', self.CommunicationLock(gpib_bus.SETPOINT), 5):
+            self.device.write('INIT')
+
+    def traceCount(self):
+        """Returns the number of readings in the trace buffer"""
+        return int(self.query('TRAC:POIN:ACT?'))
+
+    def waitTrace(self, points, expected=0., timeout=None):
+        """Waits until the trace buffer holds points readings
+
+        the bus is not occupied while waiting: the expected duration is slept,
+        then the number of readings is polled
+
+        :param expected: expected duration of the acquisition (s)
+        :param timeout: AssertionError if the number of readings did not increase
+            for timeout (s), after the expected duration
+        """
+        started = time.monotonic()
+        timeout = max(1., 0.5 * expected) if timeout is None else timeout
+        time.sleep(expected)
+        last_count, last_change = -1, time.monotonic()
+        while True:
+            count = self.traceCount()
+            if count >= points:
+                return
+            if count != last_count:
+                last_count, last_change = count, time.monotonic()
+            elif time.monotonic() - last_change > timeout:
+                raise AssertionError('Keithley2182: waitTrace: {} of {} readings after {:.1f} s'.format(
+                    count, points, time.monotonic() - started))
+            # the remaining readings, at the rate seen so far, at most 0.1 s
+            rate = count / max(time.monotonic() - started, 1e-3)
+            time.sleep(min(max((points - count) / rate if rate else 0.02, 0.002), 0.1))
+
+    def fetchTrace(self):
+        """Returns all readings in the trace buffer, as numpy array (one transfer)"""
+        return self.query_values('TRAC:DATA?')
+
+    def acquire(self, points, interval=None, timeout=None):
+        """Acquires points readings at the given interval into the trace buffer,
+        and transfers them, in blocks of at most trace_max readings
 
+        the channel, function, speed and binary format are those set before,
+        for hundreds of readings per second use setBinaryFormat() and setSpeed(0.01, False, False)
 
+        :param points: number of readings (at least 2)
+        :param interval: time between readings (s), None: as fast as possible
+        :return: numpy array of the readings
+        """
+        blocks = []
+        remaining = points
+        while remaining > 0:
+            block = max(min(remaining, self.trace_max), 2)
+            self.configureTrace(block, interval)
+            self.startTrace()
+            self.waitTrace(block, expected=block * self.readingTime(interval), timeout=timeout)
+            blocks.append(self.fetchTrace()[:block])
+            remaining -= block
+        return np.concatenate(blocks)[:points]
 
     def measureTemperature(self):
         self.sendcmd("SENS:CHAN 1")
         self.sendcmd("SENS:FUNC 'TEMP'")
-        return self.query("SENS:DATA:FRES?")[0]
+        return float(self.query("SENS:DATA:FRES?"))
 
     def measureVoltage(self):
 
         self.sendcmd("SENS:CHAN 2")
         self.sendcmd("SENS:FUNC 'VOLT:DC'")
-        return self.query("SENS:DATA:FRES?")[0]
+        return float(self.query("SENS:DATA:FRES?"))
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Driver for the Keithley 6221 AC/DC current source, with the 2182A nanovoltmeter
+connected to it (RS-232 and Trigger Link), and an acquisition engine for the
+measurement modes which the 6221 sequences by itself:
+
+    delta: the current alternates between high and low, every reading of the
+        2182A is combined with the previous ones (three-point delta), which
+        cancels thermoelectric offsets and their drift
+    differential conductance: a current staircase, with a small alternating
+        delta current on top, every reading is the voltage change dV
+    pulse delta: short current pulses, the voltage is measured during the
+        pulse and in between (low), minimising the heating of the sample
+
+The readings are stored in the buffer of the 6221, with the time since the
+measurement was armed. The engine reads the new readings in blocks, in one
+binary transfer each (FORM:DATA DREAL), and returns them as numpy arrays,
+no triggering from Python per point.
+
+Example usage:
+
+>>> source = Keithley6221(InstrumentAddress='GPIB0::12::INSTR')
+>>> engine = DeltaEngine(source, block=100)
+>>> engine.start('delta', high=1e-6, delay=0.002, count=10000)
+>>> while engine.running:
+...     block = engine.poll()       # None until a block is complete
+>>> engine.stop()
+
+Classes:
+    Keithley6221: the current source, configuration of the measurement modes
+    DeltaEngine: arms a measurement, streams its readings in blocks
+"""
+
+import threading, visa
+import time
+
+import logging
+import numpy as np
+
+import simulation
+import connection_pool
+import gpib_bus
+import instrumentation
+
+# create a logger object for this module
+logger = logging.getLogger(__name__)
+# added so that log messages show up in Jupyter notebooks
+logger.addHandler(logging.StreamHandler())
+
+try:
+    # the pyvisa manager we'll use to connect to the GPIB resources
+    resource_manager = visa.ResourceManager()
+except OSError:
+    logger.exception("\n\tCould not find the VISA library. Is the National Instruments VISA driver installed?\n\n")
+
+
+# SCPI subsystem of the measurement modes
+modes = dict(delta='DELT', dcon='DCON', pdelta='PDEL')
+
+
+class Keithley6221(object):
+
+    """
+    The Keithley 6221 is a current source, which can run delta,
+    differential conductance and pulse delta measurements together
+    with a 2182A nanovoltmeter. You can find the full specifications
+    in the reference manual.
+    """
+
+    # number of readings the buffer holds
+    buffer_max = 65536
+
+    def __init__(self, InstrumentAddress = 'GPIB0::12::INSTR'):
+        manager = simulation.resource_manager if simulation.is_simulated(InstrumentAddress) else resource_manager
+        # the pool reconnects the session if it dies, and reuses it when opened again
+        self._visa_resource = connection_pool.open_resource(InstrumentAddress, manager)
+        # shared with all instruments on the same bus, readings run at trigger priority
+        self.CommunicationLock = gpib_bus.bus_for(InstrumentAddress).device(InstrumentAddress,
+                                                                             priority=gpib_bus.TRIGGER)
+        self.device = self._visa_resource
+        # transactions are reported to instrumentation under this name
+        self.instrument_name = 'Keithley6221 {}'.format(InstrumentAddress)
+        self.binary = False
+
+    def query(self, command):
+        """Sends a query to the device, returns the answer (string)"""
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock,
+                                     len(command) + 1) as transaction:
+            answer = self.device.query(command)
+            transaction.received = len(answer)
+        return answer.strip()
+
+    def sendcmd(self, command):
+        """Sends a command to the device"""
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock(gpib_bus.SETPOINT),
+                                     len(command) + 1):
+            self.device.write(command)
+
+    def query_values(self, command):
+        """Sends a query, returns the answer (several values) as numpy array
+
+            in binary format (see setBinaryFormat) the block is parsed directly,
+            otherwise the comma separated values are
+        """
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock,
+                                     len(command) + 1) as transaction:
+            if self.binary:
+                values = np.asarray(self.device.query_binary_values(
+                    command, datatype='d', is_big_endian=False, container=np.array), dtype=float)
+                transaction.received = 8 * len(values) + len(str(8 * len(values))) + 3
+            else:
+                answer = self.device.query(command)
+                transaction.received = len(answer)
+                values = np.array([float(value) for value in answer.strip().split(',') if value], dtype=float)
+        return values
+
+    def reset(self):
+        """Resets the instrument to its default settings, clears the status"""
+        self.sendcmd('*RST')
+        self.sendcmd('*CLS')
+        self.binary = False
+
+    def setBinaryFormat(self, binary=True):
+        """Selects the format of the buffer readings: double precision binary
+        (little endian), or ASCII, always as pairs of reading and timestamp"""
+        self.sendcmd('FORM:ELEM READ,TST')
+        if binary:
+            self.sendcmd('FORM:DATA DRE')
+            self.sendcmd('FORM:BORD SWAP')
+        else:
+            self.sendcmd('FORM:DATA ASC')
+        self.binary = binary
+
+    def setCompliance(self, voltage):
+        """Sets the voltage compliance of the source (0.1 to 105 V)"""
+        if not 0.1 <= voltage <= 105:
+            raise AssertionError('Keithley6221: setCompliance: voltage must be within 0.1 and 105 V')
+        self.sendcmd('SOUR:CURR:COMP {:g}'.format(voltage))
+
+    def nanovoltmeterPresent(self):
+        """Returns whether the 2182A is connected and answers"""
+        return self.query('SOUR:DELT:NVPR?') == '1'
+
+    def configureDelta(self, high, low=None, delay=0.002, count=1000, compliance_abort=True):
+        """Configures a delta measurement
+
+        :param high: high current (A), up to 105 mA
+        :param low: low current (A), -high if None
+        :param delay: delay (s) between a current step and the reading (1e-3 to 9999.999)
+        :param count: number of delta readings (1 to buffer_max), None: until stopped
+        :param compliance_abort: stop when the source reaches its compliance
+        """
+        low = -high if low is None else low
+        for current in (high, low):
+            if abs(current) > 0.105:
+                raise AssertionError('Keithley6221: configureDelta: currents must be within +-105 mA')
+        if not 1e-3 <= delay <= 9999.999:
+            raise AssertionError('Keithley6221: configureDelta: delay must be within 1 ms and 9999.999 s')
+        if count is not None and not 1 <= count <= self.buffer_max:
+            raise AssertionError('Keithley6221: configureDelta: count must be within 1 and {}'.format(self.buffer_max))
+        self.sendcmd('SOUR:DELT:HIGH {:g}'.format(high))
+        self.sendcmd('SOUR:DELT:LOW {:g}'.format(low))
+        self.sendcmd('SOUR:DELT:DEL {:g}'.format(delay))
+        self.sendcmd('SOUR:DELT:COUN {}'.format('INF' if count is None else '{:d}'.format(count)))
+        self.sendcmd('SOUR:DELT:CAB {}'.format('ON' if compliance_abort else 'OFF'))
+        self._configureBuffer(count)
+
+    def configureDifferentialConductance(self, start, stop, step, delta, delay=0.002, compliance_abort=True):
+        """Configures a differential conductance measurement:
+        a current staircase from start to stop, with the alternating delta on top
+
+        :param start, stop, step: the staircase (A)
+        :param delta: amplitude of the alternating current (A)
+        :param delay: delay (s) between a current step and the reading
+        """
+        if step == 0 or (stop - start) / step < 0:
+            raise AssertionError('Keithley6221: configureDifferentialConductance: step does not lead to stop')
+        for current in (start, stop):
+            if abs(current) + abs(delta) > 0.105:
+                raise AssertionError('Keithley6221: configureDifferentialConductance: currents must be within +-105 mA')
+        if not 1e-3 <= delay <= 9999.999:
+            raise AssertionError('Keithley6221: configureDifferentialConductance: delay must be within 1 ms and 9999.999 s')
+        self.sendcmd('SOUR:DCON:STAR {:g}'.format(start))
+        self.sendcmd('SOUR:DCON:STOP {:g}'.format(stop))
+        self.sendcmd('SOUR:DCON:STEP {:g}'.format(step))
+        self.sendcmd('SOUR:DCON:DELT {:g}'.format(delta))
+        self.sendcmd('SOUR:DCON:DEL {:g}'.format(delay))
+        self.sendcmd('SOUR:DCON:CAB {}'.format('ON' if compliance_abort else 'OFF'))
+        self._configureBuffer(int(round((stop - start) / step)) + 1)
+
+    def configurePulseDelta(self, high, low=0., width=110e-6, source_delay=16e-6, count=1000,
+                            interval=5, low_measurements=2, compliance_abort=True):
+        """Configures a pulse delta measurement
+
+        :param high: pulse current (A)
+        :param low: current in between (A)
+        :param width: pulse width (s, 50e-6 to 12e-3)
+        :param source_delay: delay from the start of the pulse to the reading (s, 16e-6 to 11.966e-3)
+        :param count: number of pulse delta readings (1 to buffer_max), None: until stopped
+        :param interval: time from pulse to pulse, in power line cycles (5 to 999999)
+        :param low_measurements: readings of the low current per pulse (1 or 2)
+        """
+        if not 50e-6 <= width <= 12e-3:
+            raise AssertionError('Keithley6221: configurePulseDelta: width must be within 50 us and 12 ms')
+        if not 16e-6 <= source_delay < width:
+            raise AssertionError('Keithley6221: configurePulseDelta: source delay must be within 16 us and the width')
+        if low_measurements not in (1, 2):
+            raise AssertionError('Keithley6221: configurePulseDelta: low_measurements must be 1 or 2')
+        if count is not None and not 1 <= count <= self.buffer_max:
+            raise AssertionError('Keithley6221: configurePulseDelta: count must be within 1 and {}'.format(self.buffer_max))
+        self.sendcmd('SOUR:PDEL:HIGH {:g}'.format(high))
+        self.sendcmd('SOUR:PDEL:LOW {:g}'.format(low))
+        self.sendcmd('SOUR:PDEL:WIDT {:g}'.format(width))
+        self.sendcmd('SOUR:PDEL:SDEL {:g}'.format(source_delay))
+        self.sendcmd('SOUR:PDEL:COUN {}'.format('INF' if count is None else '{:d}'.format(count)))
+        self.sendcmd('SOUR:PDEL:INT {:d}'.format(int(interval)))
+        self.sendcmd('SOUR:PDEL:LME {:d}'.format(low_measurements))
+        self.sendcmd('SOUR:PDEL:SWE OFF')
+        self.sendcmd('SOUR:PDEL:RANG BEST')
+        self.sendcmd('SOUR:PDEL:CAB {}'.format('ON' if compliance_abort else 'OFF'))
+        self._configureBuffer(count)
+
+    def _configureBuffer(self, count):
+        """clear the buffer, sized for count readings (the whole buffer if None)"""
+        self.sendcmd('TRAC:CLE')
+        self.sendcmd('TRAC:POIN {:d}'.format(min(count or self.buffer_max, self.buffer_max)))
+
+    def arm(self, mode):
+        """Arms the configured measurement ('delta', 'dcon', 'pdelta')"""
+        self.sendcmd('SOUR:{}:ARM'.format(modes[mode]))
+
+    def isArmed(self, mode):
+        """Returns whether the measurement is armed (and not yet finished)"""
+        return self.query('SOUR:{}:ARM?'.format(modes[mode])) == '1'
+
+    def start(self):
+        """Starts the armed measurement"""
+        self.sendcmd('INIT:IMM')
+
+    def abort(self):
+        """Stops the measurement, the output is switched off"""
+        self.sendcmd('SOUR:SWE:ABOR')
+
+    def readingCount(self):
+        """Returns the number of readings in the buffer"""
+        return int(self.query('TRAC:POIN:ACT?'))
+
+    def fetch(self, start, count):
+        """Returns count readings from the buffer, beginning with reading start (from 0)
+
+        :return: numpy array of shape (count, 2): reading, time since arming (s)
+        """
+        values = self.query_values('TRAC:DATA:SEL? {:d},{:d}'.format(start, count))
+        return values.reshape(-1, 2)
+
+
+class DeltaEngine(object):
+    """Runs a delta, differential conductance or pulse delta measurement,
+    streams the readings from the buffer of the 6221 in blocks
+
+        poll returns a block once `block` new readings (or the last ones) are in the buffer:
+            dict of numpy arrays: timeseconds (time.time()), voltage (V),
+            current (A, the current of the reading), resistance (Ohm,
+            dV / dI for the differential conductance)
+
+        the buffer of the 6221 does not wrap around: in endless runs (count None),
+        once it is full, the measurement is aborted, the rest of the buffer is read,
+        and it is re-armed with an empty buffer (no readings are taken in between)
+    """
+
+    def __init__(self, source, block=100):
+        super(DeltaEngine, self).__init__()
+        self.source = source
+        self.block = block
+        self.running = False
+        self.mode = None
+        self.fetched = 0
+        # readings read from the current buffer
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def start(self, mode, **settings):
+        """configure, arm and start a measurement
+
+        :param mode: 'delta', 'dcon' or 'pdelta'
+        :param settings: as for configureDelta, configureDifferentialConductance, configurePulseDelta
+        """
+        if mode not in modes:
+            raise AssertionError('Keithley6221: DeltaEngine: unknown mode {}, available: {}'.format(
+                mode, ', '.join(modes)))
+        with self._lock:
+            if self.running:
+                self.source.abort()
+            self.source.setBinaryFormat(True)
+            configure = dict(delta=self.source.configureDelta,
+                             dcon=self.source.configureDifferentialConductance,
+                             pdelta=self.source.configurePulseDelta)[mode]
+            configure(**settings)
+            self.mode = mode
+            self.settings = dict(settings)
+            self.count = dict(delta=settings.get('count', 1000),
+                              pdelta=settings.get('count', 1000),
+                              dcon=int(round((settings.get('stop', 0.) - settings.get('start', 0.))
+                                             / settings.get('step', 1.))) + 1)[mode]
+            self.fetched = 0
+            self._buffered = 0
+            self.source.arm(mode)
+            self.source.start()
+            # instrument timestamps count from the arming
+            self.started = time.time()
+            self.running = True
+
+    def stop(self):
+        """abort the measurement"""
+        with self._lock:
+            if self.running:
+                self.source.abort()
+            self.running = False
+
+    def _rearm(self):
+        """start over with an empty buffer (endless runs), to be called with the lock held,
+            after the measurement was aborted and the buffer was read
+        """
+        self.source._configureBuffer(None)
+        self.source.arm(self.mode)
+        self.source.start()
+        self.started = time.time()
+        self._buffered = 0
+
+    def _currents(self, indices):
+        """source current of the readings with these indices, and the current step dI"""
+        settings = self.settings
+        if self.mode == 'dcon':
+            current = settings['start'] + settings['step'] * indices
+            # the alternation around the staircase spans twice the delta
+            return current, np.full(len(indices), 2. * settings['delta'])
+        high = settings['high']
+        if self.mode == 'delta':
+            low = settings.get('low', None)
+            low = -high if low is None else low
+            # the three-point delta is half the difference of the voltages at high and low
+            return np.full(len(indices), high), np.full(len(indices), (high - low) / 2.)
+        return np.full(len(indices), high), np.full(len(indices), high - settings.get('low', 0.))
+
+    def poll(self):
+        """fetch the next block of readings, if complete (or if the measurement ended)
+
+        :return: dict of numpy arrays (see class docstring), or None if no block is complete yet
+        """
+        with self._lock:
+            if not self.running:
+                return None
+            # armed first: once it is not, the count includes the last readings
+            armed = self.source.isArmed(self.mode)
+            available = min(self.source.readingCount(), self.source.buffer_max)
+            full = available >= self.source.buffer_max
+            if self.count is None:
+                # the 6221 stops with a full buffer, endless runs are re-armed below
+                finished = not armed and not full
+            else:
+                finished = not armed or available >= self.count
+            new = available - self._buffered
+            if new < self.block and not finished and not full:
+                return None
+            if finished:
+                self.running = False
+            readings = self.source.fetch(self._buffered, new) if new > 0 else np.empty((0, 2))
+            self._buffered += len(readings)
+            started = self.started
+            if full and self.running and self.count is None:
+                # nothing is added once aborted, the rest is read before the buffer is cleared
+                self.source.abort()
+                rest = self.source.readingCount() - self._buffered
+                if rest > 0:
+                    readings = np.concatenate((readings, self.source.fetch(self._buffered, rest)))
+                self._rearm()
+            indices = np.arange(self.fetched, self.fetched + len(readings))
+            self.fetched += len(readings)
+            if not len(readings):
+                return None
+        current, step = self._currents(indices)
+        voltage = readings[:, 0]
+        return dict(timeseconds=started + readings[:, 1],
+                    voltage=voltage,
+                    current=current,
+                    resistance=voltage / step)
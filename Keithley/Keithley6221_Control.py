@@ -0,0 +1,100 @@
+import numpy as np
+
+from PyQt5.QtCore import pyqtSignal, pyqtSlot
+
+from Keithley.Keithley6221 import Keithley6221
+from Keithley.Keithley6221 import DeltaEngine
+from pyvisa.errors import VisaIOError
+
+from copy import deepcopy
+
+# from util import AbstractThread
+from util import AbstractLoopThread
+
+
+class Keithley6221_Updater(AbstractLoopThread):
+    """This is the worker thread, which runs the delta, differential conductance
+        and pulse delta measurements of the Keithley 6221 (with the 2182A).
+
+        A measurement is started with startMeasurement (settings: mode and the
+        arguments of the configure method of the mode, see Keithley6221),
+        the 6221 sequences the readings itself. In regular intervals (method "running"),
+        the new readings are fetched from its buffer in blocks, and sent as
+        numpy arrays (dict of timeseconds, voltage, current, resistance) via sig_Blockdata.
+        A summary of the latest block is sent via sig_Infodata, the keys of which
+        are displayed in the "sensors" dict in this class.
+    """
+
+    sig_Infodata = pyqtSignal(dict)
+    sig_Blockdata = pyqtSignal(dict)
+    # sig_assertion = pyqtSignal(str)
+    sig_visaerror = pyqtSignal(str)
+    sig_visatimeout = pyqtSignal()
+    timeouterror = VisaIOError(-1073807339)
+
+    sensors = dict(
+        Resistance_Ohm=None,
+        Voltage_V=None,
+        Current_A=None,
+        Readings=0,
+        Running=0)
+
+    def __init__(self, InstrumentAddress='', **kwargs):
+        super().__init__(**kwargs)
+
+        self.Keithley6221 = Keithley6221(InstrumentAddress=InstrumentAddress)
+        self.engine = DeltaEngine(self.Keithley6221, block=100)
+        self.sensors = deepcopy(self.sensors)
+        # the blocks are fetched as soon as they are complete
+        self.interval = 0.2
+
+    def running(self):
+        """fetch the next block of readings, if complete, and emit it, emit the summary"""
+        try:
+            block = self.engine.poll()
+            if block is not None:
+                self.sig_Blockdata.emit(block)
+                self.sensors['Resistance_Ohm'] = float(np.mean(block['resistance']))
+                self.sensors['Voltage_V'] = float(np.mean(block['voltage']))
+                self.sensors['Current_A'] = float(block['current'][-1])
+            self.sensors['Readings'] = self.engine.fetched
+            self.sensors['Running'] = int(self.engine.running)
+
+            self.sig_Infodata.emit(deepcopy(self.sensors))
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            self.handle_visaerror(e_visa)
+
+    def handle_visaerror(self, e_visa):
+        if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+            self.sig_visatimeout.emit()
+        else:
+            self.sig_visaerror.emit(e_visa.args[0])
+
+    @pyqtSlot(dict)
+    def startMeasurement(self, settings):
+        """start a measurement, settings: mode ('delta', 'dcon', 'pdelta'),
+            and the arguments of the configure method of the mode"""
+        settings = dict(settings)
+        try:
+            self.engine.start(settings.pop('mode'), **settings)
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except (KeyError, TypeError) as e_settings:
+            self.sig_assertion.emit('Keithley6221: startMeasurement: invalid settings: {}'.format(e_settings))
+        except VisaIOError as e_visa:
+            self.handle_visaerror(e_visa)
+
+    @pyqtSlot()
+    def stopMeasurement(self):
+        """abort the running measurement"""
+        try:
+            self.engine.stop()
+        except VisaIOError as e_visa:
+            self.handle_visaerror(e_visa)
+
+    @pyqtSlot(int)
+    def setBlock(self, block):
+        """number of readings per block"""
+        self.engine.block = max(int(block), 1)
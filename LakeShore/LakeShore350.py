@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
 """
 Driver for the LakeShore 350 Cryogenic Temperature Controller
+
+The answers to all queries are typed according to response_schemas:
+single values are returned as int/float/str, several values as namedtuples
 """
 
 import threading, visa
 
 import logging
+from collections import namedtuple
+
+from visa import constants as vconst
+from pyvisa.errors import VisaIOError
+
+import simulation
+import connection_pool
+import gpib_bus
+import instrumentation
+
+from LakeShore.curve_files import Curve
+from LakeShore.curve_files import read_curve
 
 # create a logger object for this module
 logger = logging.getLogger(__name__)
@@ -18,15 +33,186 @@ try:
 except OSError:
     logger.exception("\n\tCould not find the VISA library. Is the National Instruments VISA driver installed?\n\n")
 
+def text(value):
+    """field type for strings, removes padding"""
+    return value.strip().strip('"').strip()
+
+
+# readings of all inputs, in case input 0 (all) was queried
+Readings = namedtuple('Readings', ['A', 'B', 'C', 'D'])
+# names of the inputs, D2 to D5 are added by the 3062 scanner option card
+INPUTS = ['A', 'B', 'C', 'D', 'D2', 'D3', 'D4', 'D5']
+_readings_types = {4: Readings}
+
+
+def readings_type(count):
+    """namedtuple for the readings of 'count' inputs, named as in INPUTS,
+        further inputs (if any) are named input_9, input_10, ...
+    """
+    if count not in _readings_types:
+        names = INPUTS[:count] + ['input_{}'.format(ct) for ct in range(len(INPUTS) + 1, count + 1)]
+        _readings_types[count] = namedtuple('Readings', names)
+    return _readings_types[count]
+
+# response schema of every query: mnemonic: list of (field name, type)
+# a single field is returned as a plain value, several fields as a namedtuple,
+# READINGS marks queries which return one value per input, if all inputs are queried
+READINGS = 'readings'
+response_schemas = {
+    '*ESE?': [('bit_weighting', int)],
+    '*ESR?': [('bit_weighting', int)],
+    '*OPC?': [('complete', int)],
+    '*IDN?': [('manufacturer', text), ('model', text), ('instrument_serial', text),
+              ('option_serial', text), ('firmware_version', text)],
+    '*SRE?': [('bit_weighting', int)],
+    '*STB?': [('bit_weighting', int)],
+    '*TST?': [('errors_found', int)],
+    'ALARM?': [('off_on', int), ('high_value', float), ('low_value', float), ('deadband', float),
+               ('latch_enable', int), ('audible', int), ('visible', int)],
+    'ALARMST?': [('high_state', int), ('low_state', int)],
+    'ANALOG?': [('input', int), ('units', int), ('high_value', float), ('low_value', float),
+                ('polarity', int)],
+    'AOUT?': [('output_percentage', float)],
+    'BRIGT?': [('contrast', int)],
+    'CRDG?': READINGS,
+    'CRVHDR?': [('name', text), ('serial', text), ('format', int), ('limit', float),
+                ('coefficient', int)],
+    'CRVPT?': [('units_value', float), ('temp_value', float)],
+    'DISPFLD?': [('input', int), ('units', int)],
+    'DISPLAY?': [('mode', int), ('num_fields', int), ('output_source', int)],
+    'FILTER?': [('off_on', int), ('points', int), ('window', int)],
+    'HTR?': [('heater_value', float)],
+    'HTRSET?': [('htr_resistance', int), ('max_current', int), ('max_user_current', float),
+                ('current_power', int)],
+    'HTRST?': [('error_code', int)],
+    'IEEE?': [('address', int)],
+    'INCRV?': [('curve_number', int)],
+    'INNAME?': [('name', text)],
+    'INTSEL?': [('interface', int)],
+    'INTYPE?': [('sensor_type', int), ('autorange', int), ('range', int), ('compensation', int),
+                ('units', int), ('sensor_excitation', int)],
+    'KRDG?': READINGS,
+    'LEDS?': [('off_on', int)],
+    'LOCK?': [('state', int), ('code', text)],
+    'MDAT?': [('min_value', float), ('max_value', float)],
+    'MODE?': [('mode', int)],
+    'MOUT?': [('value', float)],
+    'NET?': [('dhcp', int), ('auto_ip', int), ('ip', text), ('sub_mask', text), ('gateway', text),
+             ('pri_dns', text), ('sec_dns', text), ('pref_host', text), ('pref_domain', text),
+             ('description', text)],
+    'NETID?': [('lan_status', int), ('ip', text), ('sub_mask', text), ('gateway', text),
+               ('pri_dns', text), ('sec_dns', text), ('mac_addr', text), ('actual_hostname', text),
+               ('actual_domain', text)],
+    'OPST?': [('bit_weighting', int)],
+    'OPSTE?': [('bit_weighting', int)],
+    'OPSTR?': [('bit_weighting', int)],
+    'OUTMODE?': [('mode', int), ('input', int), ('powerup_enable', int)],
+    'PID?': [('p_value', float), ('i_value', float), ('d_value', float)],
+    'RAMP?': [('off_on', int), ('rate_value', float)],
+    'RAMPST?': [('ramp_status', int)],
+    'RANGE?': [('range', int)],
+    'RDGST?': [('bit_weighting', int)],
+    'RELAY?': [('mode', int), ('input_alarm', text), ('alarm_type', int)],
+    'RELAYST?': [('status', int)],
+    'SETP?': [('value', float)],
+    'SRDG?': READINGS,
+    'TEMP?': [('junction_temperature', float)],
+    'TLIMIT?': [('limit', float)],
+    'TUNEST?': [('tuning_status', int), ('output', int), ('error_status', int), ('stage_status', int)],
+    'WARMUP?': [('control', int), ('percentage', float)],
+    'WEBLOG?': [('username', text), ('password', text)],
+    'ZONE?': [('upper_boundary', float), ('p_value', float), ('i_value', float), ('d_value', float),
+              ('mout_value', float), ('range', int), ('input', int), ('rate', float)],
+}
+
+
+# bits of the Operational Status Register, see OperationalStatusEnableCommand
+OPST_bits = dict(COM=1, CAL=2, ATUNE=4, NRDG=8, RAMP1=16, RAMP2=32, OVLD=64, ALARM=128)
+# Operational Status summary bit in the Status Byte Register
+STB_OSB = 128
+
+timeouterror = VisaIOError(-1073807339)
+
+
+def valid_bit_weighting(bit_weighting, weighting_list):
+    """check whether bit_weighting is a sum of (distinct) elements of weighting_list"""
+    return isinstance(bit_weighting, int) and 0 <= bit_weighting and bit_weighting & ~sum(weighting_list) == 0
+
+
+def _compile_schema(mnemonic, schema):
+    """build the parser for one response schema, once, when the module is loaded
+
+        the parser takes the answer split on commas, returns the typed result
+    """
+    if schema == READINGS:
+        def parse(answer):
+            values = tuple(float(value) for value in answer)
+            if len(values) == 1:
+                return values[0]
+            return readings_type(len(values))(*values)
+        return parse
+    types = tuple(typ for __, typ in schema)
+    if len(schema) == 1:
+        typ = types[0]
+        return lambda answer: typ(answer[0])
+    result = namedtuple(mnemonic.strip('*?').title(), [name for name, __ in schema])
+    length = len(types)
+
+    def parse(answer):
+        if len(answer) != length:
+            raise ValueError('expected {} fields, got {}'.format(length, len(answer)))
+        return result(*[typ(value) for typ, value in zip(types, answer)])
+    return parse
+
+
+_parsers = {mnemonic: _compile_schema(mnemonic, schema) for mnemonic, schema in response_schemas.items()}
+
+
+def parse_answer(command, answer):
+    """convert the answer to a query into the types given by its response schema
+
+        answers to commands without a schema are returned as they are (list of strings)
+    """
+    mnemonic = command[:command.find('?') + 1].strip()
+    parser = _parsers.get(mnemonic, None)
+    if parser is None:
+        return answer
+    try:
+        return parser(answer)
+    except (ValueError, IndexError) as err:
+        raise AssertionError('LakeShore:{}: bad answer {}: {}'.format(mnemonic, answer, err))
+
+
 class LakeShore350(object):
+
+    # query methods which can be sent in batches, see batch: name of the method: command template
+    batch_queries = dict(
+        HeaterOutputQuery='HTR? {0:1d}',
+        ControlSetpointQuery='SETP? {0:1d}',
+        ControlSetpointRampParameterQuery='RAMP? {0:1d}',
+        OutputModeQuery='OUTMODE? {0:1d}',
+        KelvinReadingQuery='KRDG? {0:1}',
+        ControlLoopPIDValuesQuery='PID? {0:1d}',
+        HeaterRangeQuery='RANGE? {0:1d}',
+        SensorUnitsInputReadingQuery='SRDG? {0:1}')
+
+    # limits for a compound message: number of queries, number of characters
+    batch_max_queries = 6
+    batch_max_length = 64
+
     def __init__(self, InstrumentAddress = 'GPIB0::12::INSTR'):
 
 
 
-        self._visa_resource = resource_manager.open_resource(InstrumentAddress)
+        manager = simulation.resource_manager if simulation.is_simulated(InstrumentAddress) else resource_manager
+        # the pool reconnects the session if it dies, and reuses it when opened again
+        self._visa_resource = connection_pool.open_resource(InstrumentAddress, manager)
         # self._visa_resource.read_termination = '\r'
-        self.CommunicationLock = threading.Lock()
+        # shared with all instruments on the same bus, queries run at monitoring priority
+        self.CommunicationLock = gpib_bus.bus_for(InstrumentAddress).device(InstrumentAddress)
         self.device = self._visa_resource
+        # transactions are reported to instrumentation under this name
+        self.instrument_name = 'LakeShore350 {}'.format(InstrumentAddress)
 
 
     def query(self, command):
@@ -35,12 +221,15 @@ class LakeShore350(object):
         :param command: string generated by a given function, whom will be sent to the device
         :type command: str
 
-        :return: answer from the device
+        :return: answer from the device, typed according to its response schema
+            (see response_schemas), a list of strings if there is no schema
         """
-        with self.CommunicationLock:
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock,
+                                     len(command) + 1) as transaction:
             received = self.device.query(command)
+            transaction.received = len(received)
         # self.CommunicationLock.release()
-        return received.strip().split(',')
+        return parse_answer(command, received.strip().split(','))
 
     def go(self, command):
         """Sends commands as strings to the device 
@@ -49,11 +238,188 @@ class LakeShore350(object):
         :type command: str
 
         """
-        with self.CommunicationLock:
+        with instrumentation.measure(self.instrument_name, command, self.CommunicationLock(gpib_bus.SETPOINT),
+                                     len(command) + 1):
             self.device.write(command)
         # self.CommunicationLock.release()
         # return received.strip().split(',')
 
+    def _batch_chunks(self, commands):
+        """split the commands into chunks which fit into one compound message"""
+        chunk = []
+        for command in commands:
+            if chunk and (len(chunk) >= self.batch_max_queries or
+                          len(';'.join(chunk + [command])) > self.batch_max_length):
+                yield chunk
+                chunk = []
+            chunk.append(command)
+        if chunk:
+            yield chunk
+
+    def batch_query(self, commands):
+        """Sends several queries joined by ';' in as few transactions as possible,
+        and splits the combined answer back into the answers of the single queries
+
+        :param commands: list of query strings, e.g. ['KRDG? 0', 'HTR? 1']
+        :type commands: list
+
+        :return: list of the answers, typed according to their response schemas (as from query)
+        """
+        answers = []
+        for chunk in self._batch_chunks(commands):
+            message = ';'.join(chunk)
+            with instrumentation.measure(self.instrument_name, message, self.CommunicationLock,
+                                         len(message) + 1) as transaction:
+                received = self.device.query(message)
+                transaction.received = len(received)
+            replies = received.strip().split(';')
+            if len(replies) != len(chunk):
+                raise AssertionError('LakeShore:batch_query: expected {} answers to "{}", got: {}'.format(
+                    len(chunk), ';'.join(chunk), received))
+            answers.extend(parse_answer(command, reply.strip().split(','))
+                           for command, reply in zip(chunk, replies))
+        return answers
+
+    def batch(self, calls):
+        """Performs several query methods together, see batch_query
+
+        :param calls: list of (name, arguments) pairs, name being a key of batch_queries,
+            e.g. [('KelvinReadingQuery', (0,)), ('HeaterOutputQuery', (1,))]
+        :type calls: list
+
+        :return: list of the results, as returned by the query methods themselves
+        """
+        return self.batch_query([self.batch_queries[name].format(*args) for name, args in calls])
+
+    def enable_service_requests(self, events=('RAMP1', 'RAMP2', 'ALARM', 'NRDG')):
+        """Enables service requests (SRQ) for the given operational status events,
+        and the queue for SRQ events of the VISA session
+
+        :param events: names of operational status bits, see OPST_bits
+        :type events: list
+        """
+        self.OperationalStatusEnableCommand(sum(OPST_bits[event] for event in events))
+        self.ServiceRequestEnableRegisterCommand(STB_OSB)
+        # clear the events which were latched before
+        self.OperationalStatusRegisterQuery()
+        self.device.enable_event(vconst.EventType.service_request, vconst.EventMechanism.queue)
+
+    def disable_service_requests(self):
+        """Disables service requests, and the queue for SRQ events of the VISA session"""
+        self.device.disable_event(vconst.EventType.service_request, vconst.EventMechanism.queue)
+        self.ServiceRequestEnableRegisterCommand(0)
+
+    def wait_for_service_request(self, timeout=1000):
+        """Waits for a service request, without occupying the bus while waiting
+
+        :param timeout: time to wait, in ms
+        :type timeout: int
+
+        :return: the operational status bits which were latched (0 if no SRQ came within timeout),
+            see OPST_bits
+        """
+        try:
+            self.device.wait_on_event(vconst.EventType.service_request, timeout)
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(timeouterror) and e_visa.args == timeouterror.args:
+                return 0
+            raise
+        with instrumentation.measure(self.instrument_name, 'read_stb', self.CommunicationLock(gpib_bus.TRIGGER)):
+            # serial poll, resets the request
+            self.device.read_stb()
+        # reading the register clears it
+        return self.OperationalStatusRegisterQuery()
+
+    def batch_go(self, commands, sync_every=10, progress=None):
+        """Sends several commands joined by ';' in as few messages as possible, without waiting
+        for the device in between, and synchronises with *OPC? every sync_every messages
+
+        :param commands: list of command strings
+        :type commands: list
+        :param progress: called as progress(done, total) after every synchronisation
+        :type progress: function
+        """
+        done = 0
+        for count, chunk in enumerate(self._batch_chunks(commands)):
+            message = ';'.join(chunk)
+            with instrumentation.measure(self.instrument_name, message, self.CommunicationLock, len(message) + 1):
+                self.device.write(message)
+            done += len(chunk)
+            if (count + 1) % sync_every == 0 or done == len(commands):
+                self.OperationCompleteQuery()
+                if progress is not None:
+                    progress(done, len(commands))
+
+    def upload_curve(self, curve, data, verify=True, progress=None):
+        """Writes a whole calibration curve into a user curve
+
+        The curve is deleted first, then the header and all points are sent
+        in pipelined messages, and (if verify) all points are read back in batches.
+
+        :param curve: Specifies which user curve to write: 21-59.
+        :type curve: int
+        :param data: the curve, or the name of a .340 / .dat file (see curve_files)
+        :type data: Curve or str
+        :param verify: whether to read all points back and compare them
+        :type verify: bool
+        :param progress: called as progress(done, total), counting points written and verified
+        :type progress: function
+        """
+        if not 21 <= curve <= 59:
+            raise AssertionError("LakeShore:upload_curve: Curve parameter must be an integer in between 21 - 59.")
+        if isinstance(data, str):
+            data = read_curve(data)
+        header = data.header
+        if len(header['name']) > 15 or len(header['serial']) > 10:
+            raise AssertionError("LakeShore:upload_curve: name or serial number of the curve are too long (15 / 10 characters).")
+        total = len(data.points) * (2 if verify else 1)
+
+        commands = ['CRVDEL {0:d}'.format(curve),
+                    self._curve_header_string(curve, header['name'], header['serial'], header['format'],
+                                              header['limit'], header['coefficient'])]
+        commands += [self._curve_point_string(curve, index + 1, units, temperature)
+                     for index, (units, temperature) in enumerate(data.points)]
+        self.batch_go(commands, progress=None if progress is None else
+                      lambda done, __: progress(max(0, done - 2), total))
+        if not verify:
+            return
+        readback = self._read_curve_points(curve, len(data.points), progress=None if progress is None else
+                                           lambda done, __: progress(len(data.points) + done, total))
+        wrong = [index + 1 for index, (written, read) in enumerate(zip(data.points, readback))
+                 if not all(abs(a - b) <= 1e-5 * abs(a) + 1e-6 for a, b in zip(written, read))]
+        if wrong:
+            raise AssertionError("LakeShore:upload_curve: curve {}: points {} were not stored correctly.".format(curve, wrong))
+
+    def _read_curve_points(self, curve, number, progress=None):
+        """read the points 1 to number of a curve, in batches"""
+        points = []
+        commands = ['CRVPT? {0:d},{1:d}'.format(curve, index) for index in range(1, number + 1)]
+        step = self.batch_max_queries * 5
+        for start in range(0, len(commands), step):
+            points.extend(tuple(point) for point in self.batch_query(commands[start:start + step]))
+            if progress is not None:
+                progress(len(points), number)
+        return points
+
+    def download_curve(self, curve, progress=None):
+        """Reads a whole calibration curve, with its header, in batches
+
+        :param curve: Specifies which curve to read: 1-59.
+        :type curve: int
+        :param progress: called as progress(done, total) with the number of points read
+        :type progress: function
+
+        :return: Curve (see curve_files), to be written to a file with curve_files.write_curve
+        """
+        header = self.CurveHeaderQuery(curve)
+        points = self._read_curve_points(curve, 200, progress=progress)
+        # unused points are reported as zero
+        while points and points[-1] == (0., 0.):
+            points.pop()
+        return Curve(header=dict(name=header.name, serial=header.serial, format=header.format,
+                                 limit=header.limit, coefficient=header.coefficient),
+                     points=points)
+
     def ClearInterfaceCommand(self):
         """Clears the bits in the Status Register, Standard Event Status Register, and Operation Event Register,
         and terminates all pending operations. Clears the interface, but not the controller. The related
@@ -76,10 +442,7 @@ class LakeShore350(object):
         :type bit_weighting: int
         """
         weighting_list = [1,4,16,32,128]
-        sum_list = sum([map(list, combinations(weighting_list, i)) for i in range(len(weighting_list)+1)],[])
-        map_list = map(sum, sum_list) #creates list of all possible sums
-
-        if bit_weighting not in map_list:
+        if not valid_bit_weighting(bit_weighting, weighting_list):
             raise AssertionError("LakeShore:EventStatusEnableRegisterCommand: Bit_Weighting parameter must be a sum of elements of [0,1,4,16,32,128].")
 
         self.go('*ESE ' + '{0:3d}'.format(bit_weighting))
@@ -124,7 +487,7 @@ class LakeShore350(object):
 
         :return: 1
         """
-        return self.go('*OPC?')
+        return self.query('*OPC?')
 
     def ResetInstrumentCommand(self):
         """Sets controller parameters to power-up settings.
@@ -137,19 +500,16 @@ class LakeShore350(object):
         the sum of the bit weighting for each desired bit. Refer to section 6.2.6 for a list of status flags.
             Bit     Bit Weighting       Event Name
             4       16                  MAV
-            5       64                  ESB
+            5       32                  ESB
             7       128                 OSB
-            Total:  208
+            Total:  176
 
         :param bit_weighting: sum of the bit weighting for each desired bit
         :type bit_weighting: int
         """
-        weighting_list = [16,64,128]
-        sum_list = sum([map(list, combinations(weighting_list, i)) for i in range(len(weighting_list)+1)],[])
-        map_list = map(sum, sum_list) #creates list of all possible sums
-
-        if bit_weighting not in map_list:
-            raise AssertionError("LakeShore:ServiceRequestEnableRegisterCommand: Bit_Weighting parameter must be an Integer in [16,64,128].")
+        weighting_list = [16,32,128]
+        if not valid_bit_weighting(bit_weighting, weighting_list):
+            raise AssertionError("LakeShore:ServiceRequestEnableRegisterCommand: Bit_Weighting parameter must be a sum of elements of [0,16,32,128].")
 
         self.go('*SRE ' + '{0:3d}'.format(bit_weighting))
 
@@ -431,10 +791,10 @@ class LakeShore350(object):
         Example:
             CRVDEL 21[term] — deletes User Curve 21.
         """
-        if 21 > curve > 59:
+        if not 21 <= curve <= 59:
             raise AssertionError("LakeShore:CurveDeleteCommand: Curve parameter is not an integer in between 21 - 59.")
 
-        self.go('CRVDEL ' + '{0:2d}'.format(curve))
+        self.go('CRVDEL ' + '{0:d}'.format(curve))
 
     def CurveHeaderCommand(self, curve, name, sn, format_value, coefficient, limit_value = 375):
         """Configures the user curve header. The coefficient parameter will be calculated auto-
@@ -463,7 +823,7 @@ class LakeShore350(object):
             name of DT-470, serial number of 00011134, data format of volts versus kelvin, upper
             temperature limit of 325 K, and negative coefficient.
         """
-        if 21 > curve > 59:
+        if not 21 <= curve <= 59:
             raise AssertionError("LakeShore:CurveHeaderCommand: Curve parameter must be an integer in between 21 - 59.")
 
         if len(name) > 15:
@@ -472,7 +832,7 @@ class LakeShore350(object):
         if len(sn) > 10:
             raise AssertionError("LakeShore:CurveHeaderCommand: SN parameter must be a string with a maximum of 10 characters.")
 
-        if format not in [1,2,3,4]:
+        if format_value not in [1,2,3,4]:
             raise AssertionError("LakeShore:CurveHeaderCommand: Format_Value parameter must be an integer in [1,2,3,4].")
 
         if limit_value < 0:
@@ -481,7 +841,11 @@ class LakeShore350(object):
         if coefficient not in [1,2]:
             raise AssertionError("LakeShore:CurveHeaderCommand: Coefficient parameter must be an integer in [1,2].")
 
-        self.go('CRVHDR' + '{0:2d},{1:15},{2:10},{3:1d},{4:4.2f},{5:1d}'.format(curve, name, sn, format, limit_value, coefficient))
+        self.go(self._curve_header_string(curve, name, sn, format_value, limit_value, coefficient))
+
+    @staticmethod
+    def _curve_header_string(curve, name, sn, format_value, limit_value, coefficient):
+        return 'CRVHDR {0:d},{1},{2},{3:d},{4:.2f},{5:d}'.format(curve, name, sn, format_value, limit_value, coefficient)
 
     def CurveHeaderQuery(self, curve):
         """Refer to CurveHeaderCommand for description.
@@ -491,10 +855,10 @@ class LakeShore350(object):
 
         :return: ['<name>','<SN>','<format>','<limit value>','<coefficient>']
         """
-        if not isinstance(curve, int) or 1 > curve > 59:
+        if not isinstance(curve, int) or not 1 <= curve <= 59:
             raise AssertionError("LakeShore:CurveHeaderQuery: Curve parameter must be an integer in between 1 - 59.")
 
-        return self.query('CRVHDR?' + '{0:2d}'.format(curve))
+        return self.query('CRVHDR? ' + '{0:d}'.format(curve))
 
     def CurveDataPointCommand(self, curve, index, units_value, temp_value):
         """Configures a user curve data point.
@@ -511,11 +875,11 @@ class LakeShore350(object):
         Example:
             CRVPT 21,2,0.10191,470.000,N[term] — sets User Curve 21 second data point to 0.10191 sensor units and 470.000 K.
         """
-        if not 21> curve > 59:
+        if not 21 <= curve <= 59:
             raise AssertionError("LakeShore:CurveDataPointCommand: Curve parameter must be an integer in between 21 - 59.")
 
-        if not 1 > index > 200:
-            raise AssertionError("LakeShore:CurveDataPointCommand: Curve parameter must be an integer in between 1 - 200.")
+        if not 1 <= index <= 200:
+            raise AssertionError("LakeShore:CurveDataPointCommand: Index parameter must be an integer in between 1 - 200.")
 
         if not isinstance(units_value, float):## can be improved?
             raise AssertionError("LakeShore:CurveDataPointCommand: Units_Value parameter must be a float with up to 6 digits.")
@@ -523,7 +887,11 @@ class LakeShore350(object):
         if not isinstance(temp_value, float): ## can be improved?
             raise AssertionError("LakeShore:CurveDataPointCommand: Temp_Value parameter must be a float with up to 6 digits.")
 
-        self.go('CRVPT ' + '{0:2d}.{1:3d},{2:3.2f},{3:3.2f}'.format(curve, index, units_value, temp_value)) ## improve formatting?
+        self.go(self._curve_point_string(curve, index, units_value, temp_value))
+
+    @staticmethod
+    def _curve_point_string(curve, index, units_value, temp_value):
+        return 'CRVPT {0:d},{1:d},{2:.6g},{3:.6g}'.format(curve, index, units_value, temp_value)
 
     def CurveDataPointQuery(self, curve, index):
         """Returns a standard or user curve data point.
@@ -535,13 +903,13 @@ class LakeShore350(object):
 
         :return: ['<units value>','<temp value>']
         """
-        if 1 > curve > 59:
+        if not 1 <= curve <= 59:
             raise AssertionError("LakeShore:CurveDataPointQuery: Curve parameter must be an integer in between 1 - 59.")
 
-        if 1 > index > 200:
-            raise AssertionError("LakeShore:CurveDataPointQuery: Curve parameter must be an integer in between 1 - 200.")
+        if not 1 <= index <= 200:
+            raise AssertionError("LakeShore:CurveDataPointQuery: Index parameter must be an integer in between 1 - 200.")
 
-        return self.query('CRVPT? ' + '{0:2d},{1:3d}'.format(curve, index))
+        return self.query('CRVPT? ' + '{0:d},{1:d}'.format(curve, index))
 
     def FactoryDefaultsCommand(self):
         """Sets all configuration values to factory defaults and resets the instrument.
@@ -609,7 +977,7 @@ class LakeShore350(object):
         if 8 < field < 1:
             raise AssertionError("LakeShore:CustomModeDisplayFieldQuery: Field parameter must be an integer in between 1 - 8.")
 
-        return self.query('ISPFLD? ' + '{0:1d}'.format(field))
+        return self.query('DISPFLD? ' + '{0:1d}'.format(field))
 
     def DisplaySetupCommand(self, mode, num_fields = 2, output_source = 1):
         """The <num fields> and <displayed output> commands are ignored in all display modes except for Custom.
@@ -706,8 +1074,7 @@ class LakeShore350(object):
         if output not in [1,2]:
             raise AssertionError("LakeShore:HeaterOutputQuery: Output parameter must be an integer in [1,2].")
 
-        answer = self.query('HTR? ' + '{0:1d}'.format(output))
-        return float(answer[0].strip('+'))
+        return self.query('HTR? ' + '{0:1d}'.format(output))
 
     def HeaterSetupCommand(self, output, heater_resistance, max_current, max_usercurrent, current_or_power): ## set default value
         """
@@ -829,7 +1196,7 @@ class LakeShore350(object):
         if input_value not in ['A', 'B', 'C', 'D']:
             raise AssertionError("LakeShore:InputCurveNumberQuery: Input_Value Parameter must be a string in  ['A', 'B', 'C', 'D'].")
 
-        return self.query('INRCV? ' + '{0:1}'.format(input_value))
+        return self.query('INCRV? ' + '{0:1}'.format(input_value))
 
     def SensorInputNameCommand(self, input_value, name):
         """Be sure to use quotes when sending strings, otherwise characters such as spaces, and other
@@ -1020,12 +1387,7 @@ class LakeShore350(object):
         if input_value not in [0, 'A', 'B', 'C', 'D']:
             raise AssertionError("LakeShore:KelvinReadingQuery: Input_Value Parameter must be the integer 0 or a string in  ['A', 'B', 'C', 'D'].")
 
-        answer = self.query('KRDG? ' + '{0:1d}'.format(input_value)) ## necessary to implement if-else for A,B,C,D or 0?
-        try: 
-            answer = [float(x) for x in answer]
-        except TypeError as e: 
-            raise AssertionError('LakeShore:KelvinReadingQuery: {}'.format(e))
-        return answer
+        return self.query('KRDG? ' + '{0:1}'.format(input_value))
 
     def FrontPanelLEDSCommand(self, check_state):
         """If set to 0, front panel LEDs will not be functional. Function can be used when display brightness is a problem.
@@ -1265,11 +1627,8 @@ class LakeShore350(object):
         :type input_value: int
         """
         weighting_list = [1,2,4,8,16,32,64,128]
-        sum_list = sum([map(list, combinations(weighting_list, i)) for i in range(len(weighting_list)+1)],[])
-        map_list = map(sum, sum_list) #creates list of all possible sums
-
-        if bit_weighting not in map_list:
-            raise AssertionError("LakeShore:EventStatusEnableRegisterCommand: Bit_Weighting parameter must be a sum of elements of [0,1,2,4,8,16,32,64,128].")
+        if not valid_bit_weighting(input_value, weighting_list):
+            raise AssertionError("LakeShore:OperationalStatusEnableCommand: Bit_Weighting parameter must be a sum of elements of [0,1,2,4,8,16,32,64,128].")
 
         self.go('OPSTE ' + '{0:3d}'.format(input_value))
 
@@ -1429,8 +1788,7 @@ class LakeShore350(object):
         if 1 > output > 4:
             raise AssertionError("LakeShore:ControlSetpointRampParameterQuery: Output parameter must be an integer in [1,2,3,4].")
 
-        answer = self.query('RAMP? ' + '{0:1d}'.format(output))
-        return [answer[0], float(answer[1])]
+        return self.query('RAMP? ' + '{0:1d}'.format(output))
 
     def ControlSetpointRampStatusQuery(self, output):
         """Refer to ControlSetpointRampParameterCommand for description.
@@ -1648,9 +2006,7 @@ class LakeShore350(object):
         if 1 > output > 4:
             raise AssertionError("LakeShore:ControlSetpointQuery: Output parameter must be an integer in [1,2,3,4].")
 
-        answer = self.query('SETP? ' + '{0:1d}'.format(output))
-
-        return float(answer[0])
+        return self.query('SETP? ' + '{0:1d}'.format(output))
 
     def SensorUnitsInputReadingQuery(self, input_value):
         """Returns the sensor input reading for a single input or all input. <input_value> specifies
@@ -1711,7 +2067,7 @@ class LakeShore350(object):
         if input_value not in ['A', 'B', 'C', 'D']:
             raise AssertionError("LakeShore:TemperatureLimitQuery: Input_Value Parameter must be a string in  ['A', 'B', 'C', 'D'].")
 
-        return self.query('LIMIT? ' + '{0:1}'.format(input_value))
+        return self.query('TLIMIT? ' + '{0:1}'.format(input_value))
 
     def ControlTuningStatusQuery(self):
         """If initial conditions are not met when starting the autotune procedure, causing the
@@ -1732,7 +2088,7 @@ class LakeShore350(object):
                                     If tuning error occurred, stage status represents stage 
                                     that failed.
         """
-        return self.query('UNEST?')
+        return self.query('TUNEST?')
 
     def WarmupSupplyParameterCommand(self, output, control, percentage):
         """The Output Mode parameter and the Control Input Parameter must be configured
@@ -1759,7 +2115,7 @@ class LakeShore350(object):
         if 100. < percentage < 0.:
             raise AssertionError("LakeShore:WarmupSupplyParameterCommand: Percentage parameter must be a float in between 0 - 100")
 
-        self.go('WARUMP ' + '{0:1d},{1:2d},{2:3.2f}'.format(output, control, percentage))
+        self.go('WARMUP ' + '{0:1d},{1:2d},{2:3.2f}'.format(output, control, percentage))
 
     def WarmupSupplyParameterQuery(self, output):
         """Refer to WarmupSupplyParameterCommand for description.
@@ -1772,7 +2128,7 @@ class LakeShore350(object):
         if 4 < output < 3:
             raise AssertionError("LakeShore:WarmupSupplyParameterQuery: Output parameter must be an integer in [3,4]")
 
-        return self.query('WARUMP? ' + '{0:1d}'.format(output))
+        return self.query('WARMUP? ' + '{0:1d}'.format(output))
 
     def WebsiteLoginParameters(self, username, password):
         """Strings can be sent with or without quotation marks, but to send a string that con-
@@ -1,9 +1,10 @@
-# import time
+import time
 
 from PyQt5.QtCore import pyqtSignal, pyqtSlot
 from PyQt5.QtCore import QTimer
 
 from LakeShore.LakeShore350 import LakeShore350
+from LakeShore.LakeShore350 import OPST_bits
 from pyvisa.errors import VisaIOError
 
 from copy import deepcopy
@@ -52,6 +53,26 @@ class LakeShore350_Updater(AbstractLoopThread):
         Sensor_4_Ohm = None,
         OutputMode = None)
 
+    # time (seconds) for which the reply to a query is reused,
+    # for parameters which only change when we set them (the setters invalidate them)
+    # queries not listed are sent in every cycle, but only once per cycle
+    cache_ttl = dict(
+        ControlLoopPIDValuesQuery = 60,
+        HeaterRangeQuery = 60,
+        ControlSetpointRampParameterQuery = 30,
+        OutputModeQuery = 60)
+
+    # all queries of one cycle, sent in batches, as (name, arguments)
+    cycle_queries = [
+        ('HeaterOutputQuery', (1,)),
+        ('ControlSetpointQuery', (1,)),
+        ('ControlSetpointRampParameterQuery', (1,)),
+        ('OutputModeQuery', (1,)),
+        ('KelvinReadingQuery', (0,)),
+        ('ControlLoopPIDValuesQuery', (1,)),
+        ('HeaterRangeQuery', (1,)),
+        ('SensorUnitsInputReadingQuery', (0,))]
+
     def __init__(self, InstrumentAddress='', **kwargs):
         super().__init__(**kwargs)
 
@@ -64,6 +85,9 @@ class LakeShore350_Updater(AbstractLoopThread):
             return
             # need to quit the THREAD!!
 
+        self._cache = dict()
+        self._cycle_memo = dict()
+
         self.Temp_K_value = 3
 #       self.Heater_mW_value = 0
         self.Ramp_Rate_value = 0
@@ -95,10 +119,51 @@ class LakeShore350_Updater(AbstractLoopThread):
       # self.__isRunning = True
 
     def initiating_PID(self):
-        temp_list0 = self.LakeShore350.ControlLoopPIDValuesQuery(1)
-        self.LoopP_value = temp_list0[0]
-        self.LoopI_value = temp_list0[1]
-        self.LoopD_value = temp_list0[2]
+        pid = self.LakeShore350.ControlLoopPIDValuesQuery(1)
+        self.LoopP_value = pid.p_value
+        self.LoopI_value = pid.i_value
+        self.LoopD_value = pid.d_value
+
+    def cached_query(self, name, *args):
+        """send the query 'name' of the driver with args, or reuse its reply
+
+            a reply is reused within the same cycle,
+            and for queries listed in self.cache_ttl, as long as it is younger than the ttl
+        """
+        key = (name,) + args
+        if key in self._cycle_memo:
+            return self._cycle_memo[key]
+        stamp, value = self._cache.get(key, (None, None))
+        if stamp is None or time.time() - stamp >= self.cache_ttl.get(name, 0):
+            value = getattr(self.LakeShore350, name)(*args)
+            self._cache[key] = (time.time(), value)
+        self._cycle_memo[key] = value
+        return value
+
+    def prefetch(self, calls):
+        """send all of the queries 'calls' which are not cached in one batch,
+            store the replies for cached_query
+
+            calls: list of (name, arguments) pairs
+        """
+        now = time.time()
+        missing = []
+        for name, args in calls:
+            key = (name,) + args
+            stamp, __ = self._cache.get(key, (None, None))
+            if key not in self._cycle_memo and (stamp is None or now - stamp >= self.cache_ttl.get(name, 0)):
+                missing.append((name, args))
+        if not missing:
+            return
+        for (name, args), value in zip(missing, self.LakeShore350.batch(missing)):
+            self._cache[(name,) + args] = (now, value)
+            self._cycle_memo[(name,) + args] = value
+
+    def invalidate_cache(self, *names):
+        """drop the cached replies of the queries 'names', of all queries if none are given"""
+        for key in list(self._cache):
+            if not names or key[0] in names:
+                del self._cache[key]
 
     # @control_checks
     def running(self):
@@ -111,28 +176,33 @@ class LakeShore350_Updater(AbstractLoopThread):
 
         """
         try:
-            self.sensors['Heater_Output_percentage'] = self.LakeShore350.HeaterOutputQuery(1)
+            self._cycle_memo = dict()
+            # everything which is due is read in one or two bus transactions
+            self.prefetch(self.cycle_queries)
+            self.sensors['Heater_Output_percentage'] = self.cached_query('HeaterOutputQuery', 1)
             self.sensors['Heater_Output_mW'] = (self.sensors['Heater_Output_percentage']/100)*994.5
-            self.sensors['Temp_K'] = self.LakeShore350.ControlSetpointQuery(1)
-            self.sensors['Ramp_Rate_Status'] = self.LakeShore350.ControlSetpointRampParameterQuery(1)[0]
-            self.sensors['Ramp_Rate'] = self.LakeShore350.ControlSetpointRampParameterQuery(1)[1]
-            self.sensors['Input_Sensor'] = self.LakeShore350.OutputModeQuery(1)[1]
-            temp_list = self.LakeShore350.KelvinReadingQuery(0)
-            self.sensors['Sensor_1_K'] = temp_list[0]
-            self.sensors['Sensor_2_K'] = temp_list[1]
-            self.sensors['Sensor_3_K'] = temp_list[2]
-            self.sensors['Sensor_4_K'] = temp_list[3]
-            temp_list2 = self.LakeShore350.ControlLoopPIDValuesQuery(1)
-            self.sensors['Loop_P_Param'] = temp_list2[0]
-            self.sensors['Loop_I_Param'] = temp_list2[1]
-            self.sensors['Loop_D_Param'] = temp_list2[2]
-            self.sensors['Heater_Range'] = self.LakeShore350.HeaterRangeQuery(1)[0]
-            temp_list3 = self.LakeShore350.SensorUnitsInputReadingQuery(0)
-            self.sensors['Sensor_1_Ohm'] = temp_list3[0]
-            self.sensors['Sensor_2_Ohm'] = temp_list3[1]
-            self.sensors['Sensor_3_Ohm'] = temp_list3[2]
-            self.sensors['Sensor_4_Ohm'] = temp_list3[3]
-            self.sensors['OutputMode'] = self.LakeShore350.OutputModeQuery(1)[1]
+            self.sensors['Temp_K'] = self.cached_query('ControlSetpointQuery', 1)
+            ramp = self.cached_query('ControlSetpointRampParameterQuery', 1)
+            self.sensors['Ramp_Rate_Status'] = ramp.off_on
+            self.sensors['Ramp_Rate'] = ramp.rate_value
+            outmode = self.cached_query('OutputModeQuery', 1)
+            self.sensors['Input_Sensor'] = outmode.input
+            self.sensors['OutputMode'] = outmode.mode
+            temp_list = self.cached_query('KelvinReadingQuery', 0)
+            self.sensors['Sensor_1_K'] = temp_list.A
+            self.sensors['Sensor_2_K'] = temp_list.B
+            self.sensors['Sensor_3_K'] = temp_list.C
+            self.sensors['Sensor_4_K'] = temp_list.D
+            pid = self.cached_query('ControlLoopPIDValuesQuery', 1)
+            self.sensors['Loop_P_Param'] = pid.p_value
+            self.sensors['Loop_I_Param'] = pid.i_value
+            self.sensors['Loop_D_Param'] = pid.d_value
+            self.sensors['Heater_Range'] = self.cached_query('HeaterRangeQuery', 1)
+            temp_list3 = self.cached_query('SensorUnitsInputReadingQuery', 0)
+            self.sensors['Sensor_1_Ohm'] = temp_list3.A
+            self.sensors['Sensor_2_Ohm'] = temp_list3.B
+            self.sensors['Sensor_3_Ohm'] = temp_list3.C
+            self.sensors['Sensor_4_Ohm'] = temp_list3.D
 
             self.sig_Infodata.emit(deepcopy(self.sensors))
 
@@ -199,6 +269,7 @@ class LakeShore350_Updater(AbstractLoopThread):
     def setRamp_Rate_K(self):
         try:
             self.LakeShore350.ControlSetpointRampParameterCommand(1,1,self.Ramp_Rate_value)
+            self.invalidate_cache('ControlSetpointRampParameterQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -214,6 +285,7 @@ class LakeShore350_Updater(AbstractLoopThread):
         """
         try:
             self.LakeShore350.OutputModeCommand(1,1,self.Input_value,1)
+            self.invalidate_cache('OutputModeQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -227,6 +299,7 @@ class LakeShore350_Updater(AbstractLoopThread):
     def setLoopP_Param(self):
         try:
             self.LakeShore350.ControlLoopPIDValuesCommand(1, self.LoopP_value, self.sensors['Loop_I_Param'], self.sensors['Loop_D_Param'])
+            self.invalidate_cache('ControlLoopPIDValuesQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -239,6 +312,7 @@ class LakeShore350_Updater(AbstractLoopThread):
     def setLoopI_Param(self):
         try:
             self.LakeShore350.ControlLoopPIDValuesCommand(1, self.sensors['Loop_P_Param'], self.LoopI_value, self.sensors['Loop_D_Param'])
+            self.invalidate_cache('ControlLoopPIDValuesQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -251,6 +325,7 @@ class LakeShore350_Updater(AbstractLoopThread):
     def setLoopD_Param(self):
         try:
             self.LakeShore350.ControlLoopPIDValuesCommand(1, self.sensors['Loop_P_Param'], self.sensors['Loop_I_Param'], self.LoopD_value)
+            self.invalidate_cache('ControlLoopPIDValuesQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -265,6 +340,7 @@ class LakeShore350_Updater(AbstractLoopThread):
         """
         try:
             self.LakeShore.OutputModeCommand(1,1,self.sensor_values[5],1)
+            self.invalidate_cache('OutputModeQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -280,6 +356,7 @@ class LakeShore350_Updater(AbstractLoopThread):
         """
         try:
             self.LakeShore350.HeaterRangeCommand(1, self.Heater_Range_value)
+            self.invalidate_cache('HeaterRangeQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -293,6 +370,7 @@ class LakeShore350_Updater(AbstractLoopThread):
 
         try:
             self.LakeShore350.ControlLoopZoneTableParameterCommand(1, 1, self.Upper_Bound_value, self.ZoneP_value, self.ZoneI_value, self.ZoneD_value, self.Mout_value, self.Zone_Range_value, 1, self.Zone_Rate_value)
+            self.invalidate_cache('ControlLoopPIDValuesQuery', 'HeaterRangeQuery')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -356,3 +434,54 @@ class LakeShore350_Updater(AbstractLoopThread):
 #    def gettoset_Heater_Range(self,value):
 #       self.Heater_Range_value = value
 
+
+
+class LakeShore350_Events(AbstractLoopThread):
+    """Thread waiting for service requests (SRQ) of the LakeShore350
+
+        The device raises a service request if a setpoint ramp is done,
+        or an alarm is triggered (and for every new reading, if 'NRDG'
+        is added to the events, which costs a serial poll per reading).
+        This thread waits for these requests (without occupying the bus),
+        and emits the corresponding signals right away, so nobody needs
+        to poll the device for them.
+
+        LakeShore350: the driver instance (shared with the LakeShore350_Updater)
+    """
+
+    sig_ramp_done = pyqtSignal(int)
+    sig_alarm = pyqtSignal()
+    sig_new_reading = pyqtSignal()
+    sig_event = pyqtSignal(int)
+    sig_visaerror = pyqtSignal(str)
+
+    def __init__(self, LakeShore350, events=('RAMP1', 'RAMP2', 'ALARM'), **kwargs):
+        super().__init__(**kwargs)
+        self.LakeShore350 = LakeShore350
+        self.events = events
+        self.enabled = False
+        # waiting time (ms) per loop, the thread can only be stopped in between
+        self.wait_timeout = 1000
+        self.interval = 0
+
+    def running(self):
+        """wait for a service request, emit the signals for the events which occurred"""
+        try:
+            if not self.enabled:
+                self.LakeShore350.enable_service_requests(self.events)
+                self.enabled = True
+            bits = self.LakeShore350.wait_for_service_request(self.wait_timeout)
+        except VisaIOError as e_visa:
+            self.sig_visaerror.emit(e_visa.args[0])
+            return
+        if not bits:
+            return
+        self.sig_event.emit(bits)
+        if bits & OPST_bits['RAMP1']:
+            self.sig_ramp_done.emit(1)
+        if bits & OPST_bits['RAMP2']:
+            self.sig_ramp_done.emit(2)
+        if bits & OPST_bits['ALARM']:
+            self.sig_alarm.emit()
+        if bits & OPST_bits['NRDG']:
+            self.sig_new_reading.emit()
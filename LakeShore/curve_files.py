@@ -0,0 +1,109 @@
+"""Module to read and write calibration curves of temperature sensors
+
+Two file formats are understood:
+    .340: the LakeShore curve format, a header followed by a table of breakpoints
+            Sensor Model:   CX-1050-SD
+            Serial Number:  X12345
+            Data Format:    4      (Log Ohms/Kelvin)
+            SetPoint Limit: 325.0      (Kelvin)
+            Temperature coefficient:  1 (Negative)
+            Number of Breakpoints:   104
+
+            No.   Units      Temperature (K)
+
+              1  1.70333       325.0
+              ...
+
+    .dat: plain columns, either 'units temperature' or 'index units temperature',
+        lines which do not consist of numbers (e.g. a header) are skipped,
+        the header values can be given to read_curve
+
+Functions:
+    read_curve: read a curve from a file
+    write_curve: write a curve to a file in .340 format
+
+Classes:
+    Curve: namedtuple of the header (dict) and the points (list of (units, temperature))
+"""
+
+import os
+from collections import namedtuple
+
+
+Curve = namedtuple('Curve', ['header', 'points'])
+
+# header keys, as used by LakeShore350.CurveHeaderCommand
+# name: sensor model, serial: serial number, format: 1 = mV/K, 2 = V/K, 3 = Ohm/K, 4 = log Ohm/K
+# limit: setpoint limit in K, coefficient: 1 = negative, 2 = positive
+_header_340 = {'sensor model': 'name',
+               'serial number': 'serial',
+               'data format': 'format',
+               'setpoint limit': 'limit',
+               'temperature coefficient': 'coefficient'}
+_header_types = dict(name=str, serial=str, format=int, limit=float, coefficient=int)
+
+
+def _numbers(line):
+    """the numbers in a line, None if it contains anything else"""
+    try:
+        return [float(value) for value in line.replace(',', ' ').split()]
+    except ValueError:
+        return None
+
+
+def read_curve(filename, **header):
+    """read a calibration curve from a .340 or .dat file
+
+        header: values for the header, overriding the ones in the file
+            (a .dat file does not have any)
+
+        returns:
+            Curve
+    """
+    fileheader = dict(name=os.path.splitext(os.path.basename(filename))[0][:15],
+                      serial='', format=3, limit=375., coefficient=1)
+    points = []
+    with open(filename, 'r') as handle:
+        for line in handle:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                key = key.strip().lower()
+                if key in _header_340:
+                    name = _header_340[key]
+                    value = value.split()[0] if value.split() else ''
+                    fileheader[name] = _header_types[name](float(value) if _header_types[name] is int else value)
+                continue
+            numbers = _numbers(line)
+            if not numbers:
+                continue
+            if len(numbers) == 2:
+                points.append((numbers[0], numbers[1]))
+            elif len(numbers) == 3:
+                points.append((numbers[1], numbers[2]))
+            else:
+                raise AssertionError('curve_files: {}: cannot read line: {}'.format(filename, line.strip()))
+    fileheader.update(header)
+    if not points:
+        raise AssertionError('curve_files: {}: no curve points found'.format(filename))
+    if len(points) > 200:
+        raise AssertionError('curve_files: {}: {} points, the LakeShore350 takes 200 at most'.format(
+            filename, len(points)))
+    return Curve(header=fileheader, points=points)
+
+
+def write_curve(filename, curve):
+    """write a calibration curve to a file, in .340 format"""
+    formats = {1: 'mV/K', 2: 'V/K', 3: 'Ohms/K', 4: 'Log Ohms/Kelvin'}
+    coefficients = {1: 'Negative', 2: 'Positive'}
+    with open(filename, 'w') as handle:
+        handle.write('Sensor Model:   {}\n'.format(curve.header['name']))
+        handle.write('Serial Number:  {}\n'.format(curve.header['serial']))
+        handle.write('Data Format:    {}      ({})\n'.format(
+            curve.header['format'], formats.get(curve.header['format'], '')))
+        handle.write('SetPoint Limit: {}      (Kelvin)\n'.format(curve.header['limit']))
+        handle.write('Temperature coefficient:  {} ({})\n'.format(
+            curve.header['coefficient'], coefficients.get(curve.header['coefficient'], '')))
+        handle.write('Number of Breakpoints:   {}\n\n'.format(len(curve.points)))
+        handle.write('No.   Units      Temperature (K)\n\n')
+        for index, (units, temperature) in enumerate(curve.points):
+            handle.write('{:3d}  {:.6g}       {:.6g}\n'.format(index + 1, units, temperature))
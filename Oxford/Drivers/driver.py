@@ -1,9 +1,17 @@
 import threading
 import logging
 import time
+import asyncio
+from collections import defaultdict
+from collections import deque
 import visa
 from pyvisa.errors import VisaIOError
 
+import simulation
+import connection_pool
+import instrumentation
+from async_io import AsyncResource
+
 # from PyQt5.QtCore import pyqtSignal
 # from PyQt5.QtCore import pyqtSlot
 
@@ -35,23 +43,264 @@ from visa import constants as vconst
 #     return wrapper_do_check
 
 
+class ArbitrationLock(object):
+    """lock which is granted in the order of the requests (first come, first served)
+
+        used for a serial line which is shared by several instruments,
+        so that none of them is starved by the others
+    """
+
+    def __init__(self):
+        super(ArbitrationLock, self).__init__()
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._locked = False
+
+    def acquire(self, blocking=True):
+        with self._condition:
+            if not blocking:
+                # only if free, and nobody is waiting for it
+                if self._locked or self._queue:
+                    return False
+                self._locked = True
+                return True
+            ticket = object()
+            self._queue.append(ticket)
+            while self._locked or self._queue[0] is not ticket:
+                self._condition.wait()
+            self._queue.popleft()
+            self._locked = True
+        return True
+
+    def release(self):
+        with self._condition:
+            self._locked = False
+            self._condition.notify_all()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdaptiveTimeout(object):
+    """reply timeouts, adapted to the measured latency per command
+
+        the timeout of a command is a high percentile of its last `window`
+        latencies, times `factor`, plus `margin`, within [minimum, fallback]
+        the conservative `fallback` is used as long as fewer than `samples_min`
+        latencies are known, and after `failures_max` timeouts in a row,
+        until the next reply arrives
+
+        all times in ms, as the visa timeout
+    """
+
+    def __init__(self, fallback=500, minimum=30, percentile=0.99, factor=1.5, margin=20,
+                 window=200, samples_min=20, failures_max=3):
+        super(AdaptiveTimeout, self).__init__()
+        self.fallback = fallback
+        self.minimum = minimum
+        self.percentile = percentile
+        self.factor = factor
+        self.margin = margin
+        self.samples_min = samples_min
+        self.failures_max = failures_max
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._failures = defaultdict(int)
+        self._timeouts = dict()
+
+    @staticmethod
+    def key(command):
+        """commands are told apart by their letter, not by their arguments ('R1', 'R7' -> 'R')"""
+        return command.lstrip('$')[:1]
+
+    def timeout(self, command):
+        """the timeout for the reply to command, in ms"""
+        key = self.key(command)
+        with self._lock:
+            if self._failures[key] >= self.failures_max:
+                return self.fallback
+            return self._timeouts.get(key, self.fallback)
+
+    def success(self, command, latency):
+        """register a reply, which arrived after latency (in s)"""
+        key = self.key(command)
+        with self._lock:
+            latencies = self._latencies[key]
+            latencies.append(latency * 1e3)
+            self._failures[key] = 0
+            if len(latencies) >= self.samples_min:
+                ordered = sorted(latencies)
+                high = ordered[min(int(self.percentile * len(ordered)), len(ordered) - 1)]
+                self._timeouts[key] = int(min(max(high * self.factor + self.margin, self.minimum),
+                                              self.fallback))
+
+    def failure(self, command):
+        """register a timeout"""
+        with self._lock:
+            self._failures[self.key(command)] += 1
+
+    def get_statistics(self):
+        """per command letter: number of latencies, their percentile, the timeout and the failures in a row"""
+        with self._lock:
+            statistics = dict()
+            for key, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                statistics[key] = dict(samples=len(ordered),
+                                       percentile=ordered[min(int(self.percentile * len(ordered)),
+                                                              len(ordered) - 1)] if ordered else None,
+                                       timeout=self._timeouts.get(key, self.fallback),
+                                       failures=self._failures[key])
+            return statistics
+
+
+class IsobusTransport(object):
+    """one serial port, shared by all instruments daisy-chained on it (ISOBUS)
+
+        transports are shared by port address, see get, the port is
+        configured by the first instrument and closed by the last one
+    """
+    _transports = dict()
+    _transports_lock = threading.Lock()
+
+    def __init__(self, port):
+        super(IsobusTransport, self).__init__()
+        self.port = port
+        manager = simulation.resource_manager if simulation.is_simulated(port) else resource_manager
+        # the pool reconnects the session if it dies, and reuses it when opened again
+        self.resource = connection_pool.open_resource(port, manager)
+        self.lock = ArbitrationLock()
+        self.users = 0
+
+    @classmethod
+    def get(cls, port):
+        """the transport of a port, opened on first use"""
+        with cls._transports_lock:
+            if port not in cls._transports:
+                cls._transports[port] = cls(port)
+            transport = cls._transports[port]
+            transport.users += 1
+            return transport
+
+    def close(self):
+        """close the port, once the last instrument on it closed it"""
+        with self._transports_lock:
+            self.users -= 1
+            if self.users <= 0:
+                del self._transports[self.port]
+                self.resource.close()
+
+
 class AbstractSerialDeviceDriver(object):
-    """Abstract Device driver class"""
+    """Abstract Device driver class
+
+        Communication is paced: between the end of one transaction and the start
+        of the next one, at least self.delay seconds pass. Only the remaining part
+        of this gap is waited for, right before the next transaction, so an idle
+        link does not cost any time.
+        The gap is tuned to the link: it is increased multiplicatively after every
+        error (timeout, empty or garbage reply), and decreased slowly after a number
+        of successful transactions in a row, within [delay_min, delay_max].
+
+        query_checked retries a query until a valid reply arrives, for at most
+        retry_attempts attempts, resynchronising the buffer and backing off
+        exponentially in between. Retries, garbage replies and timeouts are
+        counted per command, see get_counters.
+
+        Several instruments can share one serial port (ISOBUS): with an address
+        like 'ASRL6::INSTR@2', the instrument with ISOBUS address 2 on port
+        ASRL6::INSTR is used. All instruments on a port share one transport,
+        and get the line in the order of their requests, every command is
+        prefixed with the ISOBUS address ('@2R1', '$@2T5').
+
+        The reply timeout is adapted per command to the measured latencies
+        (see AdaptiveTimeout), so that a lost reply costs tens of milliseconds
+        instead of the conservative timeout, see get_timeouts.
+        A reply arriving after its timeout is waited for at most one adapted
+        timeout, if it arrives even later, it is recognised by its command
+        letter and discarded.
+
+        Every transaction is reported to instrumentation (latency, wait for
+        the ComLock, bytes, errors), under the name instrument_name.
+
+        query, write, query_checked and clear_buffers have asynchronous
+        versions (query_async, ...), coroutines for the event loop shared by
+        all instruments (see async_io), which do not block it while waiting.
+    """
     timeouterror = VisaIOError(-1073807339)
+    # commands whose replies do not start with the command letter ('V': version string)
+    unechoed = ('V',)
 
     def __init__(self, InstrumentAddress):
         super(AbstractSerialDeviceDriver, self).__init__()
-        self._visa_resource = resource_manager.open_resource(InstrumentAddress)
+        self.instrument_name = '{} {}'.format(type(self).__name__, InstrumentAddress)
+        port, isobus, number = InstrumentAddress.partition('@')
+        if isobus:
+            self._transport = IsobusTransport.get(port)
+            self._visa_resource = self._transport.resource
+            self._isobus = '@{:d}'.format(int(number))
+        else:
+            self._transport = None
+            self._isobus = ''
+            manager = simulation.resource_manager if simulation.is_simulated(InstrumentAddress) else resource_manager
+            # the pool reconnects the session if it dies, and reuses it when opened again
+            self._visa_resource = connection_pool.open_resource(InstrumentAddress, manager)
         # self._visa_resource.query_delay = 0.
-        self._visa_resource.timeout = 500
+        self.timeouts = AdaptiveTimeout(fallback=500)
+        # time (ms) to wait for a late reply after a timeout of the fallback
+        # (after an adapted timeout: as long as the timeout, see _drain_time)
+        self.drain_timeout = 20
+        self._visa_resource.timeout = self.timeouts.fallback
         self._visa_resource.read_termination = '\r'
         self._visa_resource.write_termination = '\r'
         self._visa_resource.baud_rate = 9600
         self._visa_resource.data_bits = 8
         self._visa_resource.stop_bits = vconst.StopBits.two
         self._visa_resource.parity = vconst.Parity.none
-        self.ComLock = threading.Lock()
+        self.ComLock = self._transport.lock if self._transport else threading.Lock()
+
+        # pacing: current gap between transactions, and its bounds
         self.delay = 0.0
+        self.delay_min = 0.0
+        self.delay_max = 0.5
+        # gap after the first error, if the gap was zero
+        self.delay_step = 0.01
+        # factors applied to the gap after errors / after a row of successes
+        self.pacing_increase = 2.
+        self.pacing_decrease = 0.9
+        self.pacing_successes = 20
+        self._successes = 0
+        self._last_transaction = 0.
+
+        # retries: number of attempts, waiting time before the first retry (doubled every time)
+        self.retry_attempts = 5
+        self.retry_backoff = 0.05
+        self.counters = defaultdict(lambda: dict(retries=0, garbage=0, timeouts=0))
+
+    def _wait_gap(self):
+        """wait for the remaining part of the gap since the last transaction
+            (to be called with the ComLock held)
+        """
+        remaining = self._remaining_gap()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _remaining_gap(self):
+        return self._last_transaction + self.delay - time.monotonic()
+
+    def pacing_error(self):
+        """register a failed transaction: widen the gap"""
+        self._successes = 0
+        self.delay = min(max(self.delay * self.pacing_increase, self.delay_step), self.delay_max)
+
+    def pacing_success(self):
+        """register a successful transaction: narrow the gap after enough successes in a row"""
+        self._successes += 1
+        if self._successes >= self.pacing_successes:
+            self._successes = 0
+            self.delay = max(self.delay * self.pacing_decrease, self.delay_min)
 
     # def res_open(self):
     #     self._visa_resource = resource_manager.open_resource(InstrumentAddress)
@@ -61,16 +310,54 @@ class AbstractSerialDeviceDriver(object):
     #     self._visa_resource.write_termination = '\r'
 
     def res_close(self):
-        self._visa_resource.close()
+        if self._transport:
+            self._transport.close()
+        else:
+            self._visa_resource.close()
+
+    def _address(self, command):
+        """prefix the command with the ISOBUS address, if any ('$' stays in front)"""
+        if not self._isobus:
+            return command
+        if command.startswith('$'):
+            return '$' + self._isobus + command[1:]
+        return self._isobus + command
 
     def write(self, command):
         """
             low-level communication wrapper for visa.write with Communication Lock,
             to prevent multiple writes to serial adapter
         """
+        requested = time.monotonic()
         with self.ComLock:
-            self._visa_resource.write(command)
-            time.sleep(self.delay)
+            self._write(command, requested)
+
+    def _write(self, command, requested=None):
+        """paced write, to be called with the ComLock held
+            (for sequences of writes which must not be interleaved with other commands)
+
+            requested: when the ComLock was requested, for the instrumentation
+        """
+        waited = time.monotonic() - requested if requested else 0.
+        self._wait_gap()
+        started = time.monotonic()
+        error = None
+        try:
+            self._visa_resource.write(self._address(command))
+        except VisaIOError as e_visa:
+            error = e_visa
+            raise
+        finally:
+            self._last_transaction = time.monotonic()
+            instrumentation.record(self.instrument_name, command, self._last_transaction - started,
+                                   waited, len(command) + 1, 0, error)
+
+    async def write_async(self, command):
+        """write as a coroutine, for the shared event loop (see async_io)"""
+        requested = time.monotonic()
+        async with AsyncResource.get(self._visa_resource).locked(self.ComLock):
+            await asyncio.sleep(max(self._remaining_gap(), 0.))
+            self._write(command, requested)
 
     # @do_check
 
@@ -78,12 +365,178 @@ class AbstractSerialDeviceDriver(object):
         """
             low-level communication wrapper for visa.query with Communication Lock,
             to prevent multiple writes to serial adapter
+
+            timeouts, empty replies and replies starting with '?'
+            (command not understood) count as errors for the pacing
         """
+        requested = time.monotonic()
         with self.ComLock:
-            answer = self._visa_resource.query(command)
-            time.sleep(self.delay)
+            waited = time.monotonic() - requested
+            self._wait_gap()
+            self._set_timeout(self.timeouts.timeout(command))
+            started = time.monotonic()
+            try:
+                answer = self._visa_resource.query(self._address(command))
+                while self._stale(command, answer):
+                    # the late reply to an earlier command, the own reply follows
+                    answer = self._visa_resource.read()
+            except VisaIOError as e_visa:
+                self._query_failed(command, e_visa, started, waited)
+                if self.is_timeout(e_visa):
+                    # the reply might still arrive (the adapted timeout is short), it must
+                    # not be taken as the reply to the next query: wait for it at most one
+                    # adapted timeout, later ones are recognised by their command letter
+                    self._clear_buffers(self._drain_time(self._visa_resource.timeout))
+                raise
+            self._query_done(command, started)
+        self._query_pacing(command, answer, started, waited)
         return answer
 
+    async def query_async(self, command):
+        """query as a coroutine, for the shared event loop (see async_transport)
+
+            the loop is not blocked while waiting for the ComLock, the gap or the reply
+        """
+        io = AsyncResource.get(self._visa_resource)
+        requested = time.monotonic()
+        async with io.locked(self.ComLock):
+            waited = time.monotonic() - requested
+            await asyncio.sleep(max(self._remaining_gap(), 0.))
+            timeout = self.timeouts.timeout(command)
+            started = time.monotonic()
+            try:
+                io.write(self._address(command))
+                answer = await io.read(timeout)
+                while self._stale(command, answer):
+                    answer = await io.read(timeout)
+            except VisaIOError as e_visa:
+                self._query_failed(command, e_visa, started, waited)
+                if self.is_timeout(e_visa):
+                    await io.drain(self._drain_time(timeout))
+                    self._last_transaction = time.monotonic()
+                raise
+            self._query_done(command, started)
+        self._query_pacing(command, answer, started, waited)
+        return answer
+
+    def _query_failed(self, command, e_visa, started, waited):
+        """bookkeeping of a failed query (to be called with the ComLock held)"""
+        self._last_transaction = time.monotonic()
+        if self.is_timeout(e_visa):
+            self.timeouts.failure(command)
+        self.pacing_error()
+        instrumentation.record(self.instrument_name, command, self._last_transaction - started,
+                               waited, len(command) + 1, 0, 'timeout' if self.is_timeout(e_visa) else e_visa)
+
+    def _query_done(self, command, started):
+        """bookkeeping of a reply (to be called with the ComLock held)"""
+        self._last_transaction = time.monotonic()
+        self.timeouts.success(command, self._last_transaction - started)
+
+    def _query_pacing(self, command, answer, started, waited):
+        """pacing and instrumentation after a reply: empty and '?' replies count as errors"""
+        if not answer or answer[0] == '?':
+            self.pacing_error()
+        else:
+            self.pacing_success()
+        instrumentation.record(self.instrument_name, command, self._last_transaction - started, waited,
+                               len(command) + 1, len(answer) + 1,
+                               None if answer and answer[0] != '?' else 'garbage')
+
+    def _drain_time(self, timeout):
+        """how long (ms) to wait for a late reply, after a timeout of timeout ms"""
+        return max(timeout, self.drain_timeout) if timeout < self.timeouts.fallback else self.drain_timeout
+
+    def _stale(self, command, answer):
+        """whether the answer is the reply to another command: replies echo the command letter
+            (except for those in self.unechoed), '?' and empty replies are errors, not stale
+        """
+        letter = AdaptiveTimeout.key(command)
+        if not answer or answer[0] == '?' or letter in self.unechoed or command.startswith('$'):
+            return False
+        return answer[0] != letter
+
+    def _set_timeout(self, timeout):
+        """set the visa timeout (in ms), if it changed (to be called with the ComLock held)"""
+        if self._visa_resource.timeout != timeout:
+            self._visa_resource.timeout = timeout
+
+    def get_timeouts(self):
+        """return the adapted timeouts and latency statistics per command letter, see AdaptiveTimeout"""
+        return self.timeouts.get_statistics()
+
+    def is_timeout(self, e_visa):
+        """check whether a VisaIOError is a timeout"""
+        return type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args
+
+    def query_checked(self, command, check=lambda answer: True):
+        """
+            query with a bounded number of retries
+
+            a reply is valid if it is not empty and check(reply) is True,
+            before every retry the buffer is cleared, to resynchronise
+            with the device, after a waiting time which doubles every time
+
+            returns:
+                the first valid reply
+            raises:
+                AssertionError if no valid reply arrived within self.retry_attempts
+        """
+        counters = self.counters[command]
+        for attempt in range(self.retry_attempts):
+            if attempt:
+                counters['retries'] += 1
+                time.sleep(self.retry_backoff * 2**(attempt - 1))
+                self.clear_buffers()
+            try:
+                answer = self.query(command)
+            except VisaIOError as e_visa:
+                if not self.is_timeout(e_visa):
+                    raise
+                counters['timeouts'] += 1
+                continue
+            if not answer:
+                counters['garbage'] += 1
+                continue
+            if not check(answer):
+                # garbage reply, the link is driven too fast
+                counters['garbage'] += 1
+                self.pacing_error()
+                continue
+            return answer
+        raise AssertionError('{}: query {}: no valid reply after {} attempts'.format(
+            type(self).__name__, command, self.retry_attempts))
+
+    async def query_checked_async(self, command, check=lambda answer: True):
+        """query_checked as a coroutine, for the shared event loop (see async_io)"""
+        counters = self.counters[command]
+        for attempt in range(self.retry_attempts):
+            if attempt:
+                counters['retries'] += 1
+                await asyncio.sleep(self.retry_backoff * 2**(attempt - 1))
+                await self.clear_buffers_async()
+            try:
+                answer = await self.query_async(command)
+            except VisaIOError as e_visa:
+                if not self.is_timeout(e_visa):
+                    raise
+                counters['timeouts'] += 1
+                continue
+            if not answer:
+                counters['garbage'] += 1
+                continue
+            if not check(answer):
+                counters['garbage'] += 1
+                self.pacing_error()
+                continue
+            return answer
+        raise AssertionError('{}: query {}: no valid reply after {} attempts'.format(
+            type(self).__name__, command, self.retry_attempts))
+
+    def get_counters(self):
+        """return a copy of the per-command counters of retries, garbage replies and timeouts"""
+        return {command: dict(counters) for command, counters in self.counters.items()}
+
     # def query(self, command):
     #     answer = self.query_wrap(command)
     #     # error handling for itc503
@@ -93,18 +546,34 @@ class AbstractSerialDeviceDriver(object):
     #     return answer
 
     def read(self):
-        with self.ComLock:
-            answer = self._visa_resource.read()
-            # time.sleep(self.delay)
+        with instrumentation.measure(self.instrument_name, 'read', self.ComLock) as transaction:
+            try:
+                answer = self._visa_resource.read()
+            finally:
+                self._last_transaction = time.monotonic()
+            transaction.received = len(answer) + 1
         return answer
 
     def clear_buffers(self):
-        self._visa_resource.timeout = 5
+        # under the lock, the timeout of a shared port must not change under other instruments
+        with self.ComLock:
+            self._clear_buffers()
+
+    async def clear_buffers_async(self, timeout=5):
+        """clear_buffers as a coroutine, for the shared event loop (see async_io)"""
+        io = AsyncResource.get(self._visa_resource)
+        async with io.locked(self.ComLock):
+            await io.drain(timeout)
+            self._last_transaction = time.monotonic()
+
+    def _clear_buffers(self, timeout=5):
+        """read and discard whatever arrives within timeout (ms), to be called with the ComLock held"""
+        self._visa_resource.timeout = timeout
         try:
-            self.read()
+            self._visa_resource.read()
         except VisaIOError as e_visa:
-            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
-                pass
-            else:
+            if not self.is_timeout(e_visa):
                 raise e_visa
-        self._visa_resource.timeout = 500
+        finally:
+            self._visa_resource.timeout = self.timeouts.fallback
+            self._last_transaction = time.monotonic()
@@ -44,38 +44,25 @@ class ilm211(AbstractSerialDeviceDriver):
         Args:
             variable: Index of variable to read.
         """
-        if not isinstance(variable, int):
-            raise AssertionError('ILM: getValue: Argument must be integer')
-        if variable not in range(0,11):
-            raise AssertionError('ILM: getValue: Argument is not a valid number.')
-
         # self.clear_buffers()
 
-        value = self.query('R{}'.format(variable))
-        # value = self._visa_resource.read()
-
-        if value == "" or None:
-            # raise AssertionError('ILM: getValue: bad reply: empty string')
-            # print('ILM: Assertion: empty')
-            try:
-                self.read()
-            except VisaIOError as e_visa:
-                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
-                    pass
-            return self.getValue(variable)
-            # return None
-        if value[0] != 'R':
-            # raise AssertionError('ILM: getValue: bad reply: {}'.format(value))
-            # print('ILM: Assertion: {}'.format(value))
-            try:
-                self.read()
-            except VisaIOError as e_visa:
-                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
-                    pass
-            return self.getValue(variable)
+        # retried until the reply echoes the command, AssertionError otherwise
+        value = self.query_checked(self._valueCommand(variable), check=lambda answer: answer[0] == 'R')
+        return float(value.strip('R+'))
 
+    async def getValue_async(self, variable=2):
+        """getValue as a coroutine, for the shared event loop"""
+        value = await self.query_checked_async(self._valueCommand(variable), check=lambda answer: answer[0] == 'R')
         return float(value.strip('R+'))
 
+    @staticmethod
+    def _valueCommand(variable):
+        if not isinstance(variable, int):
+            raise AssertionError('ILM: getValue: Argument must be integer')
+        if variable not in range(0,11):
+            raise AssertionError('ILM: getValue: Argument is not a valid number.')
+        return 'R{}'.format(variable)
+
     def _converting_status_channel(self, i):
         i = int(i)
         if i == 0:
@@ -14,7 +14,6 @@ Classes:
     ips120: a class for interfacing with a IPS 120-10 magnet power supply
 
 """
-from datetime import datetime
 import time
 import logging
 
@@ -103,14 +102,24 @@ class ips120(AbstractSerialDeviceDriver):
         Args:
             variable: Index of variable to read.
         """
+        value = self.query(self._valueCommand(variable))
+        # value = self._visa_resource.read()
+        return self._value(value)
+
+    async def getValue_async(self, variable=0):
+        """getValue as a coroutine, for the shared event loop"""
+        return self._value(await self.query_async(self._valueCommand(variable)))
+
+    @staticmethod
+    def _valueCommand(variable):
         if not isinstance(variable, int):
             raise AssertionError('IPS: getValue: argument must be integer')
         if variable not in range(0,23):
             raise AssertionError('IPS: getValue: Argument is not a valid number.')
+        return 'R{}'.format(variable)
 
-        value = self.query('R{}'.format(variable))
-        # value = self._visa_resource.read()
-
+    @staticmethod
+    def _value(value):
         if value == "" or None:
             raise AssertionError('IPS: getValue: bad reply: empty string')
         if value[0] != 'R':
@@ -118,8 +127,14 @@ class ips120(AbstractSerialDeviceDriver):
         return float(value.strip('R+'))
 
     def getStatus(self):
-        value =  self.query('X')
+        return self._status(self.query('X'))
+
+    async def getStatus_async(self):
+        """getStatus as a coroutine, for the shared event loop"""
+        return self._status(await self.query_async('X'))
 
+    @staticmethod
+    def _status(value):
         if value == "" or None:
             raise AssertionError('IPS: getValue: bad reply: empty string')
         if value[0] != 'X':
@@ -264,10 +279,9 @@ class ips120(AbstractSerialDeviceDriver):
             (bool): whether the field set point was reached
         """
 
-        start_time = datetime.now()
-        stop_time = start_time + datetime.timedelta(seconds=timeout)
+        stop_time = time.monotonic() + timeout
 
-        while datetime.now() < stop_time:
+        while time.monotonic() < stop_time:
             field = self.readField()
             set_point = self.readFieldSetpoint()
 
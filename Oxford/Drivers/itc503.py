@@ -43,14 +43,21 @@ except OSError:
 class itc503(AbstractSerialDeviceDriver):
     """class for interfacing with a ITC 503 temperature controller"""
 
+    # parameters of a sweep step, in the order of their y pointers
+    sweep_parameter_names = ('set_point', 'sweep_time', 'hold_time')
+
 
     def __init__(self, **kwargs):
         super(itc503, self).__init__(**kwargs)
 
         # set the heater voltage limit to be controlled dynamically according to the temperature
         # self.write('$M0')
+        # starting gap between transactions, adapted to the link from here on
         self.delay = 0.06
 
+        # the sweep table as last uploaded: {step: {parameter: setting}}
+        self._sweep_table = {}
+
         # self.setControl() # done in thread
 
 
@@ -103,43 +110,47 @@ class itc503(AbstractSerialDeviceDriver):
         Args:
             variable: Index of variable to read.
         """
+        ### clear any buffer by reading, ignoring all timeout errors
+        # self.clear_buffers()
+        # retrieve value
+        # retried until the reply echoes the command, AssertionError otherwise
+        value = self.query_checked(self._valueCommand(variable), check=lambda answer: answer[0] == 'R')
+        return float(value.strip('R+'))
+
+    async def getValue_async(self, variable=0):
+        """getValue as a coroutine, for the shared event loop"""
+        value = await self.query_checked_async(self._valueCommand(variable), check=lambda answer: answer[0] == 'R')
+        return float(value.strip('R+'))
+
+    @staticmethod
+    def _valueCommand(variable):
         if not isinstance(variable, int):
             raise AssertionError('ITC: getValue: argument must be integer')
         if variable not in range(0,11):
             raise AssertionError('ITC: getValue: Argument is not a valid number.')
+        return 'R{}'.format(variable)
 
-        ### clear any buffer by reading, ignoring all timeout errors
-        # self.clear_buffers()
-        # retrieve value
-        value = self.query('R{}'.format(variable))
-        # value = self._visa_resource.read()
+    def getSweepStatus(self):
+        """Read the sweep status from the status string (XnAnCnSnnHnLn)
 
-        if value == "" or None:
-            # raise AssertionError('ITC: getValue: bad reply: empty string')
-            # print('ITC: Assertion: empty')
-            try:
-                self.read()
-            except VisaIOError as e_visa:
-                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
-                    pass
-            return self.getValue(variable)
-            # return None
-        if value[0] != 'R':
-            # raise AssertionError('ITC: getValue: bad reply: {}'.format(value))
-            # print('ITC: Assertion: {}'.format(value))
-            try:
-                self.read()
-            except VisaIOError as e_visa:
-                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
-                    pass
-            return self.getValue(variable)
-            # return None
-        # if value[0] == 'T':
-        #     print('ITC: Assertion: T')
-        #     self.read()
-        #     value = self.getValue(variable)
+        Returns:
+            0 if no sweep is running, otherwise 2x-1 while sweeping
+            to step x, 2x while holding at step x
+        """
+        return self._sweepStatus(self.query_checked('X', check=self._checkStatus))
 
-        return float(value.strip('R+'))
+    async def getSweepStatus_async(self):
+        """getSweepStatus as a coroutine, for the shared event loop"""
+        return self._sweepStatus(await self.query_checked_async('X', check=self._checkStatus))
+
+    @staticmethod
+    def _checkStatus(answer):
+        return answer[0] == 'X' and 'S' in answer
+
+    @staticmethod
+    def _sweepStatus(value):
+        position = value.index('S')
+        return int(value[position + 1:position + 3])
 
     def setProportional(self, prop=0):
         """Sets the proportional band.
@@ -231,7 +242,11 @@ class itc503(AbstractSerialDeviceDriver):
         The 16th step will nevertheless control the temperature setpoint after
         the sweep is completed, it should thus NOT be set to 0,
         because this would actually set the temperature setpoint to 0.
-        Therefore all non-used steps have a low but reachable set point in T(K)
+        Therefore the 16th step, if unused, has a low but reachable set point in T(K),
+        the set points of the other unused steps do not matter and are left as they are.
+
+        Only the parameters which differ from the last uploaded table are sent,
+        see uploadSweepTable.
 
         Args:
             sweep_parameters: A dictionary whose keys are the step
@@ -241,60 +256,165 @@ class itc503(AbstractSerialDeviceDriver):
         """
         if not isinstance(sweep_parameters, dict):
             raise AssertionError('ITC: setSweeps: Input should be a dict (of dicts)!')
-        steps = range(1,17)
-        parameters_keys = sweep_parameters.keys()
-        null_parameter = {  'set_point' : 5,
-                            'sweep_time': 0,
-                            'hold_time' : 0  }
-
-        for step in steps:
-            if step in parameters_keys:
-                self._setSweepStep(step, sweep_parameters[step])
+        table = {}
+        for step in range(1, 17):
+            if step in sweep_parameters:
+                table[step] = sweep_parameters[step]
             else:
-                self._setSweepStep(step, null_parameter)
+                table[step] = {'set_point': 5 if step == 16 else None,
+                               'sweep_time': 0,
+                               'hold_time': 0}
+        self.uploadSweepTable(table)
+
+    def setSweepProgram(self, program):
+        """Compiles a temperature program (see compileSweepProgram)
+            and uploads it as the sweep table, sending only what changed
+        """
+        self.uploadSweepTable(self.compileSweepProgram(program))
 
-    def _setSweepStep(self, sweep_step, sweep_table):
-        """Sets the parameters for a sweep step.
+    @staticmethod
+    def compileSweepProgram(program):
+        """Compiles a temperature program into a full sweep table
 
-        This sets the step pointer (x) to the proper step.
-        Then this sets the step parameters (y1, y2, y3) to
-        the values dictated by the sweep_table. Finally, this
-        resets the x and y pointers to 0.
+        Consecutive ramps in the same direction with the same rate and
+        without a hold in between are merged into one step. A segment
+        which does not change the temperature becomes a pure hold step.
+        The unused steps are bypassed (sweep and hold time 0), their
+        set points are left as they are, except for the 16th step,
+        which keeps the final temperature after the sweep has ended.
 
         Args:
-            sweep_step: The sweep step to be modified (values: 1-16)
-            sweep_table: A dictionary of parameters describing the
-                sweep. Keys: set_point, sweep_time, hold_time.
+            program: list of segments, each a tuple
+                (start temperature or None, target temperature in K,
+                 rate in K/min, hold time at the target in min).
+                The start temperature is only needed for the first segment,
+                for the others it is the target of the previous segment.
+
+        Returns:
+            sweep table: dict of steps 1-16, each a dict of set_point,
+                sweep_time, hold_time (see uploadSweepTable)
         """
-        self.ComLock.acquire()
-        step_setting = '$x{}'.format(sweep_step)
-        self._visa_resource.write(step_setting)
+        if not program:
+            raise AssertionError('ITC: compileSweepProgram: the program is empty!')
+        steps = []
+        previous = program[0][0]
+        if previous is None:
+            raise AssertionError('ITC: compileSweepProgram: the first segment needs a start temperature!')
+        merge = None
+        for start, target, rate, hold in program:
+            if start is not None:
+                previous = start
+            if target == previous:
+                if steps and steps[-1][0] == target:
+                    # extend the hold of the last step
+                    steps[-1][2] += hold
+                else:
+                    steps.append([target, 0., hold])
+                merge = None
+                continue
+            if rate <= 0:
+                raise AssertionError('ITC: compileSweepProgram: the rate must be positive!')
+            direction = target > previous
+            sweep_time = abs(target - previous) / rate
+            if merge == (rate, direction):
+                # continue the ramp of the last step
+                steps[-1][0] = target
+                steps[-1][1] += sweep_time
+                steps[-1][2] = hold
+            else:
+                steps.append([target, sweep_time, hold])
+            merge = (rate, direction) if hold == 0 else None
+            previous = target
+        if len(steps) > 16:
+            raise AssertionError('ITC: compileSweepProgram: the program needs {} steps, the table has 16!'.format(len(steps)))
+
+        table = {}
+        for step in range(1, 17):
+            if step <= len(steps):
+                set_point, sweep_time, hold_time = steps[step - 1]
+                table[step] = {'set_point': set_point,
+                               'sweep_time': round(sweep_time, 1),
+                               'hold_time': round(hold_time, 1)}
+            else:
+                table[step] = {'set_point': steps[-1][0] if step == 16 else None,
+                               'sweep_time': 0,
+                               'hold_time': 0}
+        return table
 
-        setpoint_setting = '$s{}'.format(
-                            sweep_table['set_point'])
-        sweeptime_setting = '$s{}'.format(
-                            sweep_table['sweep_time'])
-        holdtime_setting = '$s{}'.format(
-                            sweep_table['hold_time'])
+    def uploadSweepTable(self, sweep_table):
+        """Uploads a sweep table, sending only the parameters which changed
 
-        self._visa_resource.write('$y1')
-        self._visa_resource.write(setpoint_setting)
+        The last uploaded table is cached, parameters which already hold the
+        requested value are not written again. A parameter set to None is
+        left as it is. The ComLock is held for one step at a time only,
+        so that monitoring is not stalled during the upload.
 
-        self._visa_resource.write('$y2')
-        self._visa_resource.write(sweeptime_setting)
+        Args:
+            sweep_table: A dictionary whose keys are the step
+                numbers (keys: 1-16). The value of each key is a
+                dictionary whose keys are the parameters in the
+                sweep table (see _setSweepStep).
 
-        self._visa_resource.write('$y3')
-        self._visa_resource.write(holdtime_setting)
+        Returns:
+            number of parameters written
+        """
+        written = 0
+        for step in sorted(sweep_table):
+            if not 1 <= step <= 16:
+                raise AssertionError('ITC: uploadSweepTable: sweep step out of range (1-16)')
+            known = self._sweep_table.setdefault(step, {})
+            changes = []
+            for pointer, parameter in enumerate(self.sweep_parameter_names, 1):
+                value = sweep_table[step].get(parameter, None)
+                if value is None:
+                    continue
+                setting = '$s{}'.format(value)
+                if known.get(parameter, None) != setting:
+                    changes.append((pointer, parameter, setting))
+            if changes:
+                self._setSweepStep(step, changes)
+                written += len(changes)
+        return written
+
+    def getSweepTable(self):
+        """return a copy of the last uploaded sweep table, as far as it is known
+            (parameter values as sent, e.g. '$s4.2')
+        """
+        return {step: dict(parameters) for step, parameters in self._sweep_table.items()}
+
+    def _setSweepStep(self, sweep_step, changes):
+        """Sets the parameters for a sweep step.
+
+        This sets the step pointer (x) to the proper step.
+        Then this sets the changed step parameters (y1, y2, y3) to
+        the values given. Finally, this resets the x and y pointers to 0.
+        The ComLock is held throughout, so that no other command
+        can interfere with the table pointers.
 
-        self._resetSweepTablePointers()
-        self.ComLock.release()
+        Args:
+            sweep_step: The sweep step to be modified (values: 1-16)
+            changes: list of (y pointer, parameter name, setting)
+        """
+        known = self._sweep_table[sweep_step]
+        with self.ComLock:
+            try:
+                self._write('$x{}'.format(sweep_step))
+                for pointer, parameter, setting in changes:
+                    # if anything fails from here, the value on the device is unknown
+                    known.pop(parameter, None)
+                    self._write('$y{}'.format(pointer))
+                    self._write(setting)
+                    known[parameter] = setting
+            finally:
+                self._resetSweepTablePointers()
 
     def _resetSweepTablePointers(self):
         """Resets the table pointers to x=0 and y=0 to prevent
            accidental sweep table changes.
+           (to be called with the ComLock held)
         """
-        self._visa_resource.write('$x0')
-        self._visa_resource.write('$y0')
+        self._write('$x0')
+        self._write('$y0')
 
     def SweepStart(self):
         """start the sweep, beginning at the first step in the table"""
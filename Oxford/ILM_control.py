@@ -7,6 +7,7 @@ from pyvisa.errors import VisaIOError
 from copy import deepcopy
 # from util import AbstractThread
 from util import AbstractLoopThread
+from util import PollSchedule
 
 class ILM_Updater(AbstractLoopThread):
 
@@ -38,6 +39,10 @@ class ILM_Updater(AbstractLoopThread):
         # channel_2_wire_current=7,
         # needle_valve_position=10)
 
+    # minimum time (seconds) between two reads of a value, values not listed are read every cycle
+    poll_intervals = dict(
+        channel_2_level=30)
+
 
     def __init__(self, InstrumentAddress=''):
         super().__init__()
@@ -47,6 +52,7 @@ class ILM_Updater(AbstractLoopThread):
         self.control_state = 3
         # self.interval = 60*30# every half hour one measurement lHe is not measured more often by the device anyways
         self.interval = 3
+        self.schedule = PollSchedule(self.poll_intervals)
 
         self.setControl()
 
@@ -61,12 +67,13 @@ class ILM_Updater(AbstractLoopThread):
         """
         data = dict()
 
-        for key in self.sensors:
+        for key in self.schedule.due(self.sensors):
             try:
                 # get key-value pairs of the sensors dict,
                 # so I can then transmit one single dict
                 # for key, idx_sensor in self.sensors.items():
                 data[key] = self.ILM.getValue(self.sensors[key])*0.1
+                self.schedule.done(key)
                 # data['channel_2_level'] = self.ILM.getValue(2)*0.1
                 # if data[key] > 100:
                 #     data[key] = 100
@@ -90,6 +97,25 @@ class ILM_Updater(AbstractLoopThread):
 
 
 
+    async def running_async(self):
+        """running as a coroutine, for the shared event loop (see async_transport)
+
+            a timed out reply was already waited for by the driver, it is not read again
+        """
+        data = dict()
+        for key in self.schedule.due(self.sensors):
+            try:
+                data[key] = await self.ILM.getValue_async(self.sensors[key])*0.1
+                self.schedule.done(key)
+            except AssertionError as e_ass:
+                self.sig_assertion.emit(e_ass.args[0])
+            except VisaIOError as e_visa:
+                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                    self.sig_visatimeout.emit()
+                else:
+                    self.sig_visaerror.emit(e_visa.args[0])
+        self.sig_Infodata.emit(deepcopy(data))
+
     def read_buffer(self):
         try:
             return self.ILM.read()
@@ -132,6 +158,7 @@ class ILM_Updater(AbstractLoopThread):
                 self.ILM.setFast(channel)
             elif speed == 0:
                 self.ILM.setSlow(channel)
+            self.schedule.invalidate()
 
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
@@ -1,5 +1,7 @@
 # import sys
 import time
+import threading
+import asyncio
 
 
 # from PyQt5 import QtWidgets, QtGui
@@ -12,6 +14,7 @@ from pyvisa.errors import VisaIOError
 from copy import deepcopy
 
 from util import AbstractLoopThread
+from util import PollSchedule
 
 class IPS_Updater(AbstractLoopThread):
     """docstring for PS_Updater"""
@@ -20,6 +23,10 @@ class IPS_Updater(AbstractLoopThread):
     # sig_assertion = pyqtSignal(str)
     sig_visaerror = pyqtSignal(str)
     sig_visatimeout = pyqtSignal()
+    # field (T), once the output reached the set point, see armFieldReached
+    sig_field_reached = pyqtSignal(float)
+    # estimated time (s) until the set point is reached, while sweeping towards it
+    sig_field_eta = pyqtSignal(float)
     timeouterror = VisaIOError(-1073807339)
 
     sensors= dict(
@@ -46,6 +53,24 @@ class IPS_Updater(AbstractLoopThread):
                     # IDAC = 20,#                           demand_current_as_a_hexadecimal_number
                     safe_current_limit_most_negative = 21,
                     safe_current_limit_most_positive = 22)
+
+    # minimum time (seconds) between two reads of a value, values not listed are read every cycle
+    # setpoints, rates and limits only change when we set them, they are re-read after setting them
+    # 'status' is the status string, read with getStatus
+    poll_intervals = dict(
+                    CURRENT_set_point = 30,
+                    CURRENT_sweep_rate = 30,
+                    FIELD_set_point = 30,
+                    FIELD_sweep_rate = 30,
+                    lead_resistance = 10,
+                    software_voltage_limit = 120,
+                    persistent_magnet_current = 10,
+                    trip_current = 120,
+                    persistent_magnet_field = 10,
+                    trip_field = 120,
+                    safe_current_limit_most_negative = 120,
+                    safe_current_limit_most_positive = 120,
+                    status = 2)
     statusdict = dict(magnetstatus= {'0': 'normal',
                                          '1': 'quenched',
                                          '2': 'over heated',
@@ -103,7 +128,18 @@ class IPS_Updater(AbstractLoopThread):
 
         self.PS = ips120(InstrumentAddress=InstrumentAddress)
         self.field_setpoint = 0
+        self.field_rate = 0
         self.first = True
+        self.schedule = PollSchedule(self.poll_intervals)
+
+        # field-reached notification: (target, margin) in T, None: not armed,
+        # replaced as a whole, as it is armed from other threads,
+        # the default margin, the last known output, set point and sweep rate
+        # (not all are read every cycle)
+        self.field_armed = None
+        self.field_margin = 0.01
+        self.field_reached = threading.Event()
+        self.field_values = dict()
 
 
     @pyqtSlot()
@@ -116,10 +152,14 @@ class IPS_Updater(AbstractLoopThread):
             data = dict()
             # get key-value pairs of the sensors dict,
             # so I can then transmit one single dict
-            for key, idx_sensor in self.sensors.items():
+            for key in self.schedule.due(list(self.sensors) + ['status']):
                 # key_f_timeout = key
-                data[key] = self.PS.getValue(idx_sensor)
-            data.update(self.getStatus())
+                if key == 'status':
+                    data.update(self.getStatus())
+                else:
+                    data[key] = self.PS.getValue(self.sensors[key])
+                self.schedule.done(key)
+            self.check_field(data)
             self.sig_Infodata.emit(deepcopy(data))
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
@@ -132,6 +172,78 @@ class IPS_Updater(AbstractLoopThread):
             else:
                 self.sig_visaerror.emit(e_visa.args[0])
 
+    async def running_async(self):
+        """running as a coroutine, for the shared event loop (see async_transport)
+
+            a timed out reply was already waited for by the driver, it is not read again
+        """
+        if self.first:
+            await asyncio.sleep(1)
+            self.first = False
+        try:
+            data = dict()
+            for key in self.schedule.due(list(self.sensors) + ['status']):
+                if key == 'status':
+                    data.update(self.interpretStatus(await self.PS.getStatus_async()))
+                else:
+                    data[key] = await self.PS.getValue_async(self.sensors[key])
+                self.schedule.done(key)
+            self.check_field(data)
+            self.sig_Infodata.emit(deepcopy(data))
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                self.sig_visatimeout.emit()
+            else:
+                self.sig_visaerror.emit(e_visa.args[0])
+
+    def check_field(self, data):
+        """evaluate the field-reached condition on the freshly polled values
+
+            FIELD_output is read every cycle, so the notification
+            follows within one poll period, without extra queries
+        """
+        for key in ('FIELD_output', 'FIELD_set_point', 'FIELD_sweep_rate'):
+            if key in data:
+                self.field_values[key] = data[key]
+        armed = self.field_armed
+        if armed is None or 'FIELD_output' not in data:
+            return
+        target, margin = armed
+        remaining = abs(target - data['FIELD_output'])
+        if remaining < margin:
+            if self.field_armed is armed:
+                self.field_armed = None
+            self.field_reached.set()
+            self.sig_field_reached.emit(data['FIELD_output'])
+            return
+        rate = self.field_values.get('FIELD_sweep_rate', 0)
+        if rate:
+            # sweep rate in T/min
+            self.sig_field_eta.emit(remaining / abs(rate) * 60)
+
+    @pyqtSlot(float)
+    @pyqtSlot(float, float)
+    def armFieldReached(self, target, margin=None):
+        """request a sig_field_reached (and the field_reached event)
+            once the output field is within margin (default: field_margin) of target
+            setFieldSetpoint arms it with the new set point
+        """
+        self.field_reached.clear()
+        self.field_armed = (target, self.field_margin if margin is None else margin)
+
+    def estimateFieldETA(self):
+        """estimated time (s) until the armed target is reached,
+            from the last polled output field and sweep rate,
+            None if not armed or unknown
+        """
+        rate = self.field_values.get('FIELD_sweep_rate', 0)
+        armed = self.field_armed
+        if armed is None or not rate or 'FIELD_output' not in self.field_values:
+            return None
+        return abs(armed[0] - self.field_values['FIELD_output']) / abs(rate) * 60
+
     def read_buffer(self):
         try:
             return self.PS.read_buffer()
@@ -144,7 +256,10 @@ class IPS_Updater(AbstractLoopThread):
         self.PS.set_delay_measuring(delay)
 
     def getStatus(self):
-        status = self.PS.getStatus()
+        return self.interpretStatus(self.PS.getStatus())
+
+    def interpretStatus(self, status):
+        """translate the status string (XmnAnCnHnMmnPmn) into readable entries"""
         return dict(status_magnet = self.statusdict['magnetstatus'][status[1]],
                     status_current = self.statusdict['currentstatus'][status[2]],
                     status_activity= self.statusdict['activitystatus'][status[4]],
@@ -160,6 +275,7 @@ class IPS_Updater(AbstractLoopThread):
         """method to set the control for local/remote"""
         try:
             self.PS.setControl(control_state)
+            self.schedule.invalidate('status')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -215,6 +331,7 @@ class IPS_Updater(AbstractLoopThread):
         '''method to setActivity - this can be invoked by a signal'''
         try:
             self.PS.setActivity( state)
+            self.schedule.invalidate('status')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -228,6 +345,7 @@ class IPS_Updater(AbstractLoopThread):
         '''method to setHeater - this can be invoked by a signal'''
         try:
             self.PS.setSwitchHeater(state)
+            self.schedule.invalidate('status', 'persistent_magnet_current', 'persistent_magnet_field')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -241,6 +359,8 @@ class IPS_Updater(AbstractLoopThread):
         '''method to setFieldSetpoint - this can be invoked by a signal'''
         try:
             self.PS.setFieldSetpoint(self.field_setpoint)
+            self.schedule.invalidate('FIELD_set_point', 'CURRENT_set_point')
+            self.armFieldReached(self.field_setpoint)
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -261,6 +381,7 @@ class IPS_Updater(AbstractLoopThread):
         '''method to setFieldSweepRate - this can be invoked by a signal'''
         try:
             self.PS.setFieldSweepRate(self.field_rate)
+            self.schedule.invalidate('FIELD_sweep_rate', 'CURRENT_sweep_rate')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -268,18 +389,19 @@ class IPS_Updater(AbstractLoopThread):
                 self.sig_visatimeout.emit()
             else:
                 self.sig_visaerror.emit(e_visa.args[0])
-    @pyqtSlot(int)
+    @pyqtSlot(float)
     def gettoset_FieldSweepRate(self, value):
         """class method to receive and store the value to set the Field sweep rate
             later on, when the command to enforce the value is sent
         """
-        self.field_setpoint = value
+        self.field_rate = value
 
     @pyqtSlot()
     def setDisplay(self, display):
         '''method to setDisplay - this can be invoked by a signal'''
         try:
             self.PS.setDisplay(display)
+            self.schedule.invalidate('status')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -290,9 +412,11 @@ class IPS_Updater(AbstractLoopThread):
 
     @pyqtSlot()
     def waitForField(self, timeout, error_margin):
-        '''method to waitForField - this can be invoked by a signal'''
+        '''method to waitForField - this can be invoked by a signal
+            this blocks the thread, prefer armFieldReached / sig_field_reached
+        '''
         try:
-            return self.PS.waitForField()
+            return self.PS.waitForField(timeout=timeout, error_margin=error_margin)
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -12,6 +12,7 @@ from copy import deepcopy
 
 # from util import AbstractThread
 from util import AbstractLoopThread
+from util import PollSchedule
 
 
 class ITC_Updater(AbstractLoopThread):
@@ -50,6 +51,16 @@ class ITC_Updater(AbstractLoopThread):
             integral_action_time = 9,
             derivative_action_time = 10)
 
+    # minimum time (seconds) between two reads of a value, values not listed are read every cycle
+    # values which only change when we set them are read slowly, and re-read after setting them
+    # while a sweep is running, the ITC moves the set temperature itself, it is then read every cycle
+    poll_intervals = dict(
+            sweep_status = 5,
+            set_temperature = 30,
+            proportional_band = 60,
+            integral_action_time = 60,
+            derivative_action_time = 60)
+
     def __init__(self, InstrumentAddress='', **kwargs):
         super().__init__(**kwargs)
 
@@ -67,6 +78,9 @@ class ITC_Updater(AbstractLoopThread):
         self.set_gas_output = 0
         self.set_auto_manual = 0
         self.sweep_parameters = None
+        self.sweep_program = None
+        self.schedule = PollSchedule(self.poll_intervals)
+        self.sweeping = False
 
         self.setControl()
         self.interval = 0.05
@@ -84,14 +98,19 @@ class ITC_Updater(AbstractLoopThread):
 
         """
 
+        self.read_sweep_status()
+        if self.sweeping:
+            self.schedule.invalidate('set_temperature')
+
         data = dict()
             # get key-value pairs of the sensors dict,
             # so I can then transmit one single dict
-        for key in self.sensors.keys():
+        for key in self.schedule.due(self.sensors):
             try:
 
                 value = self.ITC.getValue(self.sensors[key])
                 data[key] = value
+                self.schedule.done(key)
             except AssertionError as e_ass:
                 self.sig_assertion.emit(e_ass.args[0])
                 data[key] = None
@@ -106,6 +125,62 @@ class ITC_Updater(AbstractLoopThread):
         self.sig_Infodata.emit(deepcopy(data))
 
 
+    async def running_async(self):
+        """running as a coroutine, for the shared event loop (see async_transport)
+
+            a timed out reply was already waited for by the driver, it is not read again
+        """
+        await self.read_sweep_status_async()
+        if self.sweeping:
+            self.schedule.invalidate('set_temperature')
+
+        data = dict()
+        for key in self.schedule.due(self.sensors):
+            try:
+                data[key] = await self.ITC.getValue_async(self.sensors[key])
+                self.schedule.done(key)
+            except AssertionError as e_ass:
+                self.sig_assertion.emit(e_ass.args[0])
+                data[key] = None
+            except VisaIOError as e_visa:
+                if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                    self.sig_visatimeout.emit()
+                    data[key] = None
+                else:
+                    self.sig_visaerror.emit(e_visa.args[0])
+        self.sig_Infodata.emit(deepcopy(data))
+
+    def read_sweep_status(self):
+        """check (every few seconds) whether a sweep is running"""
+        if not self.schedule.due(['sweep_status']):
+            return
+        try:
+            self.sweeping = self.ITC.getSweepStatus() != 0
+            self.schedule.done('sweep_status')
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                self.sig_visatimeout.emit()
+                self.read_buffer()
+            else:
+                self.sig_visaerror.emit(e_visa.args[0])
+
+    async def read_sweep_status_async(self):
+        """read_sweep_status as a coroutine, for the shared event loop"""
+        if not self.schedule.due(['sweep_status']):
+            return
+        try:
+            self.sweeping = await self.ITC.getSweepStatus_async() != 0
+            self.schedule.done('sweep_status')
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                self.sig_visatimeout.emit()
+            else:
+                self.sig_visaerror.emit(e_visa.args[0])
+
     # def control_checks(func):
     #     @functools.wraps(func)
     #     def wrapper_control_checks(*args, **kwargs):
@@ -166,6 +241,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setTemperature(self.set_temperature)
+            self.schedule.invalidate('set_temperature')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -183,6 +259,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setProportional(self.set_prop)
+            self.schedule.invalidate('proportional_band')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -201,6 +278,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setIntegral(self.set_integral)
+            self.schedule.invalidate('integral_action_time')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -219,6 +297,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setDerivative(self.set_derivative)
+            self.schedule.invalidate('derivative_action_time')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -257,6 +336,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setHeaterOutput(self.set_heater_output)
+            self.schedule.invalidate('heater_output_as_percent', 'heater_output_as_voltage')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -276,6 +356,7 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setGasOutput(self.set_gas_output)
+            self.schedule.invalidate('gas_flow_output')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -299,6 +380,7 @@ class ITC_Updater(AbstractLoopThread):
         self.set_auto_manual = value
         try:
             self.ITC.setAutoControl(self.set_auto_manual)
+            self.schedule.invalidate('heater_output_as_percent', 'heater_output_as_voltage', 'gas_flow_output')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -314,6 +396,24 @@ class ITC_Updater(AbstractLoopThread):
         """
         try:
             self.ITC.setSweeps(self.sweep_parameters)
+            self.schedule.invalidate('set_temperature', 'sweep_status')
+        except AssertionError as e_ass:
+            self.sig_assertion.emit(e_ass.args[0])
+        except VisaIOError as e_visa:
+            if type(e_visa) is type(self.timeouterror) and e_visa.args == self.timeouterror.args:
+                self.sig_visatimeout.emit()
+            else:
+                self.sig_visaerror.emit(e_visa.args[0])
+
+    @pyqtSlot()
+    def setSweepProgram(self):
+        """class method to be called to compile and upload a temperature program
+            as the sweep table, only the changed parameters are sent
+            this is to be invoked by a signal
+        """
+        try:
+            self.ITC.setSweepProgram(self.sweep_program)
+            self.schedule.invalidate('set_temperature', 'sweep_status')
         except AssertionError as e_ass:
             self.sig_assertion.emit(e_ass.args[0])
         except VisaIOError as e_visa:
@@ -379,6 +479,13 @@ class ITC_Updater(AbstractLoopThread):
         """
         self.sweep_parameters = value
 
+    @pyqtSlot()
+    def gettoset_SweepProgram(self, value):
+        """class method to receive and store a temperature program
+            (list of segments, see itc503.compileSweepProgram)
+            to set it later on, when the command to enforce the value is sent
+        """
+        self.sweep_program = value
 
     # @pyqtSlot()
     # def gettoset_HeaterSensor(self, value):
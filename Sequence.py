@@ -11,6 +11,7 @@
 
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtCore import pyqtSlot
+from PyQt5.QtCore import Qt
 
 # import sys
 # import datetime
@@ -18,6 +19,7 @@ from PyQt5.QtCore import pyqtSlot
 # import os
 # import re
 import time
+import threading
 
 from util import AbstractEventhandlingThread
 
@@ -30,6 +32,8 @@ class Sequence_Thread(AbstractEventhandlingThread):
     """docstring for Sequence_Thread"""
 
     sig_aborted = pyqtSignal()
+    # target field and margin (T), armed in the IPS thread, see wait_for_Field
+    sig_arm_field = pyqtSignal(float, float)
 
     def __init__(self, mainthread, sequence):
         super(Sequence_Thread, self).__init__()
@@ -43,6 +47,20 @@ class Sequence_Thread(AbstractEventhandlingThread):
 
         self.temp_VTI_offset = 5
 
+        # set from the LakeShore350 service request thread, see ramp_done
+        self.ramp_done = {1: threading.Event(), 2: threading.Event()}
+        if 'control_LakeShore350_events' in mainthread.threads:
+            # direct connection: this thread is busy running the sequence,
+            # it cannot process queued signals in the meantime
+            mainthread.threads['control_LakeShore350_events'][0].sig_ramp_done.connect(
+                self.on_ramp_done, Qt.DirectConnection)
+        # set from the IPS thread, once the field set point was reached
+        self.field_reached = threading.Event()
+        if 'control_IPS' in mainthread.threads:
+            mainthread.threads['control_IPS'][0].sig_field_reached.connect(
+                self.on_field_reached, Qt.DirectConnection)
+            self.sig_arm_field.connect(mainthread.threads['control_IPS'][0].armFieldReached)
+
     def running(self):
         try:
             self.mainthread.ITC_window.widgetSetpoints.setEnabled(False)
@@ -58,6 +76,7 @@ class Sequence_Thread(AbstractEventhandlingThread):
                         self.mainthread.threads['control_ITC'][0].gettoset_Temperature(temp_setpoint_VTI)
                         self.mainthread.threads['control_ITC'][0].setTemperature()
 
+                        self.ramp_done[1].clear()
                         self.mainthread.threads['control_LakeShore350'][0].gettoset_Temp_K(temp_setpoint_sample)
                         self.mainthread.threads['control_LakeShore350'][0].setTemp_K()
 
@@ -80,7 +99,22 @@ class Sequence_Thread(AbstractEventhandlingThread):
 
 
     def check_Temp_in_Scan(self, Temp, direction=0):
-        pass
+        """wait until the sample temperature reached the set point of the scan step
+
+            first for the end of the LakeShore350 setpoint ramp, as signalled
+            by its service request (if the event thread runs), then for the
+            temperature itself. The wait for the ramp is bounded by the time
+            the ramp should take (plus a margin), in case no ramp is running.
+        """
+        if 'control_LakeShore350_events' in self.mainthread.threads:
+            with self.dataLock:
+                Temp_now = self.mainthread.data['LakeShore350'].get('Sensor_1_K', None) or Temp
+                rate = self.mainthread.data['LakeShore350'].get('Ramp_Rate', None)
+            timeout = 60
+            if rate:
+                timeout += 1.5 * 60 * abs(Temp - Temp_now) / rate
+            self.wait_for_LakeShore_ramp(output=1, timeout=timeout)
+        self.wait_for_Temp(Temp, threshold=self.threshold_Temp)
 
 
     def wait_for_Temp(self, Temp_target, threshold=0.01):
@@ -101,21 +135,55 @@ class Sequence_Thread(AbstractEventhandlingThread):
             # sleep for short time OUTSIDE of Lock
             time.sleep(0.1)
 
-    def wait_for_Field(self, Field):
-        """repeatedly check whether the field was reached,
-            given the respective threshold, return once it has
-            produce a possibility to abort the sequence, through
-            repeated check for value, for breaking condition, and sleeping
+    def on_ramp_done(self, output):
+        """register a finished setpoint ramp of the LakeShore350 (called from the event thread)"""
+        self.ramp_done[output].set()
+
+    def wait_for_LakeShore_ramp(self, output=1, timeout=None):
+        """wait until the setpoint ramp of the LakeShore350 output is done,
+            as signalled by its service request, not by polling
+            produce a possibility to abort the sequence, by waiting in short steps
+        """
+        started = time.time()
+        while not self.ramp_done[output].wait(0.1):
+            if not self.__isRunning:
+                raise BreakCondition
+            if timeout is not None and time.time() - started > timeout:
+                return False
+        self.ramp_done[output].clear()
+        return True
+
+    def on_field_reached(self, field):
+        """register a reached field set point (called from the IPS thread)"""
+        self.field_reached.set()
+
+    def wait_for_Field(self, Field, timeout=None):
+        """wait until the field was reached, given self.threshold_Field,
+            as signalled by the IPS thread, which checks it on its polling stream
+            produce a possibility to abort the sequence, by waiting in short steps
         """
         # check for break condition
         if not self.__isRunning:
             raise BreakCondition
+        if 'control_IPS' not in self.mainthread.threads:
+            return False
         with self.dataLock:
             # check for value
-            pass
-
-        # sleep for short time OUTSIDE of Lock
-        time.sleep(0.1)
+            Field_now = self.mainthread.data['IPS'].get('FIELD_output', None)
+        if Field_now is not None and abs(Field_now - Field) < self.threshold_Field:
+            return True
+        self.field_reached.clear()
+        # queued to the IPS thread, with the margin, nothing of it is changed from here
+        self.sig_arm_field.emit(Field, self.threshold_Field)
+        started = time.time()
+        # sleep for short times, OUTSIDE of any Lock
+        while not self.field_reached.wait(0.1):
+            if not self.__isRunning:
+                raise BreakCondition
+            if timeout is not None and time.time() - started > timeout:
+                return False
+        self.field_reached.clear()
+        return True
 
 
 
@@ -0,0 +1,176 @@
+"""Asynchronous I/O on visa resources, on one shared event loop (free of Qt)
+
+One asyncio event loop, running in one thread, executes the transactions
+of the instruments as coroutines (async query / write of the drivers),
+which never block the loop while waiting for a reply, so dozens of
+instruments are served concurrently, without a thread per device.
+
+VISA has no non-blocking read, the reply is therefore awaited by polling
+the input buffer, and only what arrived is read:
+    serial ports: bytes_in_buffer, the bytes are collected until the read termination
+    other interfaces (GPIB, ...): the message available bit (MAV) of the status byte
+Writes of the short commands are passed on directly.
+
+Transactions on one resource are serialised by an asyncio lock of the resource
+(shared by all instruments on it, e.g. on one ISOBUS line), and by a lock of
+the driver (e.g. ComLock), which is taken without blocking the loop, as the
+blocking methods of the drivers are still used from threads.
+
+Usage:
+    async with AsyncResource.get(resource).locked(ComLock) as io:
+        io.write(command)
+        answer = await io.read(timeout)
+
+    future = shared_loop().submit(coroutine)    # concurrent.futures.Future
+
+Functions:
+    shared_loop: the event loop thread shared by all instruments
+
+Classes:
+    EventLoopThread: runs an asyncio event loop in a thread
+    AsyncResource: non-blocking read and write of a visa resource, with its lock on the loop
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from pyvisa.errors import VisaIOError
+
+
+timeouterror = VisaIOError(-1073807339)
+
+# message available bit of the status byte (IEEE 488.2)
+MAV = 0x10
+
+
+class EventLoopThread(object):
+    """asyncio event loop, running in its own (daemon) thread"""
+
+    def __init__(self):
+        super(EventLoopThread, self).__init__()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='instrument_loop', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """schedule a coroutine on the loop, from any thread
+
+            returns:
+                concurrent.futures.Future of the result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call(self, coroutine, timeout=None):
+        """run a coroutine on the loop, and wait for its result (not from the loop thread!)"""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+_shared_loop = None
+_shared_lock = threading.Lock()
+
+
+def shared_loop():
+    """the event loop thread shared by all instruments, started on first use"""
+    global _shared_loop
+    with _shared_lock:
+        if _shared_loop is None:
+            _shared_loop = EventLoopThread()
+        return _shared_loop
+
+
+class AsyncResource(object):
+    """non-blocking I/O on a visa resource, for coroutines on the event loop
+
+        there is one AsyncResource per visa resource, see get, so that all
+        instruments on one resource share its lock (and its input buffer)
+        to be used within locked(), which serialises the transactions
+    """
+
+    _resources = weakref.WeakKeyDictionary()
+    _resources_lock = threading.Lock()
+
+    def __init__(self, resource, poll_interval=0.002):
+        super(AsyncResource, self).__init__()
+        self.resource = resource
+        # seconds between two looks at the input buffer, while waiting for a reply
+        self.poll_interval = poll_interval
+        # serial ports tell the number of bytes which arrived, the others the MAV bit
+        self.serial = hasattr(resource, 'bytes_in_buffer')
+        self._buffer = b''
+        self._lock = None
+
+    @classmethod
+    def get(cls, resource):
+        """the AsyncResource of a visa resource, created on first use"""
+        with cls._resources_lock:
+            if resource not in cls._resources:
+                cls._resources[resource] = cls(resource)
+            return cls._resources[resource]
+
+    @asynccontextmanager
+    async def locked(self, threadlock=None):
+        """hold the lock of the resource on the loop, and the lock threadlock
+            (e.g. the ComLock of a driver) as well, acquired without blocking the loop
+        """
+        if self._lock is None:
+            # created on the loop it is used on
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while threadlock is not None and not threadlock.acquire(blocking=False):
+                await asyncio.sleep(self.poll_interval)
+            try:
+                yield self
+            finally:
+                if threadlock is not None:
+                    threadlock.release()
+
+    def write(self, message):
+        self.resource.write(message)
+
+    async def read(self, timeout):
+        """wait for the next message, without blocking the loop
+
+            timeout: in ms, as the visa timeout
+            raises:
+                VisaIOError (timeout) if the message did not arrive within timeout
+        """
+        deadline = time.monotonic() + timeout / 1e3
+        if not self.serial:
+            while not self.resource.read_stb() & MAV:
+                await self._wait(deadline)
+            return self.resource.read()
+        termination = self.resource.read_termination.encode('latin-1')
+        while termination not in self._buffer:
+            arrived = self.resource.bytes_in_buffer
+            if arrived:
+                self._buffer += self.resource.read_bytes(arrived)
+            else:
+                await self._wait(deadline)
+        message, __, self._buffer = self._buffer.partition(termination)
+        return message.decode('latin-1')
+
+    async def _wait(self, deadline):
+        if time.monotonic() > deadline:
+            raise timeouterror
+        await asyncio.sleep(self.poll_interval)
+
+    async def drain(self, timeout):
+        """discard the incomplete message, and what arrives within timeout (ms)"""
+        self._buffer = b''
+        try:
+            await self.read(timeout)
+        except VisaIOError as e_visa:
+            if e_visa.args != timeouterror.args:
+                raise
+        self._buffer = b''
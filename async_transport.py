@@ -0,0 +1,110 @@
+"""Qt bridge to the shared event loop of the instruments (see async_io)
+
+Instrument updaters which offer asynchronous polling (a coroutine running_async,
+using the async query / write of their drivers) are polled on the one shared
+event loop, instead of one QThread per instrument, see AsyncPoller.
+
+The slots of these updaters (setTemperature, ...) still use the blocking
+methods of the drivers, they are executed in one shared QThread (see slot_thread),
+so that setting values from the GUI never blocks the GUI thread on VISA I/O.
+
+Usage:
+    poller = AsyncPoller(ITC_Updater(address))
+    poller.start()                          # data arrives through sig_Infodata, as before
+
+Functions:
+    slot_thread: the QThread executing the slots of all updaters polled on the loop
+
+Classes:
+    AsyncPoller: polls an updater on the loop (its coroutine running_async),
+        can be stopped like a QThread (quit, wait)
+"""
+
+import asyncio
+import threading
+import time
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QThread
+
+from async_io import shared_loop
+
+
+_slot_thread = None
+_slot_lock = threading.Lock()
+
+
+def slot_thread():
+    """the QThread in which the slots of all updaters polled on the loop are executed,
+        started on first use (to be called from the GUI thread)
+    """
+    global _slot_thread
+    with _slot_lock:
+        if _slot_thread is None:
+            _slot_thread = QThread()
+            _slot_thread.start()
+        return _slot_thread
+
+
+class AsyncPoller(QObject):
+    """Qt bridge: polls an updater on the shared loop
+
+        the worker is an AbstractLoopThread (e.g. ITC_Updater) with a coroutine
+        running_async (the asynchronous version of its method running), which
+        is awaited every worker.interval seconds, on the loop itself.
+        It emits its signals (sig_Infodata, ...) as before - Qt queues
+        them to the receivers in the main thread.
+        Offers quit and wait like a QThread, so it can be stored in
+        mainWindow.threads and stopped by mainWindow.stopping_thread.
+        The worker is moved to the slot_thread, so that its slots, connected
+        to the GUI, are queued there instead of running in the GUI thread.
+    """
+
+    def __init__(self, worker, loop=None):
+        super(AsyncPoller, self).__init__()
+        if not hasattr(worker, 'running_async'):
+            raise AssertionError('AsyncPoller: {} cannot be polled asynchronously'.format(
+                type(worker).__name__))
+        self.worker = worker
+        self.worker.moveToThread(slot_thread())
+        self.loop = loop or shared_loop()
+        self._running = False
+        self._future = None
+        self._sleep = None
+
+    def start(self):
+        self._running = True
+        self._future = self.loop.submit(self._poll())
+
+    async def _poll(self):
+        while self._running:
+            started = time.monotonic()
+            try:
+                await self.worker.running_async()
+            except AssertionError as assertion:
+                self.worker.sig_assertion.emit(assertion.args[0])
+            # the interval is read every time, so setInterval works as before
+            self._sleep = asyncio.ensure_future(
+                asyncio.sleep(max(0., self.worker.interval - (time.monotonic() - started))))
+            try:
+                await self._sleep
+            except asyncio.CancelledError:
+                pass
+
+    def _wake(self):
+        if self._sleep is not None:
+            self._sleep.cancel()
+
+    def quit(self):
+        """stop polling, after the current cycle"""
+        self._running = False
+        self.loop.loop.call_soon_threadsafe(self._wake)
+
+    def wait(self, timeout=None):
+        """wait until the current polling cycle is finished"""
+        if self._future is not None:
+            self._future.result(timeout)
+        return True
+
+    def isRunning(self):
+        return self._running
@@ -0,0 +1,248 @@
+"""Pool of the open VISA sessions, with automatic reconnection
+
+The drivers open their resources through the pool (open_resource). The pool
+hands out a ManagedResource, which behaves like the visa resource itself, but:
+    - remembers the settings made on it (timeout, terminations, serial settings, ...)
+        and the events which were enabled
+    - detects a dead session (connection lost, invalid session, I/O error...),
+        reopens it, restores the settings and events, and retries the operation once
+    - reconnects with exponential backoff: while the instrument is unreachable,
+        operations fail immediately, until the next attempt is due
+
+The instrument itself keeps its configuration when only the VISA session is
+lost, so the initialisation of the instrument (e.g. configHeater for the
+LakeShore350) is not repeated, and the updater threads need not be restarted.
+
+Sessions which are still open are reused when an address is opened again.
+Every open_resource counts as one user of the session, closing the
+ManagedResource releases it, the session is closed with its last user.
+close_all closes all sessions, when the application quits.
+
+While a journal is recording (see journal.start), every operation on the
+sessions is written to it. With set_manager, all sessions are opened with
+another resource manager, e.g. a journal.ReplayResourceManager.
+
+Functions:
+    open_resource: open (or reuse) the managed session of an address
+    close_all: close all sessions
+    set_manager: open all sessions with this resource manager
+    get_status: state and reconnection counts of all sessions
+
+Classes:
+    ConnectionPool: owns the open sessions
+    ManagedResource: visa resource proxy which reconnects dead sessions
+"""
+
+import time
+import threading
+
+from pyvisa.errors import VisaIOError
+
+import journal
+
+# VISA status codes which mean the session is dead (not just a timeout)
+VI_ERROR_SYSTEM_ERROR = -1073807360
+VI_ERROR_INV_OBJECT = -1073807346
+VI_ERROR_RSRC_NFOUND = -1073807343
+VI_ERROR_IO = -1073807298
+VI_ERROR_CONN_LOST = -1073807194
+dead_session_errors = (VI_ERROR_SYSTEM_ERROR, VI_ERROR_INV_OBJECT, VI_ERROR_RSRC_NFOUND,
+                       VI_ERROR_IO, VI_ERROR_CONN_LOST)
+
+# settings which are restored after reconnecting
+restored_settings = ('timeout', 'read_termination', 'write_termination', 'baud_rate', 'data_bits',
+                     'stop_bits', 'parity', 'flow_control', 'query_delay', 'chunk_size',
+                     'send_end', 'encoding')
+
+
+def is_dead_session(e_visa):
+    """whether a VisaIOError means the session is dead"""
+    return getattr(e_visa, 'error_code', None) in dead_session_errors
+
+
+class ManagedResource(object):
+    """visa resource proxy, which reconnects dead sessions
+
+        attribute access is passed on to the current session,
+        settings are remembered to be restored after reconnecting
+    """
+
+    # operations which talk to the instrument, retried once after reconnecting
+    operations = ('write', 'read', 'query', 'write_raw', 'read_raw', 'read_bytes',
+                  'query_binary_values', 'query_ascii_values', 'write_binary_values',
+                  'read_stb', 'clear', 'assert_trigger', 'wait_on_event', 'discard_events')
+
+    def __init__(self, address, manager, backoff_initial=0.5, backoff_max=30., pool=None):
+        # attributes of the proxy itself are set through __dict__, see __setattr__
+        self.__dict__.update(address=address, manager=manager, pool=pool, users=0,
+                             backoff_initial=backoff_initial, backoff_max=backoff_max,
+                             settings=dict(), events=dict(),
+                             reconnects=0, failures=0, last_error=None,
+                             _backoff=backoff_initial, _next_attempt=0., _dead=False,
+                             _lock=threading.RLock())
+        self.__dict__['resource'] = manager.open_resource(address)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.__dict__['resource'], name)
+        if name in self.operations:
+            return lambda *args, **kwargs: self._operate(name, *args, **kwargs)
+        return attribute
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+            return
+        if name in restored_settings:
+            self.settings[name] = value
+        setattr(self.resource, name, value)
+
+    def enable_event(self, event_type, mechanism, *args):
+        self.events[event_type] = (mechanism, args)
+        return self._operate('enable_event', event_type, mechanism, *args)
+
+    def disable_event(self, event_type, mechanism):
+        self.events.pop(event_type, None)
+        return self._operate('disable_event', event_type, mechanism)
+
+    def _operate(self, name, *args, **kwargs):
+        recorder = journal.recorder
+        if recorder is None:
+            return self._call(name, *args, **kwargs)
+        started = time.time()
+        try:
+            result = self._call(name, *args, **kwargs)
+        except VisaIOError as e_visa:
+            recorder.record_operation(self.address, name, args, started, error=e_visa)
+            raise
+        recorder.record_operation(self.address, name, args, started, result=result)
+        return result
+
+    def _call(self, name, *args, **kwargs):
+        if self._dead:
+            self.reconnect()
+        try:
+            return getattr(self.resource, name)(*args, **kwargs)
+        except VisaIOError as e_visa:
+            if not is_dead_session(e_visa):
+                raise
+            self.__dict__.update(_dead=True, last_error=e_visa)
+            # reopen, and try once more
+            self.reconnect(error=e_visa)
+            return getattr(self.resource, name)(*args, **kwargs)
+
+    def reconnect(self, error=None):
+        """reopen the session, restore its settings and events
+
+            raises the last error if the next attempt is not yet due,
+            or if reopening failed (the backoff is doubled then)
+        """
+        with self._lock:
+            if not self._dead:
+                return
+            if time.monotonic() < self._next_attempt:
+                raise error or self.last_error
+            try:
+                try:
+                    self.resource.close()
+                except Exception:
+                    # the old session is gone anyway
+                    pass
+                resource = self.manager.open_resource(self.address)
+                for name, value in self.settings.items():
+                    setattr(resource, name, value)
+                for event_type, (mechanism, args) in self.events.items():
+                    resource.enable_event(event_type, mechanism, *args)
+            except VisaIOError as e_visa:
+                self.__dict__.update(failures=self.failures + 1, last_error=e_visa,
+                                     _next_attempt=time.monotonic() + self._backoff,
+                                     _backoff=min(self._backoff * 2, self.backoff_max))
+                raise
+            self.__dict__.update(resource=resource, reconnects=self.reconnects + 1, _dead=False,
+                                 _backoff=self.backoff_initial, _next_attempt=0.)
+
+    def close(self):
+        """release the session, it is closed once its last user released it"""
+        if self.pool is not None:
+            self.pool.release(self.address)
+        else:
+            self.resource.close()
+
+    def get_status(self):
+        return dict(dead=self._dead, reconnects=self.reconnects, failures=self.failures, users=self.users,
+                    last_error=str(self.last_error) if self.last_error else None)
+
+
+class ConnectionPool(object):
+    """owns the open sessions, one per address"""
+
+    def __init__(self):
+        super(ConnectionPool, self).__init__()
+        self._sessions = dict()
+        self._lock = threading.Lock()
+        # if set, used instead of the manager given to open_resource
+        self.manager = None
+
+    def open_resource(self, address, manager):
+        """the managed session of an address, opened with manager if there is none yet"""
+        with self._lock:
+            if address not in self._sessions:
+                self._sessions[address] = ManagedResource(address, self.manager or manager, pool=self)
+            session = self._sessions[address]
+            session.users += 1
+            return session
+
+    def release(self, address):
+        """one user less of the session of an address, close it if it was the last one"""
+        with self._lock:
+            session = self._sessions.get(address)
+            if session is None:
+                return
+            session.users -= 1
+            if session.users > 0:
+                return
+            del self._sessions[address]
+        session.resource.close()
+
+    def close(self, address):
+        """really close the session of an address, regardless of its users"""
+        with self._lock:
+            session = self._sessions.pop(address, None)
+        if session is not None:
+            session.resource.close()
+
+    def close_all(self):
+        """close all sessions"""
+        with self._lock:
+            addresses = list(self._sessions)
+        for address in addresses:
+            try:
+                self.close(address)
+            except VisaIOError:
+                # closing a dead session, it is gone anyway
+                pass
+
+    def get_status(self):
+        with self._lock:
+            return {address: session.get_status() for address, session in self._sessions.items()}
+
+
+pool = ConnectionPool()
+
+
+def open_resource(address, manager):
+    """open (or reuse) the managed session of an address, see ConnectionPool"""
+    return pool.open_resource(address, manager)
+
+
+def close_all():
+    """close all sessions, see ConnectionPool.close_all"""
+    pool.close_all()
+
+
+def set_manager(manager):
+    """open all new sessions with manager (e.g. journal.ReplayResourceManager), None for the usual ones"""
+    pool.manager = manager
+
+
+def get_status():
+    return pool.get_status()
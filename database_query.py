@@ -0,0 +1,297 @@
+"""Module containing functions to read logged data back from the sqlite database
+
+This module is deliberately free of any Qt imports, so it can be used
+from the GUI (within worker threads) as well as from scripts.
+
+The tables are the ones created by logger.main_Logger:
+    one table per instrument, with the columns
+    id (INTEGER PRIMARY KEY), timeseconds, ReadableTime, and one column per value
+
+Functions:
+    get_tablenames: list all tables in the database
+    get_columnnames: list all columns of one table
+    get_timerange: first and last timestamp of a table
+    ensure_time_index: create an index on the time column of a table
+    check_numeric: refuse columns which are not numeric
+    fetch_overview: strided (decimated) sample of a whole table
+    fetch_range: strided sample of the rows within a time range
+
+Classes:
+    TileCache: LRU cache for data tiles fetched from the database
+
+    Tiler: splits time ranges into tiles of a resolution fitting to the range,
+        fetches missing tiles and serves them from the TileCache
+"""
+
+import math
+import sqlite3
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+
+
+TIMECOLUMN = 'timeseconds'
+
+
+def get_tablenames(conn):
+    """return a list of all tables in the database"""
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_columnnames(conn, tablename):
+    """return a list of all columns of the table 'tablename'"""
+    cursor = conn.execute("PRAGMA table_info({})".format(tablename))
+    return [row[1] for row in cursor.fetchall()]
+
+
+def get_timerange(conn, tablename):
+    """return the first and the last timestamp stored in the table"""
+    cursor = conn.execute("SELECT MIN({time}), MAX({time}) FROM {table}".format(
+        time=TIMECOLUMN, table=tablename))
+    return cursor.fetchone()
+
+
+def ensure_time_index(conn, tablename):
+    """create an index on the time column of the table, if it does not exist yet
+
+        with the index, selecting a time range does not need to scan the whole table
+        returns False if the index could not be created (e.g. read-only database)
+    """
+    try:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_{table}_{time} ON {table} ({time})".format(
+            table=tablename, time=TIMECOLUMN))
+        conn.commit()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _stride(rows, points):
+    """calculate the stride to get approximately 'points' out of 'rows' rows"""
+    if not rows or points is None:
+        return 1
+    return max(1, int(math.ceil(rows / points)))
+
+
+def check_numeric(conn, tablename, columns):
+    """make sure all columns are declared REAL or INTEGER
+
+        other columns (e.g. the TEXT column ReadableTime) would silently
+        be cast to 0.0, they are refused with an AssertionError instead
+    """
+    types = {row[1]: row[2].upper() for row in conn.execute("PRAGMA table_info({})".format(tablename))}
+    for column in columns:
+        if types.get(column) not in ('REAL', 'INTEGER'):
+            raise AssertionError('database: {}.{} is not numeric ({}), it cannot be plotted'.format(
+                tablename, column, types.get(column, 'no such column')))
+
+
+def _select(columns):
+    """build the column selection, casting every column to REAL (named c0, c1, ...),
+        and the condition which drops all rows with a NULL in any column
+    """
+    selection = ','.join('CAST({} AS REAL) AS c{}'.format(column, ct) for ct, column in enumerate(columns))
+    not_null = ' AND '.join('{} IS NOT NULL'.format(column) for column in columns)
+    return selection, not_null
+
+
+def _fetch_strided(conn, tablename, columns, condition, parameters, points):
+    """fetch every n-th of the rows matching the condition, and having no NULL in the columns
+
+        the stride is counted among these rows only, so a column which is
+        only logged in some of the rows does not alias down to few points
+    """
+    check_numeric(conn, tablename, columns)
+    selection, not_null = _select(columns)
+    condition = '{} AND {}'.format(condition, not_null)
+    stride = 1
+    if points is not None:
+        rows = conn.execute("SELECT COUNT(*) FROM {table} WHERE {condition}".format(
+            table=tablename, condition=condition), parameters).fetchone()[0]
+        if not rows:
+            return np.empty((len(columns), 0))
+        stride = _stride(rows, points)
+    sql = """SELECT {names} FROM (SELECT {cols}, ROW_NUMBER() OVER (ORDER BY id) - 1 AS n
+                FROM {table} WHERE {condition}) WHERE n % ? = 0 ORDER BY n""".format(
+        names=','.join('c{}'.format(ct) for ct in range(len(columns))),
+        cols=selection, table=tablename, condition=condition)
+    cursor = conn.execute(sql, list(parameters) + [stride])
+    return _to_array(cursor, len(columns))
+
+
+def _to_array(cursor, n_columns):
+    """read all rows of the cursor straight into a float array of shape (n_columns, n_rows)
+
+        the rows are flattened on the fly, no intermediate lists
+        or object arrays are built, rows stay paired
+    """
+    flat = np.fromiter(chain.from_iterable(cursor), dtype=float)
+    return flat.reshape(-1, n_columns).transpose()
+
+
+def fetch_overview(conn, tablename, columns, points=2000):
+    """fetch a coarse overview of the whole table
+
+        only every n-th row is read, so that approximately 'points'
+        rows are returned, regardless of the size of the table
+        rows in which any of the columns is NULL are skipped
+
+        returns:
+            float array of shape (len(columns), n)
+    """
+    return _fetch_strided(conn, tablename, columns, '1', [], points)
+
+
+def fetch_range(conn, tablename, columns, t_start=None, t_stop=None, points=None):
+    """fetch the rows within the time range [t_start, t_stop]
+
+        if t_start or t_stop are not given, the range is open to that side
+        if 'points' is given, the rows are decimated by a stride,
+        so that approximately 'points' rows are returned
+        rows in which any of the columns is NULL are skipped
+
+        returns:
+            float array of shape (len(columns), n)
+    """
+    bounds, parameters = ['1'], []
+    if t_start is not None:
+        bounds.append('{} >= ?'.format(TIMECOLUMN))
+        parameters.append(t_start)
+    if t_stop is not None:
+        bounds.append('{} <= ?'.format(TIMECOLUMN))
+        parameters.append(t_stop)
+    return _fetch_strided(conn, tablename, columns, ' AND '.join(bounds), parameters, points)
+
+
+class TileCache(object):
+    """Least-recently-used cache for data tiles
+
+        tiles are stored by an arbitrary (hashable) key,
+        once more than 'maxsize' tiles are stored,
+        the tile which was not used for the longest time is dropped
+    """
+
+    def __init__(self, maxsize=64):
+        super(TileCache, self).__init__()
+        self.maxsize = maxsize
+        self._tiles = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key):
+        """return the tile stored for key (None if not stored), mark it as recently used"""
+        try:
+            self._tiles.move_to_end(key)
+        except KeyError:
+            return None
+        return self._tiles[key]
+
+    def put(self, key, tile):
+        """store a tile, dropping the least recently used ones if necessary"""
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.maxsize:
+            self._tiles.popitem(last=False)
+
+    def clear(self):
+        self._tiles.clear()
+
+
+class Tiler(object):
+    """Serve data of one table for arbitrary time ranges, tile by tile
+
+        The time axis is split into tiles on a fixed, absolute grid: at exponent k,
+        tile i spans [i * 2**k, (i + 1) * 2**k] seconds, the exponent being chosen
+        such that one tile is about as long as the requested range.
+        Each tile holds approximately 'points_per_tile' rows, so the resolution
+        increases the further one zooms in, while the number of points
+        handed to the plot stays about the same.
+        Fetched tiles are kept in a TileCache, so panning back and forth,
+        or zooming out again, does not hit the database.
+        As the grid does not depend on the time range of the table, rows appended
+        while logging only change the last, open tiles, which are refetched
+        once newer rows arrived, all others stay valid.
+    """
+
+    def __init__(self, conn, tablename, columns, points_per_tile=1000, cachesize=64):
+        super(Tiler, self).__init__()
+        self.conn = conn
+        self.tablename = tablename
+        self.columns = list(columns)
+        if TIMECOLUMN not in self.columns:
+            self.columns.insert(0, TIMECOLUMN)
+        self._idx_time = self.columns.index(TIMECOLUMN)
+        self.points_per_tile = points_per_tile
+        check_numeric(self.conn, self.tablename, self.columns)
+        ensure_time_index(self.conn, self.tablename)
+        self.cache = TileCache(maxsize=cachesize)
+        self.t_first, self.t_last = None, None
+        self.refresh_timerange()
+
+    def refresh_timerange(self):
+        """(re-)read the time range of the table, which grows while logging
+
+            the tiles stay valid while rows are only appended,
+            if older rows were removed (or the table was replaced), all are dropped
+        """
+        t_first, t_last = get_timerange(self.conn, self.tablename)
+        if t_first != self.t_first or (t_last or 0) < (self.t_last or 0):
+            self.cache.clear()
+        self.t_first, self.t_last = t_first, t_last
+
+    def overview(self, points=2000):
+        """coarse, strided overview of the whole table"""
+        self.refresh_timerange()
+        return fetch_overview(self.conn, self.tablename, self.columns, points=points)
+
+    @staticmethod
+    def _exponent(t_start, t_stop):
+        """exponent of the grid, for tiles about as long as the range"""
+        return int(math.floor(math.log2(max(t_stop - t_start, 1e-6))))
+
+    def tile(self, exponent, index):
+        """return the tile 'index' of the grid with tiles of 2**exponent seconds,
+            fetch it if not cached, or if it was open (not complete) and newer rows arrived
+        """
+        key = (exponent, index)
+        cached = self.cache.get(key)
+        if cached is not None and (cached[1] is None or cached[1] == self.t_last):
+            return cached[0]
+        length = 2.**exponent
+        t_start = index * length
+        data = fetch_range(self.conn, self.tablename, self.columns,
+                           t_start, t_start + length, points=self.points_per_tile)
+        # complete once the table has rows after the end of the tile (times only grow),
+        # open tiles remember up to which row they are complete
+        self.cache.put(key, (data, None if t_start + length < self.t_last else self.t_last))
+        return data
+
+    def fetch(self, t_start, t_stop):
+        """return the data for the time range [t_start, t_stop],
+            assembled from the tiles of a fitting resolution
+
+            returns:
+                float array of shape (len(self.columns), n)
+        """
+        self.refresh_timerange()
+        if self.t_first is None:
+            return np.empty((len(self.columns), 0))
+        t_start = max(t_start, self.t_first)
+        t_stop = min(t_stop, self.t_last)
+        if t_stop < t_start:
+            return np.empty((len(self.columns), 0))
+        exponent = self._exponent(t_start, t_stop)
+        length = 2.**exponent
+        first = int(t_start // length)
+        last = int(t_stop // length)
+        tiles = [self.tile(exponent, index) for index in range(first, last + 1)]
+        data = np.concatenate(tiles, axis=1)
+        # tiles share their borders, remove duplicate rows
+        __, unique = np.unique(data[self._idx_time], return_index=True)
+        return data[:, unique]
@@ -0,0 +1,176 @@
+"""Scheduling of the access to a shared GPIB bus
+
+All instruments on one GPIB bus (e.g. the LakeShore350 and the Keithleys
+on GPIB0) share one BusScheduler, which grants the bus to one transaction
+at a time. Waiting transactions are served by priority class:
+    SETPOINT (writing setpoints) > TRIGGER (measurement triggers, readings)
+        > MONITOR (monitoring polls)
+first come, first served within a class. For fairness, a waiting transaction
+is promoted by one class for every `aging` seconds it has waited, so that
+monitoring is delayed, but never starved.
+
+The bus occupancy is counted per device, see BusScheduler.get_statistics.
+
+Usage (in a driver):
+    self.CommunicationLock = gpib_bus.bus_for(InstrumentAddress).device(InstrumentAddress)
+    with self.CommunicationLock:                      # default priority (MONITOR)
+        answer = self.device.query(command)
+    with self.CommunicationLock(gpib_bus.SETPOINT):   # explicit priority
+        self.device.write(command)
+
+Functions:
+    get_bus: the scheduler of a bus, by name
+    bus_for: the scheduler of the bus an address belongs to
+
+Classes:
+    BusScheduler: grants the bus to one transaction at a time, by priority
+    BusDevice: handle of one device on a bus, usable like a lock
+"""
+
+import time
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# priority classes, lower is served first
+SETPOINT = 0
+TRIGGER = 1
+MONITOR = 2
+priority_names = {SETPOINT: 'setpoint', TRIGGER: 'trigger', MONITOR: 'monitor'}
+
+
+class BusScheduler(object):
+    """grants a bus to one transaction at a time, by priority class, with aging"""
+
+    def __init__(self, name, aging=0.5):
+        super(BusScheduler, self).__init__()
+        self.name = name
+        self.aging = aging
+        self._condition = threading.Condition()
+        self._owner = None
+        self._granted = 0.
+        # waiting requests: (priority, arrival, sequence number, device)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.reset_statistics()
+
+    def _rank(self, request, now):
+        priority, arrival, sequence, __ = request
+        return (priority - int((now - arrival) / self.aging), arrival, sequence)
+
+    def _next(self):
+        now = time.monotonic()
+        return min(self._waiting, key=lambda request: self._rank(request, now))
+
+    def acquire(self, device, priority=MONITOR):
+        """wait until the bus is granted to device, for one transaction"""
+        with self._condition:
+            request = (priority, time.monotonic(), next(self._sequence), device)
+            self._waiting.append(request)
+            while self._owner is not None or self._next() is not request:
+                self._condition.wait()
+            self._waiting.remove(request)
+            self._owner = device
+            self._granted = time.monotonic()
+
+            waited = self._granted - request[1]
+            statistics = self._statistics[device]
+            statistics['transactions'] += 1
+            statistics['per_priority'][priority_names[priority]] += 1
+            statistics['waited'] += waited
+            statistics['max_wait'] = max(statistics['max_wait'], waited)
+
+    def release(self, device):
+        """give the bus free for the next transaction"""
+        with self._condition:
+            if self._owner != device:
+                raise AssertionError('{}: {} released the bus, but {} holds it'.format(
+                    self.name, device, self._owner))
+            self._statistics[device]['busy'] += time.monotonic() - self._granted
+            self._owner = None
+            self._condition.notify_all()
+
+    def device(self, name, priority=MONITOR):
+        """handle for one device on this bus, see BusDevice"""
+        return BusDevice(self, name, priority)
+
+    def get_statistics(self):
+        """bus occupancy per device, since the last reset
+
+            returns:
+                dict: device: dict of transactions, busy (s), occupancy (fraction of the time),
+                    mean_wait (s), max_wait (s), per_priority (number of transactions)
+        """
+        with self._condition:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            statistics = dict()
+            for device, values in self._statistics.items():
+                statistics[device] = dict(transactions=values['transactions'],
+                                          busy=values['busy'],
+                                          occupancy=values['busy'] / elapsed,
+                                          mean_wait=values['waited'] / max(values['transactions'], 1),
+                                          max_wait=values['max_wait'],
+                                          per_priority=dict(values['per_priority']))
+            return statistics
+
+    def reset_statistics(self):
+        with self._condition:
+            self._started = time.monotonic()
+            self._statistics = defaultdict(lambda: dict(transactions=0, busy=0., waited=0., max_wait=0.,
+                                                        per_priority={name: 0 for name in priority_names.values()}))
+
+
+class BusDevice(object):
+    """handle of one device on a bus, usable like a lock
+
+        with handle:            one transaction at the default priority
+        with handle(priority):  one transaction at the given priority
+    """
+
+    def __init__(self, bus, name, priority=MONITOR):
+        super(BusDevice, self).__init__()
+        self.bus = bus
+        self.name = name
+        self.priority = priority
+
+    def acquire(self, priority=None):
+        self.bus.acquire(self.name, self.priority if priority is None else priority)
+
+    def release(self):
+        self.bus.release(self.name)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @contextmanager
+    def __call__(self, priority):
+        self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def get_statistics(self):
+        return self.bus.get_statistics().get(self.name, None)
+
+
+_buses = dict()
+_buses_lock = threading.Lock()
+
+
+def get_bus(name):
+    """the scheduler of the bus with this name (e.g. 'GPIB0'), created on first use"""
+    with _buses_lock:
+        if name not in _buses:
+            _buses[name] = BusScheduler(name)
+        return _buses[name]
+
+
+def bus_for(address):
+    """the scheduler of the bus an address belongs to, e.g. 'GPIB0::12::INSTR' -> GPIB0"""
+    return get_bus(address.split('::')[0].upper())
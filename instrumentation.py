@@ -0,0 +1,247 @@
+"""Instrumentation of the instrument transports
+
+The drivers (AbstractSerialDeviceDriver, LakeShore350, Keithley2182) report
+every transaction here: how long the reply took, how long the thread waited
+for the communication lock (or the bus), the bytes sent and received, and
+errors (timeouts, garbage replies, ...). Everything is counted per instrument
+and per command, latencies and lock waits are kept as histograms with fixed,
+logarithmic bins, so that recording costs a few additions.
+
+Commands are told apart by their name, not by their arguments:
+    'R1', 'R7' -> 'R'       'KRDG? 0' -> 'KRDG?'       'SETP 1,5' -> 'SETP'
+
+Usage (in a driver):
+    with instrumentation.measure(self.instrument_name, command, self.CommunicationLock, len(command)) as transaction:
+        answer = self.device.query(command)
+        transaction.received = len(answer)
+
+    statistics = instrumentation.get_statistics()   # live view, see util.Window_transport_statistics
+    row = instrumentation.get_row()                 # interval summary for the logger database
+
+Functions:
+    command_key: the name of a command, without its arguments
+    record: register one transaction
+    measure: context manager timing one transaction, including the wait for a lock
+    get_statistics: all counters, per instrument and command
+    get_row: summary per instrument since the last call, as one flat dict
+    reset: clear all counters
+"""
+
+import re
+import time
+import bisect
+import threading
+from collections import defaultdict
+from math import nan
+from contextlib import contextmanager
+
+# set False to switch the recording off
+enabled = True
+
+# upper edges of the histogram bins, in ms: five bins per decade, 0.1 ms to 10 s
+bin_edges = [round(0.1 * 10**(index / 5.), 4) for index in range(26)]
+
+# VISA status code of a timeout
+VI_ERROR_TMO = -1073807339
+
+_command_name = re.compile(r'\$?[*A-Za-z:]+\??')
+
+
+def command_key(command):
+    """the name of a command, without its arguments, compound commands are marked with ';...'"""
+    match = _command_name.match(command.lstrip())
+    key = match.group(0) if match else command[:8]
+    return key + ';...' if ';' in command else key
+
+
+def error_name(error):
+    """short name of an error, 'timeout' for visa timeouts"""
+    if getattr(error, 'error_code', None) == VI_ERROR_TMO:
+        return 'timeout'
+    return type(error).__name__
+
+
+def _new_entry():
+    return dict(transactions=0, latency=0., latency_max=0., latency_histogram=[0] * (len(bin_edges) + 1),
+                waited=0., waited_max=0., waited_histogram=[0] * (len(bin_edges) + 1),
+                sent=0, received=0, errors=defaultdict(int))
+
+
+def _percentile(histogram, fraction):
+    """upper edge of the bin holding the given fraction of the entries (in ms, at most the last edge),
+        None if empty
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    counted = 0
+    for index, count in enumerate(histogram):
+        counted += count
+        if counted >= fraction * total:
+            return bin_edges[min(index, len(bin_edges) - 1)]
+
+
+def _or_nan(value):
+    return nan if value is None else float(value)
+
+
+class Instrumentation(object):
+    """counters of the transactions, per instrument and command"""
+
+    def __init__(self):
+        super(Instrumentation, self).__init__()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.time()
+            self._entries = defaultdict(lambda: defaultdict(_new_entry))
+            self._last_row = dict()
+
+    def record(self, instrument, command, latency, waited=0., sent=0, received=0, error=None):
+        """register one transaction
+
+            latency, waited: in s
+            sent, received: number of bytes
+            error: exception or short name of the error, if the transaction failed
+        """
+        if not enabled:
+            return
+        latency, waited = latency * 1e3, waited * 1e3
+        key = command_key(command)
+        with self._lock:
+            entry = self._entries[instrument][key]
+            entry['transactions'] += 1
+            entry['latency'] += latency
+            entry['latency_max'] = max(entry['latency_max'], latency)
+            entry['latency_histogram'][bisect.bisect_left(bin_edges, latency)] += 1
+            entry['waited'] += waited
+            entry['waited_max'] = max(entry['waited_max'], waited)
+            entry['waited_histogram'][bisect.bisect_left(bin_edges, waited)] += 1
+            entry['sent'] += sent
+            entry['received'] += received
+            if error is not None:
+                entry['errors'][error if isinstance(error, str) else error_name(error)] += 1
+
+    def get_statistics(self):
+        """all counters since the last reset
+
+            returns:
+                dict: instrument: dict: command: dict of
+                    transactions, latency_mean, latency_p50, latency_p99, latency_max (ms),
+                    waited_mean, waited_p99, waited_max (ms, for the lock),
+                    sent, received (bytes), errors (dict: name: number),
+                    latency_histogram (counts per bin, see bin_edges)
+        """
+        with self._lock:
+            statistics = dict()
+            for instrument, commands in self._entries.items():
+                statistics[instrument] = dict()
+                for key, entry in commands.items():
+                    transactions = max(entry['transactions'], 1)
+                    statistics[instrument][key] = dict(
+                        transactions=entry['transactions'],
+                        latency_mean=entry['latency'] / transactions,
+                        latency_p50=_percentile(entry['latency_histogram'], 0.5),
+                        latency_p99=_percentile(entry['latency_histogram'], 0.99),
+                        latency_max=entry['latency_max'],
+                        waited_mean=entry['waited'] / transactions,
+                        waited_p99=_percentile(entry['waited_histogram'], 0.99),
+                        waited_max=entry['waited_max'],
+                        sent=entry['sent'],
+                        received=entry['received'],
+                        errors=dict(entry['errors']),
+                        latency_histogram=list(entry['latency_histogram']))
+            return statistics
+
+    def get_row(self):
+        """summary per instrument of the transactions since the last call, as one flat dict
+
+            keys are '<instrument>_<value>' (instrument reduced to letters, digits and '_'),
+            values: transactions, latency_mean_ms, latency_p99_ms, waited_mean_ms,
+            waited_p99_ms, bytes, errors, timeouts
+            values without transactions are NaN, not None, so that the logger
+            creates their columns as REAL (and skips them, as NaN)
+        """
+        row = dict()
+        with self._lock:
+            for instrument, commands in self._entries.items():
+                total = _new_entry()
+                for entry in commands.values():
+                    for name in ('transactions', 'latency', 'waited', 'sent', 'received'):
+                        total[name] += entry[name]
+                    for name in ('latency_histogram', 'waited_histogram'):
+                        total[name] = [a + b for a, b in zip(total[name], entry[name])]
+                    total['errors']['all'] += sum(entry['errors'].values())
+                    total['errors']['timeout'] += entry['errors'].get('timeout', 0)
+                last = self._last_row.get(instrument, _new_entry())
+                self._last_row[instrument] = total
+
+                transactions = total['transactions'] - last['transactions']
+                latency_histogram = [a - b for a, b in zip(total['latency_histogram'], last['latency_histogram'])]
+                waited_histogram = [a - b for a, b in zip(total['waited_histogram'], last['waited_histogram'])]
+                name = re.sub(r'\W+', '_', instrument).strip('_')
+                row.update({
+                    name + '_transactions': transactions,
+                    name + '_latency_mean_ms': (total['latency'] - last['latency']) / transactions
+                    if transactions else nan,
+                    name + '_latency_p99_ms': _or_nan(_percentile(latency_histogram, 0.99)),
+                    name + '_waited_mean_ms': (total['waited'] - last['waited']) / transactions
+                    if transactions else nan,
+                    name + '_waited_p99_ms': _or_nan(_percentile(waited_histogram, 0.99)),
+                    name + '_bytes': total['sent'] + total['received'] - last['sent'] - last['received'],
+                    name + '_errors': total['errors']['all'] - last['errors']['all'],
+                    name + '_timeouts': total['errors']['timeout'] - last['errors']['timeout']})
+        return row
+
+
+class Transaction(object):
+    """one transaction being measured, the driver fills in the received bytes"""
+
+    __slots__ = ('received',)
+
+    def __init__(self):
+        self.received = 0
+
+
+@contextmanager
+def measure(instrument, command, lock, sent=0):
+    """time one transaction, including the wait for lock (entered here)
+
+        yields a Transaction, set its received to the number of bytes received
+        errors raised within are recorded, and raised again
+    """
+    requested = time.monotonic()
+    with lock:
+        started = time.monotonic()
+        transaction = Transaction()
+        error = None
+        try:
+            yield transaction
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            instrumentation.record(instrument, command, time.monotonic() - started, started - requested,
+                                   sent, transaction.received, error)
+
+
+instrumentation = Instrumentation()
+
+
+def record(instrument, command, latency, waited=0., sent=0, received=0, error=None):
+    """register one transaction, see Instrumentation.record"""
+    instrumentation.record(instrument, command, latency, waited, sent, received, error)
+
+
+def get_statistics():
+    return instrumentation.get_statistics()
+
+
+def get_row():
+    return instrumentation.get_row()
+
+
+def reset():
+    instrumentation.reset()
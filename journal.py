@@ -0,0 +1,410 @@
+"""Record and replay of the instrument traffic
+
+Recording: every exchange on the VISA sessions of the connection pool (see
+connection_pool.ManagedResource) is written to a journal file, with
+timestamps: the commands sent, the replies received, and the errors.
+The file has a fixed size, it is a ring buffer: once it is full, the
+oldest records are overwritten. It is memory mapped, recording a
+transaction costs no system call.
+
+    journal.start('traffic.journal', capacity=16 * 2**20)
+    ...
+    journal.stop()
+
+    python journal.py traffic.journal      # print the records
+
+Replay: a ReplayResourceManager hands out resources which answer the
+commands with the replies from a journal, either at the original speed
+(replies take as long as they took when recording) or at maximum speed.
+The drivers and updaters run unchanged on top, e.g. as a regression
+benchmark:
+
+    connection_pool.set_manager(journal.ReplayResourceManager('traffic.journal', speed='max'))
+    updater = ITC_Updater(InstrumentAddress='ASRL6::INSTR')
+    started = time.monotonic()
+    for _ in range(100):
+        updater.running()
+    print(time.monotonic() - started)
+
+(the pacing gaps of the Oxford drivers still apply, set their delay and
+delay_min to 0 to measure the Python side only)
+
+The exchanges are matched per address, by the command: commands which
+arrive in a slightly different order than recorded (several threads on
+one port) are still answered with their own replies, commands which are
+not found are answered with the next reply, and counted as mismatches.
+Reads without a command and serial polls (status byte) are matched by the
+kind of their reply, so that polling in between does not shift the reads.
+
+File format (little endian):
+    header: magic, version, capacity, head, tail, number of records,
+        and a table of the addresses (channels), see header_format
+    records: timestamp (time.time(), double), kind, channel, length, data
+
+Functions:
+    start: start recording to a journal file
+    stop: stop recording, close the file
+    read_records: all records of a journal file, oldest first
+
+Classes:
+    Journal: ring buffer of records in a memory mapped file
+    ReplayResourceManager: opens ReplayResources on a journal
+    ReplayResource: answers the commands from the journal
+"""
+
+import os
+import sys
+import mmap
+import time
+import array
+import struct
+import threading
+from collections import defaultdict
+
+from pyvisa.errors import VisaIOError
+
+# kinds of records
+WRITE = 1
+READ = 2
+ERROR = 3
+STB = 4
+VALUES = 5
+# marks the unused end of the ring buffer, reading continues at its start
+WRAP = 0xFF
+kind_names = {WRITE: 'write', READ: 'read', ERROR: 'error', STB: 'stb', VALUES: 'values'}
+
+magic = b'CRYJ'
+version = 1
+max_channels = 64
+channel_length = 64
+# magic, version, capacity, head, tail, number of records
+header_format = '<4sHIIIQ'
+header_size = struct.calcsize(header_format) + max_channels * channel_length
+record_format = '<dBBH'
+record_size = struct.calcsize(record_format)
+
+timeouterror = VisaIOError(-1073807339)
+
+
+def error_code(error):
+    """visa status code of an error, 0 if it has none"""
+    code = getattr(error, 'error_code', None)
+    if code is None and error.args and isinstance(error.args[0], int):
+        code = error.args[0]
+    return code or 0
+
+
+class Journal(object):
+    """ring buffer of records in a memory mapped file
+
+        capacity: number of bytes for the records (without the header)
+        an existing journal file is continued, if its capacity matches
+    """
+
+    def __init__(self, filename, capacity=16 * 2**20):
+        super(Journal, self).__init__()
+        self.filename = filename
+        self._lock = threading.Lock()
+        size = header_size + capacity
+        fresh = not os.path.exists(filename) or os.path.getsize(filename) != size
+        self._file = open(filename, 'w+b' if fresh else 'r+b')
+        if fresh:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self.channels = dict()
+        if fresh:
+            self.capacity, self.head, self.tail, self.count = capacity, 0, 0, 0
+            self._write_header()
+        else:
+            self._read_header()
+            if self.capacity != capacity:
+                raise AssertionError('Journal: {} has a different capacity'.format(filename))
+
+    def _read_header(self):
+        read_magic, read_version, self.capacity, self.head, self.tail, self.count = struct.unpack_from(
+            header_format, self._map, 0)
+        if read_magic != magic or read_version != version:
+            raise AssertionError('Journal: {} is not a journal (version {})'.format(self.filename, version))
+        offset = struct.calcsize(header_format)
+        for channel in range(max_channels):
+            name = bytes(self._map[offset + channel * channel_length:
+                                   offset + (channel + 1) * channel_length]).rstrip(b'\0')
+            if name:
+                self.channels[name.decode()] = channel
+
+    def _write_header(self):
+        struct.pack_into(header_format, self._map, 0, magic, version,
+                         self.capacity, self.head, self.tail, self.count)
+
+    def channel(self, address):
+        """the number of an address in the table of the header, added if new"""
+        if address not in self.channels:
+            if len(self.channels) >= max_channels:
+                raise AssertionError('Journal: more than {} addresses'.format(max_channels))
+            channel = len(self.channels)
+            offset = struct.calcsize(header_format) + channel * channel_length
+            self._map[offset:offset + channel_length] = address.encode()[:channel_length].ljust(channel_length, b'\0')
+            self.channels[address] = channel
+        return self.channels[address]
+
+    def _evict(self, start, end):
+        """drop the oldest records, as long as they lie within [start, end)"""
+        while self.count and start <= self.tail < end:
+            if self.capacity - self.tail < record_size or self._map[header_size + self.tail + 8] == WRAP:
+                self.tail = 0
+                continue
+            length = struct.unpack_from(record_format, self._map, header_size + self.tail)[3]
+            self.tail += record_size + length
+            self.count -= 1
+            if self.tail >= self.capacity:
+                self.tail = 0
+
+    def record(self, address, kind, data=b'', timestamp=None):
+        """append a record, overwriting the oldest ones if necessary"""
+        if isinstance(data, str):
+            data = data.encode('latin-1', 'replace')
+        data = data[:min(self.capacity // 4, 0xFFFF)]
+        size = record_size + len(data)
+        with self._lock:
+            channel = self.channel(address)
+            if self.head + size > self.capacity:
+                # does not fit at the end: mark the rest as unused, continue at the start
+                self._evict(self.head, self.capacity)
+                if self.capacity - self.head >= record_size:
+                    struct.pack_into(record_format, self._map, header_size + self.head, 0., WRAP, 0, 0)
+                self.head = 0
+            self._evict(self.head, self.head + size)
+            struct.pack_into(record_format, self._map, header_size + self.head,
+                             time.time() if timestamp is None else timestamp, kind, channel, len(data))
+            offset = header_size + self.head + record_size
+            self._map[offset:offset + len(data)] = data
+            self.head += size
+            self.count += 1
+            self._write_header()
+
+    def record_operation(self, address, operation, args, started, result=None, error=None):
+        """record one operation on a visa resource (see connection_pool.ManagedResource._operate)"""
+        if operation in ('write', 'write_raw', 'query', 'query_binary_values', 'query_ascii_values'):
+            self.record(address, WRITE, args[0], started)
+        elif operation not in ('read', 'read_raw', 'read_bytes', 'read_stb'):
+            return
+        if error is not None:
+            self.record(address, ERROR, str(error_code(error)))
+        elif operation in ('query', 'read', 'read_raw', 'read_bytes'):
+            self.record(address, READ, result)
+        elif operation == 'read_stb':
+            self.record(address, STB, str(int(result)))
+        elif operation in ('query_binary_values', 'query_ascii_values'):
+            self.record(address, VALUES, array.array('d', result).tobytes())
+
+    def records(self):
+        """all records, oldest first, as (timestamp, kind, address, data)"""
+        addresses = {channel: address for address, channel in self.channels.items()}
+        with self._lock:
+            position, records = self.tail, []
+            while len(records) < self.count:
+                if self.capacity - position < record_size or self._map[header_size + position + 8] == WRAP:
+                    position = 0
+                    continue
+                timestamp, kind, channel, length = struct.unpack_from(record_format, self._map,
+                                                                      header_size + position)
+                offset = header_size + position + record_size
+                records.append((timestamp, kind, addresses.get(channel, str(channel)),
+                                bytes(self._map[offset:offset + length])))
+                position += record_size + length
+        return records
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+recorder = None
+
+
+def start(filename, capacity=16 * 2**20):
+    """start recording the traffic of all sessions of the connection pool to filename"""
+    global recorder
+    recorder = Journal(filename, capacity)
+    return recorder
+
+
+def stop():
+    """stop recording, close the journal file"""
+    global recorder
+    if recorder is not None:
+        journal, recorder = recorder, None
+        journal.close()
+
+
+def read_records(filename):
+    """all records of a journal file, oldest first, as (timestamp, kind, address, data)"""
+    with open(filename, 'rb') as handle:
+        capacity = struct.unpack_from(header_format, handle.read(struct.calcsize(header_format)))[2]
+    journal = Journal(filename, capacity)
+    try:
+        return journal.records()
+    finally:
+        journal.close()
+
+
+class Exchange(object):
+    """one command and the replies which followed it (command None for replies without one)"""
+
+    __slots__ = ('command', 'sent', 'replies')
+
+    def __init__(self, command, sent):
+        self.command = command
+        self.sent = sent
+        self.replies = []
+
+
+class ReplayResource(object):
+    """answers commands with the replies from a journal, see ReplayResourceManager"""
+
+    def __init__(self, address, exchanges, speed='original', lookahead=32):
+        super(ReplayResource, self).__init__()
+        self.address = address
+        self.speed = speed
+        self.lookahead = lookahead
+        self.mismatches = 0
+        self.timeout = 500
+        self._exchanges = exchanges
+        self._lock = threading.Lock()
+        # replies of the current exchange: (delay after the command, kind, data)
+        self._pending = []
+        self._sent = 0.
+
+    def _take(self, command, kinds=()):
+        """the next unused exchange for command, looking ahead for one which matches
+            without a command (reads, serial polls), it has to start with a reply of one of the kinds
+        """
+        for index, exchange in enumerate(self._exchanges[:self.lookahead]):
+            if exchange.command != command:
+                continue
+            if command is None and not (exchange.replies and exchange.replies[0][1] in kinds):
+                continue
+            return self._exchanges.pop(index)
+        if not self._exchanges:
+            raise AssertionError('Replay: end of the journal for {}'.format(self.address))
+        if command is None:
+            # a read without a command, nothing was recorded for it
+            return None
+        self.mismatches += 1
+        return self._exchanges.pop(0)
+
+    def write(self, message):
+        with self._lock:
+            exchange = self._take(message.encode('latin-1', 'replace'))
+            self._sent = time.monotonic()
+            self._pending = [(timestamp - exchange.sent, kind, data) for timestamp, kind, data in exchange.replies]
+
+    def _reply(self, kinds):
+        with self._lock:
+            if not self._pending:
+                # a read may also have been recorded as failed
+                exchange = self._take(None, kinds + (ERROR,))
+                if exchange is None:
+                    if self.speed == 'original':
+                        time.sleep(self.timeout / 1e3)
+                    raise timeouterror
+                self._sent = time.monotonic()
+                self._pending = [(0., kind, data) for __, kind, data in exchange.replies]
+            delay, kind, data = self._pending.pop(0)
+        if self.speed == 'original':
+            remaining = self._sent + delay - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        if kind == ERROR:
+            raise VisaIOError(int(data))
+        if kind not in kinds:
+            self.mismatches += 1
+        return data
+
+    def read_raw(self):
+        return self._reply((READ,))
+
+    def read(self):
+        return self.read_raw().decode('latin-1')
+
+    def read_bytes(self, count):
+        return self.read_raw()[:count]
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def query_binary_values(self, message, *args, **kwargs):
+        self.write(message)
+        return list(array.array('d', self._reply((VALUES,))))
+
+    query_ascii_values = query_binary_values
+
+    def read_stb(self):
+        with self._lock:
+            exchange = self._take(None, (STB,))
+        return int(exchange.replies[0][2]) if exchange is not None and exchange.replies else 0
+
+    def wait_on_event(self, event_type, timeout, *args):
+        if self.speed == 'original':
+            time.sleep(timeout / 1e3)
+        raise timeouterror
+
+    def enable_event(self, *args):
+        pass
+
+    def disable_event(self, *args):
+        pass
+
+    def discard_events(self, *args):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+    def close(self):
+        pass
+
+
+class ReplayResourceManager(object):
+    """opens ReplayResources, which answer from the exchanges recorded in a journal
+
+        speed: 'original' (replies take as long as when recording) or 'max'
+        use it for all sessions with connection_pool.set_manager
+    """
+
+    def __init__(self, filename, speed='original'):
+        super(ReplayResourceManager, self).__init__()
+        if speed not in ('original', 'max'):
+            raise AssertionError('Replay: speed must be "original" or "max", not {}'.format(speed))
+        self.speed = speed
+        self.exchanges = defaultdict(list)
+        for timestamp, kind, address, data in read_records(filename):
+            exchanges = self.exchanges[address]
+            if kind == WRITE:
+                exchanges.append(Exchange(data, timestamp))
+            elif kind == STB:
+                # serial polls are answered in their own order, see ReplayResource.read_stb
+                exchanges.append(Exchange(None, timestamp))
+                exchanges[-1].replies.append((timestamp, kind, data))
+            else:
+                if not exchanges or (exchanges[-1].command is None and exchanges[-1].replies):
+                    exchanges.append(Exchange(None, timestamp))
+                exchanges[-1].replies.append((timestamp, kind, data))
+        self.resources = dict()
+
+    def open_resource(self, address):
+        if address not in self.resources:
+            self.resources[address] = ReplayResource(address, list(self.exchanges.get(address, [])), self.speed)
+        return self.resources[address]
+
+    def list_resources(self):
+        return tuple(self.exchanges)
+
+
+if __name__ == '__main__':
+    for timestamp, kind, address, data in read_records(sys.argv[1]):
+        print('{:.6f} {:>20} {:>6} {!r}'.format(timestamp, address, kind_names.get(kind, kind), data))
@@ -216,6 +216,7 @@ class main_Logger(AbstractLoopThread):
 
         self.mainthread.sig_logging.connect(self.store_data)
         self.mainthread.sig_logging_newconf.connect(self.update_conf)
+        self.mainthread.sig_logging_block.connect(self.store_block)
 
         QTimer.singleShot(5e2, lambda: self.sig_configuring.emit(True))
         self.configuration_done = False
@@ -223,6 +224,7 @@ class main_Logger(AbstractLoopThread):
 
         self.not_yet_initialised = False
         self.local_list = []
+        self.local_blocks = []
 
     def running(self):
 
@@ -250,6 +252,8 @@ class main_Logger(AbstractLoopThread):
         self.interval = self.conf['general']['interval']
         self.configuration_done = True
         self.conf_done_layer2 = False
+        # blocks which arrived before the configuration
+        self.store_local_blocks()
 
     def connectdb(self, dbname):
         """connect to the sqlite database"""
@@ -274,6 +278,9 @@ class main_Logger(AbstractLoopThread):
         except OperationalError as err:
             # print(err)
             pass
+        # the time index keeps selecting time ranges (for plotting) fast
+        self.mycursor.execute("""CREATE INDEX IF NOT EXISTS idx_{table}_timeseconds
+                                 ON {table} (timeseconds)""".format(table=tablename))
 
         #We should try to find a nicer a solution without try and except
         # #try:
@@ -410,7 +417,7 @@ class main_Logger(AbstractLoopThread):
         if self.not_yet_initialised:
             return
 
-        names = ['ITC', 'ILM', 'IPS', 'LakeShore350']
+        names = ['ITC', 'ILM', 'IPS', 'LakeShore350', 'Transport']
         timedict = {'timeseconds': time.time(),
                     'ReadableTime': convert_time(time.time())}
 
@@ -445,9 +452,57 @@ class main_Logger(AbstractLoopThread):
 
         # data.update(timedict)
 
+    @pyqtSlot(str, dict)
+    def store_block(self, tablename, block):
+        """store a block of readings (dict of equally long numpy arrays,
+            one of them 'timeseconds'), one row per reading
+            blocks are kept locally until the logger is configured
+            and the database can be reached
+        """
+        if self.not_yet_initialised:
+            return
+        self.local_blocks.append((tablename, block))
+        if self.configuration_done:
+            self.store_local_blocks()
+
+    def store_local_blocks(self):
+        """store all blocks kept locally, in the order they arrived"""
+        if not self.local_blocks:
+            return
+        if not self.connectdb(self.conf['general']['logfile_location']):
+            self.sig_assertion.emit('no connection, storing locally')
+            return
+        while self.local_blocks:
+            tablename, block = self.local_blocks[0]
+            try:
+                keys = list(block)
+                rows = np.column_stack([np.asarray(block[key], dtype=float) for key in keys]).tolist()
+                if rows:
+                    with self.conn:
+                        self.mycursor = self.conn.cursor()
+                        self.createtable(tablename, {key: 0. for key in keys})
+                        sql = """INSERT INTO {} ({}) VALUES ({})""".format(
+                            tablename, ','.join(keys), ','.join('?' * len(keys)))
+                        self.mycursor.executemany(sql, rows)
+            except OperationalError as e:
+                # e.g. the database is locked, tried again with the next block
+                self.sig_assertion.emit('Logger: {}: {}'.format(tablename, e.args[0]))
+                return
+            except (sqlite3.Error, ValueError) as er:
+                # this block cannot be stored at all
+                self.sig_assertion.emit('Logger: {}: {}'.format(tablename, er.args[0]))
+            self.local_blocks.pop(0)
+
 
 class live_Logger(AbstractLoopThread):
-    """docstring for live_Logger"""
+    """Thread appending the current data of all instruments to the live data lists
+
+        every instrument gets a list 'timeseconds' alongside its values,
+        to be used as common time axis for all values of the instrument
+        sig_appended is emitted after every appending step
+    """
+
+    sig_appended = pyqtSignal()
 
     def __init__(self, mainthread, **kwargs):
         super(live_Logger, self).__init__()
@@ -501,12 +556,19 @@ class live_Logger(AbstractLoopThread):
             with self.mainthread.dataLock:
                 with self.mainthread.dataLock_live:
                     # print(self.mainthread.data_live)
+                    timeseconds = time.time()
                     for instr in self.mainthread.data:
                         for varkey in self.mainthread.data[instr]:
+                            if varkey == 'timeseconds':
+                                continue
                             self.mainthread.data_live[instr][varkey].append(
                                 self.mainthread.data[instr][varkey])
                             if len(self.mainthread.data_live[instr][varkey]) > 1800:
                                 self.mainthread.data_live[instr][varkey].pop(0)
+                        self.mainthread.data_live[instr]['timeseconds'].append(timeseconds)
+                        if len(self.mainthread.data_live[instr]['timeseconds']) > 1800:
+                            self.mainthread.data_live[instr]['timeseconds'].pop(0)
+            self.sig_appended.emit()
 
         except AssertionError as assertion:
             self.sig_assertion.emit(assertion.args[0])
@@ -524,6 +586,7 @@ class live_Logger(AbstractLoopThread):
                 for instrument in self.mainthread.data:
                     for variablekey in self.mainthread.data[instrument]:
                         self.mainthread.data_live[instrument][variablekey] = []
+                    self.mainthread.data_live[instrument]['timeseconds'] = []
         self.initialised = True
 
 
@@ -45,18 +45,62 @@ from Oxford.ITC_control import ITC_Updater
 from Oxford.ILM_control import ILM_Updater
 from Oxford.IPS_control import IPS_Updater
 from LakeShore.LakeShore350_Control import LakeShore350_Updater
+from LakeShore.LakeShore350_Control import LakeShore350_Events
+from Keithley.Keithley6221_Control import Keithley6221_Updater
 
 from pyvisa.errors import VisaIOError
 
 from logger import main_Logger, live_Logger
 from logger import Logger_configuration
 from util import Window_ui, Window_plotting
-
-
+from util import Window_plotting_database
+from util import Window_dashboard
+from util import Window_transport_statistics
+from util import Window_Keithley6221
+from util import AbstractLoopThread
+from async_transport import AsyncPoller
+import instrumentation
+import journal
+import connection_pool
+from database_query import get_tablenames
+from database_query import get_columnnames
+from database_query import TIMECOLUMN
+
+
+# Oxford instruments daisy-chained on one port (ISOBUS) are addressed as e.g. 'ASRL6::INSTR@1'
 ITC_Instrumentadress = 'ASRL6::INSTR'
 ILM_Instrumentadress = 'ASRL5::INSTR'
 IPS_Instrumentadress = 'ASRL4::INSTR'
 LakeShore_InstrumentAddress = 'GPIB0::1::INSTR'
+Keithley6221_InstrumentAddress = 'GPIB0::12::INSTR'
+
+# run against simulated instruments (see simulation.py): python mainWindow.py --simulate
+if '--simulate' in sys.argv:
+    ITC_Instrumentadress = 'SIM::ITC503'
+    ILM_Instrumentadress = 'SIM::ILM211'
+    IPS_Instrumentadress = 'SIM::IPS120'
+    LakeShore_InstrumentAddress = 'SIM::LakeShore350'
+    Keithley6221_InstrumentAddress = 'SIM::Keithley6221'
+
+# record all instrument traffic to a journal file (ring buffer, see journal.py):
+#   python mainWindow.py --journal traffic.journal
+# or answer all commands from a recorded journal, instead of the instruments:
+#   python mainWindow.py --replay traffic.journal
+if '--journal' in sys.argv:
+    journal.start(sys.argv[sys.argv.index('--journal') + 1])
+if '--replay' in sys.argv:
+    connection_pool.set_manager(journal.ReplayResourceManager(sys.argv[sys.argv.index('--replay') + 1]))
+
+# how the instrument updaters are run: 'threads' (one QThread each),
+# or 'asyncio' (the updaters with asynchronous polling, the Oxford instruments,
+# are polled as coroutines on one shared event loop, see async_io and
+# async_transport, the others keep their QThread)
+Instrument_transport = 'threads'
+
+# backend for plotting live data, 'qpainter' (fast) or 'matplotlib' (export-quality)
+Plotting_backend_live = 'qpainter'
+# layout of the live dashboard, loaded when opening it
+Dashboard_layout = '.\\configurations\\dashboard_layout.json'
 
 
 def convert_time(ts):
@@ -70,6 +114,7 @@ class mainWindow(QtWidgets.QMainWindow):
     sig_arbitrary = pyqtSignal()
     sig_logging = pyqtSignal(dict)
     sig_logging_newconf = pyqtSignal(dict)
+    sig_logging_block = pyqtSignal(str, dict)
     sig_running_new_thread = pyqtSignal()
 
     def __init__(self, app, **kwargs):
@@ -91,6 +136,10 @@ class mainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         super(mainWindow, self).closeEvent(event)
+        for threadname in list(self.threads):
+            self.stopping_thread(threadname)
+        # release the serial ports and GPIB sessions, so they can be reopened
+        connection_pool.close_all()
         self.app.quit()
 
     def initialize_all_windows(self):
@@ -99,6 +148,7 @@ class mainWindow(QtWidgets.QMainWindow):
         self.initialize_window_IPS()
         self.initialize_window_Log_conf()
         self.initialize_window_LakeShore350()
+        self.initialize_window_Keithley6221()
         self.initialize_window_Errors()
         self.show_data()
         self.actionLogging_LIVE.triggered['bool'].connect(self.run_logger_live)
@@ -117,16 +167,26 @@ class mainWindow(QtWidgets.QMainWindow):
                 the worker class instance, useful for connecting signals directly
         """
 
-        thread = QThread()
-        self.threads[threadname] = (worker, thread)
-        worker.moveToThread(thread)
-
         if dataname in self.data or dataname == None:
             pass
         else:
             with self.dataLock:
                 self.data[dataname] = dict()
 
+        if Instrument_transport == 'asyncio' and isinstance(worker, AbstractLoopThread) \
+                and hasattr(worker, 'running_async'):
+            # instrument updaters are polled on the shared event loop, stopped like a thread,
+            # their slots are executed in the slot thread of the loop (not in the GUI thread)
+            poller = AsyncPoller(worker)
+            self.threads[threadname] = (worker, poller)
+            poller.start()
+            self.sig_running_new_thread.emit()
+            return worker
+
+        thread = QThread()
+        self.threads[threadname] = (worker, thread)
+        worker.moveToThread(thread)
+
         thread.started.connect(worker.work)
         thread.start()
         self.sig_running_new_thread.emit()
@@ -156,43 +216,68 @@ class mainWindow(QtWidgets.QMainWindow):
         """connect GUI signals for plotting, setting up some of the needs of plotting"""
         self.action_plotDatabase.triggered.connect(self.show_dataplotdb_configuration)
         self.action_plotLive.triggered.connect(self.show_dataplotlive_configuration)
+        self.action_plotDashboard = self.menuShow_Data.addAction('Dashboard')
+        self.action_plotDashboard.triggered.connect(self.show_dashboard)
+        self.action_showTransport = self.menuShow_Data.addAction('Transport statistics')
+        self.action_showTransport.triggered.connect(self.show_transport_statistics)
         self.windows_plotting = []
 
-        #  these will hold the strings which the user selects to extract the data from db with the sql query and plot it
-        #  x,y1.. is for tablenames, x,y1.._plot is for column names in the tables respectively
-        self.plotting_instrument_for_x = 0
-        self.plotting_instrument_for_y1 = 0
-        self.plotting_instrument_for_y2 = 0
+    def show_dashboard(self):
+        """
+            open the live dashboard, with the layout from Dashboard_layout,
+            redrawn whenever the live logger appended new data
+        """
+        if 'control_Logging_live' not in self.threads:
+            self.show_error_textBrowser('no live data to plot!')
+            self.show_error_textBrowser('If you want to see live data, start the live logger!')
+            return
+        try:
+            window = Window_dashboard(mainthread=self, layoutfile=Dashboard_layout)
+        except (OSError, ValueError, KeyError) as err:
+            self.show_error_textBrowser('Plotting: could not load the dashboard layout: {}'.format(err))
+            return
+        self.threads['control_Logging_live'][0].sig_appended.connect(window.refresh)
+        window.show()
+        self.windows_plotting.append(window)
 
-        self.plotting_comboValue_Axis_X_plot = 0
-        self.plotting_comboValue_Axis_Y1_plot = 0
-        self.plotting_data_y2_plot = 0
+    def show_transport_statistics(self):
+        """open the window with the latencies, lock waits and errors of the instrument transports"""
+        window = Window_transport_statistics()
+        window.show()
+        self.windows_plotting.append(window)
 
     def show_dataplotdb_configuration(self):
+        """
+            open the window for configuration of plotting data from the database,
+            fill the comboboxes with the tables (instruments) in the database,
+            connect to actions being taken in this configuration window
+        """
+        try:
+            self.dbname = self.Log_conf_window.conf['general']['logfile_location']
+            self.connectdb(self.dbname)
+            tablenames = get_tablenames(self.conn)
+        except (AssertionError, KeyError, sqlite3.Error) as err:
+            self.show_error_textBrowser('Plotting: could not open the database: {}'.format(err))
+            return
         self.dataplot_db = Window_ui(ui_file='.\\configurations\\Data_display_selection_database.ui')
+        self.dataplot_db.axes = dict()
+        self.dataplot_db.tables = dict()
         self.dataplot_db.show()
-        #  populating the combobox instruments tab with tablenames:
-        self.mycursor.execute("SELECT name FROM sqlite_master where type='table'")
-        axis2 = self.mycursor.fetchall()
-        axis2.insert(0, ("-",))
-
-        self.dataplot_db.comboInstr_Axis_X.clear()
-        self.dataplot_db.comboInstr_Axis_Y1.clear()
-        self.dataplot_db.comboInstr_Axis_Y2.clear()
-        self.dataplot_db.comboInstr_Axis_Y3.clear()
-        self.dataplot_db.comboInstr_Axis_Y4.clear()
-        self.dataplot_db.comboInstr_Axis_Y5.clear()
-
-        for i in axis2:
-            self.dataplot_db.comboInstr_Axis_X.addItems(i)
-            self.dataplot_db.comboInstr_Axis_Y1.addItems(i)
-            self.dataplot_db.comboInstr_Axis_Y2.addItems(i)
-            self.dataplot_db.comboInstr_Axis_Y3.addItems(i)
-            self.dataplot_db.comboInstr_Axis_Y4.addItems(i)
-            self.dataplot_db.comboInstr_Axis_Y5.addItems(i)
-        self.dataplot_db.comboInstr_Axis_X.activated.connect(self.selection_x)
-        self.dataplot_db.comboInstr_Axis_Y1.activated.connect(self.selection_y1)
-        self.dataplot_db.buttonBox.clicked.connect(self.plotstart)
+
+        axis_instrument = ['-'] + tablenames
+        for axis in ['X', 'Y1', 'Y2', 'Y3', 'Y4', 'Y5']:
+            GUI_instr = getattr(self.dataplot_db, 'comboInstr_Axis_{}'.format(axis))
+            GUI_value = getattr(self.dataplot_db, 'comboValue_Axis_{}'.format(axis))
+            GUI_instr.clear()
+            GUI_instr.addItems(axis_instrument)
+            GUI_instr.activated.connect(lambda value, GUI_instr=GUI_instr, GUI_value=GUI_value, axis=axis:
+                                        self.plotting_selection_instrument(GUI_value=GUI_value,
+                                                                           GUI_instr=GUI_instr,
+                                                                           livevsdb="DB",
+                                                                           axis=axis,
+                                                                           dataplot=self.dataplot_db))
+        self.dataplot_db.buttonBox.clicked.connect(lambda: self.plotstart(dataplot=self.dataplot_db))
+        self.dataplot_db.buttonBox.clicked.connect(lambda: self.dataplot_db.close())
 
     def show_dataplotlive_configuration(self):
         """
@@ -281,16 +366,12 @@ class mainWindow(QtWidgets.QMainWindow):
         if livevsdb == "LIVE":
             with self.dataLock_live:
                 value_names = list(self.data_live[instrument_name])
-        # elif livevsdb == "DB":
-        #     axis = []
-        #     self.mycursor.execute("SELECT * FROM {}".format(self.plotting_instrument_for_x))
-        #     colnames= self.mycursor.description
-            # for row in colnames:
-            #     axis.append(row[0])
+        elif livevsdb == "DB":
+            value_names = get_columnnames(self.conn, instrument_name)
         GUI_value.addItems(value_names)
         GUI_value.activated.connect(lambda: self.plotting_selection_value(GUI_instr=GUI_instr,
                                                                           GUI_value=GUI_value,
-                                                                          livevsdb="LIVE",
+                                                                          livevsdb=livevsdb,
                                                                           axis=axis,
                                                                           dataplot=dataplot))
 
@@ -305,6 +386,8 @@ class mainWindow(QtWidgets.QMainWindow):
         if livevsdb == 'LIVE':
             with self.dataLock_live:
                 dataplot.data[axis] = self.data_live[instrument_name][value_name]
+        elif livevsdb == 'DB':
+            dataplot.tables[axis] = instrument_name
 
     def plotting_display(self, dataplot):
         y = None
@@ -330,7 +413,11 @@ class mainWindow(QtWidgets.QMainWindow):
         if label_y is None:
             self.show_error_textBrowser('Plotting: You did not choose a single Y axis to plot, try again!')
             return
-        window = Window_plotting(data=data, label_x=dataplot.axes['X'], label_y=label_y, title='your advertisment could be here!')
+        # redrawn regularly, the live data is only copied again after the live logger appended to it
+        live_logger = self.threads.get('control_Logging_live', (None,))[0]
+        window = Window_plotting(data=data, label_x=dataplot.axes['X'], label_y=label_y, title='your advertisment could be here!',
+                                 backend=Plotting_backend_live, lock=self.dataLock_live,
+                                 sig_refresh=live_logger.sig_appended if live_logger is not None else None)
         window.show()
         # window.sig_closing.connect(lambda: self.deleting_object(dataplot))
         self.windows_plotting.append(window)
@@ -354,92 +441,35 @@ class mainWindow(QtWidgets.QMainWindow):
 
 
 
-    def selection_y1(self, dataplot, livevsdb):
-        dataplot.comboValue_Axis_Y1.addItems(tuple("-"))
-        instrument_for_y1 = self.dataplot.comboInstr_Axis_Y1.currentText()
-
-        axis = []
-        if livevsdb == "LIVE":
-            axis = list(self.data_live[instrument_for_y1])
-        # elif livevsdb == "DB":
-        #     self.mycursor.execute("SELECT * FROM {}".format(self.plotting_instrument_for_y1))
-        #     colnames= self.mycursor.description
-            # for row in colnames:
-            #     axis.append(row[0])
-        self.dataplot.comboValue_Axis_Y1.addItems(axis)
-        self.dataplot.comboValue_Axis_Y1.activated.connect(self.y1_changed)
-
-    def y1_changed(self):
-        self.plotting_comboValue_Axis_Y1_plot=self.dataplot.comboValue_Axis_Y1.currentText()
-
-    #gotta have an if statement for the case when x and y values are from different tables
-    def plotstart(self):
-        print(self.plotting_comboValue_Axis_X_plot,self.plotting_comboValue_Axis_Y1_plot, self.plotting_instrument_for_x)
-        array1=[]
-        array2=[]
-        if self.plotting_instrument_for_x==self.plotting_instrument_for_y1:
-            sql="SELECT {},{} from {} ".format(self.plotting_comboValue_Axis_X_plot,self.plotting_comboValue_Axis_Y1_plot,self.plotting_instrument_for_x)
-            self.mycursor.execute(sql)
-            data =self.mycursor.fetchall()
-
-            for row in data:
-                array1.append(list(row))
-
-            #this is for is for omiting 'None' values from the array, skipping this step would cause the plot to break!
-
-            nparray = np.asarray(array1)[np.asarray(array1) != np.array(None)]
-
-            #After renaming x to instrument_for_x and y1 to instrument_for_y1, the nparray became 1 dimensional, so the
-            #original code:nparray_x = nparray[:,[0]] did not work, this is a workaround, i have no idea what caused it.
-            #selecting different instruments for x and y doesn't have this problem as the data is stored in separate arrays.
-
-            nparray_x = nparray[0::2]
-            nparray_y = nparray[1::2]
-
-            plt.figure()
-            plt.plot(nparray_x,nparray_y)
-            #labels:
-            plt.xlabel(self.plotting_comboValue_Axis_X_plot)
-            plt.ylabel(self.plotting_comboValue_Axis_Y1_plot)
-
-
-            plt.draw()
-
-            plt.show()
-        else:
-            sql="SELECT {} FROM {}".format(self.plotting_comboValue_Axis_X_plot,self.plotting_instrument_for_x)
-            self.mycursor.execute(sql)
-            data=self.mycursor.fetchall()
-
-            for row in data:
-                array1.append(list(row))
-            nparray_x=np.asarray(array1)[np.asarray(array1) != np.array(None)]
-
-            sql="SELECT {} FROM {}".format(self.plotting_comboValue_Axis_Y1_plot,self.plotting_instrument_for_y1)
-            self.mycursor.execute(sql)
-            data=self.mycursor.fetchall()
-
-            for row in data:
-                array2.append(list(row))
-            nparray_y=np.asarray(array2)[np.asarray(array2) != np.array(None)]
-
-            #there can be still some problems if the dimensions don't match so:
-            if len(nparray_x)>len(nparray_y):
-                nparray_x=nparray_x[0:len(nparray_y)]
-            else:
-                nparray_y=nparray_y[0:len(nparray_x)]
-
-            plt.figure()
-            plt.plot(nparray_x,nparray_y)
-            #labels:
-            plt.xlabel(self.plotting_comboValue_Axis_X_plot+" from table: "+str(self.plotting_instrument_for_x))
-            plt.ylabel(self.plotting_comboValue_Axis_Y1_plot+" from table: "+str(self.plotting_instrument_for_y1))
-
-
-            plt.draw()
-
-            plt.show()
-
+    def plotstart(self, dataplot):
+        """
+            plot the data chosen in the database-plotting configuration window
+            the data is loaded progressively: first a coarse overview,
+            then, when zooming in, the visible time range in higher resolution
+        """
+        if 'X' not in dataplot.axes:
+            self.show_error_textBrowser('Plotting: You certainly did not choose an X axis, try again!')
+            return
+        series = []
+        for axis in ['Y1', 'Y2', 'Y3', 'Y4', 'Y5']:
+            if axis not in dataplot.axes:
+                continue
+            entry = dict(table=dataplot.tables[axis], x=dataplot.axes['X'], y=dataplot.axes[axis])
+            # values from another table are aligned on the time (every table has it)
+            if dataplot.tables[axis] != dataplot.tables['X'] and dataplot.axes['X'] != TIMECOLUMN:
+                entry['table_x'] = dataplot.tables['X']
+            series.append(entry)
+        if not series:
+            self.show_error_textBrowser('Plotting: You did not choose a single Y axis to plot, try again!')
+            return
+        window = Window_plotting_database(dbname=self.dbname,
+                                          series=series,
+                                          label_x=dataplot.axes['X'],
+                                          label_y=series[0]['y'],
+                                          title='from table: {}'.format(dataplot.tables['X']),
+                                          errors=self.show_error_textBrowser)
+        window.show()
+        self.windows_plotting.append(window)
 
     # ------- Oxford Instruments
     # ------- ------- ITC
@@ -723,8 +753,8 @@ class mainWindow(QtWidgets.QMainWindow):
                 self.IPS_window.comboSetActivity.activated['int'].connect(lambda value: self.threads['control_IPS'][0].setActivity(value))
                 self.IPS_window.comboSetSwitchHeater.activated['int'].connect(lambda value: self.threads['control_IPS'][0].setSwitchHeater(value))
 
-                self.IPS_window.spinSetFieldSetPoint.valueChanged.connect(lambda value: self.threads['control_IPS'][0].gettoset_FieldSetPoint(value))
-                self.IPS_window.spinSetFieldSetPoint.editingFinished.connect(lambda: self.threads['control_IPS'][0].setFieldSetPoint())
+                self.IPS_window.spinSetFieldSetPoint.valueChanged.connect(lambda value: self.threads['control_IPS'][0].gettoset_FieldSetpoint(value))
+                self.IPS_window.spinSetFieldSetPoint.editingFinished.connect(lambda: self.threads['control_IPS'][0].setFieldSetpoint())
 
                 self.IPS_window.spinSetFieldSweepRate.valueChanged.connect(lambda value: self.threads['control_IPS'][0].gettoset_FieldSweepRate(value))
                 self.IPS_window.spinSetFieldSweepRate.editingFinished.connect(lambda: self.threads['control_IPS'][0].setFieldSweepRate())
@@ -829,6 +859,15 @@ class mainWindow(QtWidgets.QMainWindow):
                 getInfodata.sig_assertion.connect(self.show_error_textBrowser)
                 getInfodata.sig_visatimeout.connect(lambda: self.show_error_textBrowser('LakeShore350: timeout'))
 
+                # service requests (ramp done, alarm, new reading) of the same device
+                events = self.running_thread(LakeShore350_Events(LakeShore350=getInfodata.LakeShore350),
+                                             None, 'control_LakeShore350_events')
+                events.sig_assertion.connect(self.show_error_textBrowser)
+                events.sig_visaerror.connect(self.show_error_textBrowser)
+                events.sig_alarm.connect(lambda: self.show_error_textBrowser('LakeShore350: alarm!'))
+                events.sig_ramp_done.connect(lambda output: self.show_error_textBrowser(
+                    'LakeShore350: ramp of output {} done'.format(output)))
+
                 self.func_LakeShore350_setKpminLength(5)
 
                 # setting LakeShore values by GUI LakeShore window
@@ -882,6 +921,7 @@ class mainWindow(QtWidgets.QMainWindow):
                 self.show_error_textBrowser('running: {}'.format(e))
         else:
             self.action_run_LakeShore350.setChecked(False)
+            self.stopping_thread('control_LakeShore350_events')
             self.stopping_thread('control_LakeShore350')
 
             self.LakeShore350_window.spinSetTemp_K.valueChanged.disconnect()
@@ -982,6 +1022,80 @@ class mainWindow(QtWidgets.QMainWindow):
 
 
 
+    # ------- Keithley 6221 -------
+
+    def initialize_window_Keithley6221(self):
+        """initialize the Keithley 6221 delta measurements, and the window to start and stop them"""
+        self.Keithley6221_window = Window_Keithley6221()
+        # the Keithley menu is disabled in the ui file, the nanovoltmeters are not implemented yet
+        self.menuKeithley.setEnabled(True)
+        self.action_run_Nanovolts.setEnabled(False)
+        self.action_run_Current_sources.setCheckable(True)
+        self.action_run_Current_sources.triggered['bool'].connect(self.run_Keithley6221)
+        self.action_show_Keithley6221 = self.menuShow_Info_Dock.addAction('Keithley6221')
+        self.action_show_Keithley6221.triggered.connect(self.Keithley6221_window.show)
+
+    @pyqtSlot(bool)
+    def run_Keithley6221(self, boolean):
+        """start/stop the Keithley6221 thread
+
+            measurements are started and stopped from the Keithley6221 window,
+            its signals are connected to startMeasurement and stopMeasurement
+            of the thread (queued, the slots run in the thread)
+        """
+
+        if boolean:
+            try:
+                getInfodata = self.running_thread(Keithley6221_Updater(InstrumentAddress=Keithley6221_InstrumentAddress), 'Keithley6221', 'control_Keithley6221')
+
+                getInfodata.sig_Infodata.connect(self.store_data_Keithley6221)
+                getInfodata.sig_Blockdata.connect(self.store_block_Keithley6221)
+                getInfodata.sig_visaerror.connect(self.show_error_textBrowser)
+                getInfodata.sig_assertion.connect(self.show_error_textBrowser)
+                getInfodata.sig_visatimeout.connect(lambda: self.show_error_textBrowser('Keithley6221: timeout'))
+                getInfodata.sig_Infodata.connect(self.Keithley6221_window.refresh)
+
+                self.Keithley6221_window.sig_start.connect(getInfodata.startMeasurement)
+                self.Keithley6221_window.sig_stop.connect(getInfodata.stopMeasurement)
+                self.Keithley6221_window.setConnected(True)
+                self.Keithley6221_window.show()
+
+                self.action_run_Current_sources.setChecked(True)
+
+            except VisaIOError as e:
+                self.action_run_Current_sources.setChecked(False)
+                self.show_error_textBrowser('running: {}'.format(e))
+        else:
+            self.action_run_Current_sources.setChecked(False)
+            self.Keithley6221_window.setConnected(False)
+            # nothing to stop, if starting failed
+            if 'control_Keithley6221' in self.threads:
+                worker = self.threads['control_Keithley6221'][0]
+                self.Keithley6221_window.sig_start.disconnect(worker.startMeasurement)
+                self.Keithley6221_window.sig_stop.disconnect(worker.stopMeasurement)
+                worker.stopMeasurement()
+                self.stopping_thread('control_Keithley6221')
+
+    @pyqtSlot(dict)
+    def store_data_Keithley6221(self, data):
+        """Store the Keithley6221 summary in self.data['Keithley6221']"""
+        data['date'] = convert_time(time.time())
+        with self.dataLock:
+            self.data['Keithley6221'].update(data)
+
+    @pyqtSlot(dict)
+    def store_block_Keithley6221(self, block):
+        """append a block of delta readings to the live data (at most 10000 readings),
+            and send it to the logger, which stores every reading
+        """
+        with self.dataLock_live:
+            if hasattr(self, 'data_live'):
+                live = self.data_live.setdefault('Keithley6221_readings', dict())
+                for key, values in block.items():
+                    live[key] = np.append(live.get(key, []), values)[-10000:]
+        if self.logging_running_logger:
+            self.sig_logging_block.emit('Keithley6221_readings', block)
+
     # ------- MISC -------
 
     def printing(self,b):
@@ -1005,7 +1119,7 @@ class mainWindow(QtWidgets.QMainWindow):
 
         if boolean:
             logger = self.running_thread(main_Logger(self), None, 'logger')
-            logger.sig_log.connect(lambda : self.sig_logging.emit(deepcopy(self.data)))
+            logger.sig_log.connect(self.logging_data)
             logger.sig_configuring.connect(self.show_logging_configuration)
             self.logging_running_logger = True
 
@@ -1013,6 +1127,15 @@ class mainWindow(QtWidgets.QMainWindow):
             self.stopping_thread('logger')
             self.logging_running_logger = False
 
+    @pyqtSlot()
+    def logging_data(self):
+        """send the data to be logged, with the transport statistics since the last logging step
+            (these are not part of self.data, so they do not show up in the live data)
+        """
+        data = deepcopy(self.data)
+        data['Transport'] = instrumentation.get_row()
+        self.sig_logging.emit(data)
+
     @pyqtSlot(bool)
     def show_logging_configuration(self, boolean):
         """display/close the logging configuration window"""
@@ -0,0 +1,122 @@
+"""Command line tool to render overview figures from a logging database
+
+Reads the sqlite database written by logger.main_Logger and renders
+multi-panel figures to PNG/PDF files, without Qt (matplotlib Agg canvas).
+Several figures are rendered in parallel, each in its own process.
+
+Usage:
+    python plot_database.py <configuration.json> [--database DB] [--hours H] [--workers N]
+
+The configuration file (see configurations/plot_database_example.json) holds:
+    database: path to the database (may be overridden with --database)
+    hours: time span to plot, counted back from the last entry (optional, default: everything)
+    points: maximum number of points per trace, the data is decimated accordingly
+    figures: list of figures, each of which has
+        output: filename, the extension determines the format (.png, .pdf, ...)
+        title: (optional)
+        size: [width, height] in inches (optional)
+        panels: list of panels, stacked vertically, sharing the time axis
+            table: the table (instrument) the data is taken from
+            y: list of columns to plot
+            ylabel: (optional)
+            logy: (optional) logarithmic y-axis
+"""
+
+import sys
+import json
+import sqlite3
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from database_query import fetch_range
+from database_query import get_timerange
+from database_query import TIMECOLUMN
+
+
+def read_configuration(filename):
+    """read the json configuration file"""
+    with open(filename, 'r') as handle:
+        return json.load(handle)
+
+
+def connect_readonly(dbname):
+    """open the database read-only, so a running logger is not disturbed"""
+    return sqlite3.connect('file:{}?mode=ro'.format(dbname), uri=True)
+
+
+def render_figure(dbname, figure_conf, hours=None, points=5000):
+    """render one figure to its output file
+
+        this is executed in a separate process, so it opens its own connection
+
+        returns:
+            the name of the file written
+    """
+    conn = connect_readonly(dbname)
+    panels = figure_conf['panels']
+
+    figure = Figure(figsize=figure_conf.get('size', [10, 2.5 * len(panels)]))
+    FigureCanvasAgg(figure)
+    axes = figure.subplots(nrows=len(panels), ncols=1, sharex=True, squeeze=False)[:, 0]
+
+    for ax, panel in zip(axes, panels):
+        t_first, t_last = get_timerange(conn, panel['table'])
+        if t_last is None:
+            continue
+        t_start = t_last - hours * 3600 if hours else None
+        for column in panel['y']:
+            # decimated, NULL-free fetch, using the time index (if it exists)
+            data = fetch_range(conn, panel['table'], [TIMECOLUMN, column],
+                               t_start=t_start, points=points)
+            times = [datetime.datetime.fromtimestamp(t) for t in data[0]]
+            ax.plot(times, data[1], '-', label=column)
+        ax.set_ylabel(panel.get('ylabel', panel['table']))
+        if panel.get('logy', False):
+            ax.set_yscale('log')
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc='best', fontsize='small')
+
+    if 'title' in figure_conf:
+        axes[0].set_title(figure_conf['title'])
+    figure.autofmt_xdate()
+    figure.tight_layout()
+    figure.savefig(figure_conf['output'])
+    conn.close()
+    return figure_conf['output']
+
+
+def render_all(dbname, figures, hours=None, points=5000, workers=None):
+    """render all figures, in parallel over a pool of processes
+
+        returns:
+            list of the files written
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_figure, dbname, figure_conf, hours, points)
+                   for figure_conf in figures]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render overview figures from a logging database.')
+    parser.add_argument('configuration', help='json file describing the figures')
+    parser.add_argument('--database', help='database file (overrides the configuration)')
+    parser.add_argument('--hours', type=float, help='plot only the last HOURS hours')
+    parser.add_argument('--workers', type=int, default=None, help='number of parallel processes')
+    args = parser.parse_args(argv)
+
+    conf = read_configuration(args.configuration)
+    dbname = args.database or conf['database']
+    hours = args.hours if args.hours is not None else conf.get('hours', None)
+
+    for filename in render_all(dbname, conf['figures'], hours=hours,
+                               points=conf.get('points', 5000), workers=args.workers):
+        print('written: {}'.format(filename))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
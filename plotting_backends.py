@@ -0,0 +1,434 @@
+"""Module containing the backends which can be used to draw plots in the GUI
+
+All backends implement the interface of AbstractPlotBackend, so that
+a plotting window does not need to know which one is drawing.
+
+Classes:
+    AbstractPlotBackend: the interface every backend implements
+
+    MatplotlibBackend: draws with matplotlib on a Qt5Agg canvas,
+        slow, but produces export-quality figures and has the navigation toolbar
+
+    QPainterBackend: draws polylines with QPainter onto a plain QWidget,
+        decimating every trace to the pixels of the widget before drawing,
+        fast enough to redraw many traces of many points at video rates
+
+    PlotCanvas_QPainter: the widget drawn on by the QPainterBackend
+
+    Dashboard_QPainter: widget drawing several panels which share one x-axis,
+        all of them in one paintEvent
+
+Functions:
+    data_limits: limits of a list of traces
+    paint_panel: draw one panel (frame, ticks, traces) with a QPainter
+    decimate_to_pixels: reduce a trace to what can be seen on the screen
+    polygon_from_arrays: build the QPolygonF of a trace from numpy arrays
+    benchmark: frames per second of the QPainter drawing, for many long traces
+
+Attributes:
+    backends: dict of all available backends, by name
+"""
+
+import math
+import time
+
+import numpy as np
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+
+from PyQt5 import QtWidgets
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QPointF
+from PyQt5.QtCore import QRectF
+
+
+class AbstractPlotBackend(object):
+    """Interface of a plotting backend
+
+        widget: the QWidget which displays the plot
+        toolbar: a QWidget with navigation tools, or None
+        refresh_interval: sensible interval (in seconds) between redraws of live data
+    """
+
+    refresh_interval = 3
+
+    def __init__(self, parent=None):
+        super(AbstractPlotBackend, self).__init__()
+        self.widget = None
+        self.toolbar = None
+
+    def setup(self, title, label_x, label_y):
+        """set title and axis labels"""
+        raise NotImplementedError
+
+    def add_line(self, x, y):
+        """add a new trace, return its index"""
+        raise NotImplementedError
+
+    def set_data(self, index, x, y):
+        """replace the data of the trace 'index'"""
+        raise NotImplementedError
+
+    def redraw(self, autoscale=True):
+        """redraw the plot, rescaling the axes to the data if autoscale is True"""
+        raise NotImplementedError
+
+
+class MatplotlibBackend(AbstractPlotBackend):
+    """Backend drawing with matplotlib
+
+        the matplotlib objects are accessible as
+        self.figure, self.canvas, self.ax
+    """
+
+    def __init__(self, parent=None):
+        super(MatplotlibBackend, self).__init__(parent=parent)
+        # a figure instance to plot on
+        self.figure = Figure()
+        # this is the Canvas Widget that displays the `figure`
+        self.canvas = FigureCanvas(self.figure)
+        # this is the Navigation widget
+        self.toolbar = NavigationToolbar(self.canvas, parent)
+        self.widget = self.canvas
+        self.ax = self.figure.add_subplot(111)
+        self.lines = []
+
+    def setup(self, title, label_x, label_y):
+        self.ax.set_title(title)
+        self.ax.set_xlabel(label_x)
+        self.ax.set_ylabel(label_y)
+
+    def add_line(self, x, y):
+        self.lines.append(self.ax.plot(x, y, '*-')[0])
+        return len(self.lines) - 1
+
+    def set_data(self, index, x, y):
+        self.lines[index].set_xdata(x)
+        self.lines[index].set_ydata(y)
+
+    def redraw(self, autoscale=True):
+        if autoscale:
+            self.ax.relim()
+            self.ax.autoscale_view()
+        self.canvas.draw_idle()
+
+
+def _nice_ticks(low, high, number=6):
+    """return about 'number' round tick values between low and high"""
+    if not high > low:
+        return [low]
+    step = (high - low) / number
+    magnitude = 10**math.floor(math.log10(step))
+    for factor in [1, 2, 5, 10]:
+        if step <= factor * magnitude:
+            step = factor * magnitude
+            break
+    first = math.ceil(low / step) * step
+    return list(np.arange(first, high + step * 1e-9, step))
+
+
+def decimate_to_pixels(x, y, width):
+    """reduce a trace to what can be seen on 'width' pixel columns
+
+        x and y are expected to be already scaled to pixel coordinates.
+        For monotonic x, every pixel column is reduced to its first, minimum,
+        maximum and last point, which draws identically to the full trace.
+        Otherwise, consecutive points falling onto the same pixel are dropped.
+
+        returns:
+            x, y of the decimated trace
+    """
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not np.all(finite):
+        x, y = x[finite], y[finite]
+    if len(x) <= 4 * width:
+        return x, y
+    if np.all(x[1:] >= x[:-1]):
+        # first point of every pixel column, columns outside the frame are merged
+        low = max(math.floor(x[0]), -1)
+        high = min(math.floor(x[-1]), width + 1)
+        starts = np.concatenate(([0], np.searchsorted(x, np.arange(low + 1, high + 1))))
+        starts = starts[np.diff(starts, append=len(x)) > 0]
+        ends = np.append(starts[1:], len(x)) - 1
+        ymin = np.minimum.reduceat(y, starts)
+        ymax = np.maximum.reduceat(y, starts)
+        xs = np.column_stack((x[starts], x[starts], x[starts], x[ends])).ravel()
+        ys = np.column_stack((y[starts], ymin, ymax, y[ends])).ravel()
+        return xs, ys
+    pixels = np.column_stack((np.round(x), np.round(y)))
+    keep = np.ones(len(x), dtype=bool)
+    keep[1:] = np.any(np.diff(pixels, axis=0) != 0, axis=1)
+    return x[keep], y[keep]
+
+
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+          '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+
+def polygon_from_arrays(x, y):
+    """return a QPolygonF of the points (x, y), filled in one go from numpy,
+        without creating a QPointF for every point
+    """
+    polygon = QtGui.QPolygonF(len(x))
+    if len(x):
+        buffer = polygon.data()
+        buffer.setsize(len(x) * 2 * np.dtype(np.float64).itemsize)
+        points = np.frombuffer(buffer, dtype=np.float64).reshape(len(x), 2)
+        points[:, 0] = x
+        points[:, 1] = y
+    return polygon
+
+
+def data_limits(traces):
+    """return the limits (xmin, xmax, ymin, ymax) of all (numeric) traces,
+        None if there is nothing which could be drawn
+    """
+    xs, ys = [], []
+    for x, y in traces:
+        try:
+            x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        except (TypeError, ValueError):
+            continue
+        if np.any(np.isfinite(x)) and np.any(np.isfinite(y)):
+            xs.append(x)
+            ys.append(y)
+    if not xs or not ys:
+        return None
+    limits = [min(np.nanmin(x) for x in xs), max(np.nanmax(x) for x in xs),
+              min(np.nanmin(y) for y in ys), max(np.nanmax(y) for y in ys)]
+    if not all(np.isfinite(limits)):
+        return None
+    if limits[1] == limits[0]:
+        limits[0], limits[1] = limits[0] - 0.5, limits[1] + 0.5
+    if limits[3] == limits[2]:
+        limits[2], limits[3] = limits[2] - 0.5, limits[3] + 0.5
+    pad = (limits[3] - limits[2]) * 0.05
+    return (limits[0], limits[1], limits[2] - pad, limits[3] + pad)
+
+
+def paint_panel(painter, frame, limits, traces, label_y='',
+                ticklabels_x=True, format_x='{:.4g}'.format):
+    """draw one panel: frame, ticks, y-label and all traces into 'frame'
+
+        format_x: function converting an x tick value to its label
+        ticklabels_x: False for panels which share their x-axis with the panel below
+    """
+    xmin, xmax, ymin, ymax = limits
+    scale_x = frame.width() / (xmax - xmin)
+    scale_y = frame.height() / (ymax - ymin)
+
+    # frame, ticks, labels
+    painter.setPen(QtGui.QPen(Qt.black, 1))
+    painter.drawRect(frame)
+    for tick in _nice_ticks(xmin, xmax):
+        px = frame.left() + (tick - xmin) * scale_x
+        painter.drawLine(QPointF(px, frame.bottom()), QPointF(px, frame.bottom() + 4))
+        if ticklabels_x:
+            painter.drawText(QRectF(px - 40, frame.bottom() + 5, 80, 15),
+                             Qt.AlignHCenter, format_x(tick))
+    for tick in _nice_ticks(ymin, ymax, number=max(2, min(6, int(frame.height() / 30)))):
+        py = frame.bottom() - (tick - ymin) * scale_y
+        painter.drawLine(QPointF(frame.left() - 4, py), QPointF(frame.left(), py))
+        painter.drawText(QRectF(frame.left() - 70, py - 8, 64, 16),
+                         Qt.AlignRight | Qt.AlignVCenter, '{:.4g}'.format(tick))
+    painter.save()
+    painter.translate(frame.left() - 58, frame.center().y())
+    painter.rotate(-90)
+    painter.drawText(QRectF(-frame.height() / 2, -10, frame.height(), 20), Qt.AlignHCenter, label_y)
+    painter.restore()
+
+    # traces, decimated to the pixels of the frame
+    painter.save()
+    painter.setClipRect(frame)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+    for ct, (x, y) in enumerate(traces):
+        if not len(x):
+            continue
+        try:
+            px = (np.asarray(x, dtype=float) - xmin) * scale_x
+            py = (np.asarray(y, dtype=float) - ymin) * scale_y
+        except (TypeError, ValueError):
+            # not numeric data, cannot be drawn
+            continue
+        # x and y might be of different lengths, if one of them was appended in between
+        n = min(len(px), len(py))
+        px, py = px[len(px) - n:], py[len(py) - n:]
+        px, py = decimate_to_pixels(px, py, int(frame.width()))
+        painter.setPen(QtGui.QPen(QtGui.QColor(COLORS[ct % len(COLORS)]), 1))
+        painter.drawPolyline(polygon_from_arrays(frame.left() + px, frame.bottom() - py))
+    painter.restore()
+
+
+class PlotCanvas_QPainter(QtWidgets.QWidget):
+    """Widget drawing traces as polylines with QPainter"""
+
+    margins = dict(left=70, right=15, top=30, bottom=45)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(300, 200)
+        self.setAutoFillBackground(True)
+        palette = self.palette()
+        palette.setColor(self.backgroundRole(), Qt.white)
+        self.setPalette(palette)
+        self.title = ''
+        self.label_x = ''
+        self.label_y = ''
+        self.traces = []
+        self.limits = (0., 1., 0., 1.)
+
+    def autoscale(self):
+        """set the axis limits to the range of all (numeric) traces"""
+        limits = data_limits(self.traces)
+        if limits is not None:
+            self.limits = limits
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        frame = QRectF(self.margins['left'], self.margins['top'],
+                       self.width() - self.margins['left'] - self.margins['right'],
+                       self.height() - self.margins['top'] - self.margins['bottom'])
+        if frame.width() <= 0 or frame.height() <= 0:
+            painter.end()
+            return
+        paint_panel(painter, frame, self.limits, self.traces, label_y=self.label_y)
+        painter.drawText(QRectF(0, 5, self.width(), 20), Qt.AlignHCenter, self.title)
+        painter.drawText(QRectF(0, self.height() - 20, self.width(), 20), Qt.AlignHCenter, self.label_x)
+        painter.end()
+
+
+class Dashboard_QPainter(QtWidgets.QWidget):
+    """Widget drawing several panels stacked vertically, sharing one x-axis
+
+        panels: list of dicts with the keys
+            'label_y': label of the y-axis
+            'traces': list of (x, y) pairs
+        all panels are drawn in one paintEvent, with the same x-limits,
+        the x tick labels are only drawn below the lowest panel
+        span: if given, only the last 'span' units of x are shown
+        format_x: function converting an x tick value to its label
+    """
+
+    margins = dict(left=70, right=15, top=30, bottom=45, spacing=8)
+
+    def __init__(self, parent=None, format_x='{:.4g}'.format):
+        super().__init__(parent)
+        self.setMinimumSize(400, 300)
+        self.setAutoFillBackground(True)
+        palette = self.palette()
+        palette.setColor(self.backgroundRole(), Qt.white)
+        self.setPalette(palette)
+        self.title = ''
+        self.label_x = ''
+        self.format_x = format_x
+        self.span = None
+        self.panels = []
+
+    def paintEvent(self, event):
+        if not self.panels:
+            return
+        painter = QtGui.QPainter(self)
+        width = self.width() - self.margins['left'] - self.margins['right']
+        height = (self.height() - self.margins['top'] - self.margins['bottom']
+                  - self.margins['spacing'] * (len(self.panels) - 1)) / len(self.panels)
+        if width <= 0 or height <= 0:
+            painter.end()
+            return
+
+        # one common x-range for all panels
+        limits = [data_limits(panel['traces']) for panel in self.panels]
+        limits_x = [limit[:2] for limit in limits if limit is not None]
+        if limits_x:
+            xmin, xmax = min(l[0] for l in limits_x), max(l[1] for l in limits_x)
+            if self.span is not None:
+                xmin = max(xmin, xmax - self.span)
+        else:
+            xmin, xmax = 0., 1.
+
+        for ct, (panel, limit) in enumerate(zip(self.panels, limits)):
+            frame = QRectF(self.margins['left'],
+                           self.margins['top'] + ct * (height + self.margins['spacing']),
+                           width, height)
+            limits_y = limit[2:] if limit is not None else (0., 1.)
+            if self.span is not None and limit is not None:
+                limits_y = self._limits_y(panel['traces'], xmin, xmax) or limits_y
+            paint_panel(painter, frame, (xmin, xmax) + tuple(limits_y),
+                        panel['traces'], label_y=panel.get('label_y', ''),
+                        ticklabels_x=(ct == len(self.panels) - 1), format_x=self.format_x)
+        painter.drawText(QRectF(0, 5, self.width(), 20), Qt.AlignHCenter, self.title)
+        painter.drawText(QRectF(0, self.height() - 20, self.width(), 20), Qt.AlignHCenter, self.label_x)
+        painter.end()
+
+    @staticmethod
+    def _limits_y(traces, xmin, xmax):
+        """y-limits of the part of the traces which is visible in [xmin, xmax]"""
+        visible = []
+        for x, y in traces:
+            try:
+                x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+            except (TypeError, ValueError):
+                continue
+            inside = (x >= xmin) & (x <= xmax)
+            visible.append((x[inside], y[inside]))
+        limits = data_limits(visible)
+        return limits[2:] if limits is not None else None
+
+
+class QPainterBackend(AbstractPlotBackend):
+    """Backend drawing with QPainter, for fast live views"""
+
+    refresh_interval = 0.05
+
+    def __init__(self, parent=None):
+        super(QPainterBackend, self).__init__(parent=parent)
+        self.widget = PlotCanvas_QPainter(parent)
+
+    def setup(self, title, label_x, label_y):
+        self.widget.title = title
+        self.widget.label_x = label_x
+        self.widget.label_y = label_y
+
+    def add_line(self, x, y):
+        self.widget.traces.append((x, y))
+        return len(self.widget.traces) - 1
+
+    def set_data(self, index, x, y):
+        self.widget.traces[index] = (x, y)
+
+    def redraw(self, autoscale=True):
+        if autoscale:
+            self.widget.autoscale()
+        self.widget.update()
+
+
+backends = dict(matplotlib=MatplotlibBackend,
+                qpainter=QPainterBackend)
+
+
+def benchmark(traces=10, points=100000, frames=50, width=1200, height=800):
+    """return the frames per second at which 'traces' traces of 'points' points
+        each are autoscaled and drawn, as by the QPainterBackend (onto a QImage,
+        so no window is needed - a QGuiApplication has to exist, for the fonts)
+    """
+    x = np.linspace(0., 3600., points)
+    data = [(x, np.sin(x / 100. + ct) + np.random.normal(0., 0.1, points)) for ct in range(traces)]
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    margins = PlotCanvas_QPainter.margins
+    frame = QRectF(margins['left'], margins['top'],
+                   width - margins['left'] - margins['right'],
+                   height - margins['top'] - margins['bottom'])
+    started = time.perf_counter()
+    for _ in range(frames):
+        image.fill(Qt.white)
+        painter = QtGui.QPainter(image)
+        paint_panel(painter, frame, data_limits(data), data)
+        painter.end()
+    return frames / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    app = QtWidgets.QApplication([])
+    print('{:.1f} frames per second for 10 traces of 100k points'.format(benchmark()))
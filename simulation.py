@@ -0,0 +1,1005 @@
+"""Simulated instruments, to run the drivers, updaters and GUI without hardware
+
+Addresses starting with 'SIM' are served by this module instead of the VISA
+library, e.g.
+    'SIM::ITC503', 'SIM::ILM211', 'SIM::IPS120', 'SIM::LakeShore350', 'SIM::Keithley2182',
+    'SIM::Keithley6221'
+    'SIM::ISOBUS' (several Oxford instruments on one line, e.g. 'SIM::ISOBUS@1' for the ITC503)
+
+Options can be appended to the address, separated by '::':
+    'SIM::ITC503::latency=0.05::garbage=0.01::rate=2'
+    latency: seconds per transaction, for serial instruments the transfer time
+        of the characters at baud_rate is added
+    garbage: probability of a bad reply: a timeout (the reply is lost, or arrives late,
+        in the next read), an empty reply, '?' (not understood) or a truncated reply
+    rate: new readings per second the instrument produces, values are held in between
+    drop: probability per transaction that the session is lost (it has to be reopened)
+    speed: how much faster than real time the cryostat evolves (shared by all instruments)
+
+All instruments share one simulated cryostat: the ITC503 controls the VTI,
+the LakeShore350 the sample stage (coupled to the VTI), the IPS120 the magnet,
+the ILM211 sees the helium boiling off (faster while the field is swept),
+and the Keithley2182 measures a temperature-dependent voltage, the Keithley6221
+runs delta measurements of the same sample resistance.
+
+Attributes:
+    cryostat: the simulated cryostat, shared by all simulated instruments
+    resource_manager: used by the drivers in place of visa.ResourceManager()
+
+Functions:
+    is_simulated: whether an address is to be served by this module
+
+Classes:
+    Cryostat: thermal, magnet and cryogen model
+    SimulatedResourceManager: opens simulated resources by address
+    SimulatedResource: base of the simulated instruments, with latency and garbage
+    SimulatedITC503, SimulatedILM211, SimulatedIPS120,
+    SimulatedLakeShore350, SimulatedKeithley2182, SimulatedKeithley6221: the instruments
+    SimulatedIsobus: a serial line with several Oxford instruments (ISOBUS)
+"""
+
+import math
+import time
+import random
+import struct
+import threading
+from collections import deque
+
+from pyvisa.errors import VisaIOError
+
+timeouterror = VisaIOError(-1073807339)
+# the session was lost, or is used after it was closed
+connectionlost = VisaIOError(-1073807194)
+invalidsession = VisaIOError(-1073807346)
+
+
+def is_simulated(address):
+    """whether an address is to be served by this module"""
+    return address.upper().startswith('SIM')
+
+
+class Cryostat(object):
+    """thermal, magnet and cryogen model of the cryostat
+
+        the state is advanced lazily, whenever an instrument looks at it,
+        in steps of at most max_step (simulated) seconds
+    """
+
+    bath = 4.2
+    # time constants (s) of the VTI, and of the sample stage
+    tau_vti = 120.
+    tau_sample = 30.
+    max_step = 1.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.speed = 1.
+        self._last = time.monotonic()
+
+        # ITC: VTI temperature, control
+        self.T_vti = 4.3
+        self.vti_setpoint = 4.3
+        self.vti_auto = True
+        self.vti_heater_manual = 0.
+        self.vti_heater = 0.
+        # LakeShore: sample temperature, setpoint (target and ramped), ramp, heater range
+        self.T_sample = 4.5
+        self.sample_target = 4.5
+        self.sample_setpoint = 4.5
+        self.sample_ramp = False
+        self.sample_rate = 1.
+        self.sample_range = 0
+        self.sample_heater = 0.
+        self.ramp_done = True
+        self.ramps_finished = 0
+        # IPS: output field, set point, rate (T/min), activity (0 hold, 1 to set point, 2 to zero)
+        self.field = 0.
+        self.field_setpoint = 0.
+        self.field_rate = 0.1
+        self.field_activity = 0
+        # ILM: levels in percent
+        self.helium = 85.
+        self.nitrogen = 90.
+
+    def advance(self):
+        """advance the model to now, returns the simulated time step"""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = (now - self._last) * self.speed
+            self._last = now
+            remaining = elapsed
+            while remaining > 0:
+                dt = min(remaining, self.max_step)
+                self._step(dt)
+                remaining -= dt
+            return elapsed
+
+    def _step(self, dt):
+        # VTI: the ITC holds the set point, or the manual heater heats against the bath
+        target = self.vti_setpoint if self.vti_auto else self.bath + 3. * self.vti_heater_manual
+        self.T_vti += (target - self.T_vti) * (1 - math.exp(-dt / self.tau_vti))
+        if self.vti_auto:
+            self.vti_heater = min(100., max(0., (self.T_vti - self.bath) / 3. + 5. * (target - self.T_vti)))
+        else:
+            self.vti_heater = self.vti_heater_manual
+
+        # sample: the setpoint ramps towards the target, the stage follows if the heater is on
+        if self.sample_ramp and self.sample_setpoint != self.sample_target:
+            step = self.sample_rate / 60. * dt
+            difference = self.sample_target - self.sample_setpoint
+            if abs(difference) <= step:
+                self.sample_setpoint = self.sample_target
+            else:
+                self.sample_setpoint += math.copysign(step, difference)
+        elif not self.sample_ramp:
+            self.sample_setpoint = self.sample_target
+        if self.sample_setpoint == self.sample_target and not self.ramp_done:
+            self.ramp_done = True
+            self.ramps_finished += 1
+        target = max(self.sample_setpoint, self.T_vti) if self.sample_range else self.T_vti
+        self.T_sample += (target - self.T_sample) * (1 - math.exp(-dt / self.tau_sample))
+        self.sample_heater = min(100., max(0., 10. * (target - self.T_vti) + 20. * (target - self.T_sample))) \
+            if self.sample_range else 0.
+
+        # magnet
+        aim = {0: self.field, 1: self.field_setpoint, 2: 0.}[self.field_activity]
+        step = self.field_rate / 60. * dt
+        sweeping = self.field != aim
+        self.field = aim if abs(aim - self.field) <= step else self.field + math.copysign(step, aim - self.field)
+
+        # cryogens, in percent per second
+        self.helium = max(0., self.helium - dt * (1.5e-4 + (3e-3 if sweeping else 0.)))
+        self.nitrogen = max(0., self.nitrogen - dt * 3e-4)
+
+    def sample_resistance(self):
+        """resistance of the sample (Ohm), thermally activated"""
+        return 100. * math.exp(5. / max(self.T_sample, 0.5))
+
+    def set_sample_target(self, value):
+        """new LakeShore setpoint, starts a ramp if ramping is enabled"""
+        self.advance()
+        with self.lock:
+            self.sample_target = value
+            if self.sample_ramp and value != self.sample_setpoint:
+                self.ramp_done = False
+
+
+cryostat = Cryostat()
+
+
+class SimulatedResource(object):
+    """base of the simulated instruments
+
+        behaves like a pyvisa message based resource: write, read, query,
+        with the latency, the garbage replies and the data rate as configured
+        subclasses implement handle(command), which returns the reply or None
+    """
+
+    # separator of several commands in one message, None: one command per message
+    separator = None
+    # serial instruments: the transfer time of the characters is added to the latency
+    serial = False
+
+    def __init__(self, cryostat, latency=0.01, garbage=0., rate=10., drop=0.):
+        super(SimulatedResource, self).__init__()
+        self.cryostat = cryostat
+        self.latency = latency
+        self.garbage = garbage
+        self.rate = rate
+        self.drop = drop
+        self.closed = False
+        self.timeout = 2000
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.baud_rate = 9600
+        # replies, with the time they are completely in the input buffer
+        self._replies = deque()
+        # bytes of the first reply taken by read_bytes already
+        self._offset = 0
+        # the instrument handles one transaction at a time
+        self._lock = threading.Lock()
+        self._held = dict()
+
+    def _transfer_time(self, message):
+        """transfer time of a message (serial instruments only)"""
+        if not self.serial:
+            return 0.
+        # start bit, 8 data bits, stop bits
+        return (len(message) + 1) * 11. / self.baud_rate
+
+    def sample(self, key, function):
+        """value which the instrument measures anew only rate times per second"""
+        now = time.monotonic()
+        if key not in self._held or now - self._held[key][0] >= 1. / self.rate:
+            self._held[key] = (now, function())
+        return self._held[key][1]
+
+    def noise(self, value, relative=1e-4, absolute=0.):
+        return value + random.gauss(0., abs(value) * relative + absolute)
+
+    def _check_session(self):
+        if self.closed:
+            raise invalidsession
+        if self.drop and random.random() < self.drop:
+            self.closed = True
+            raise connectionlost
+
+    def _reply(self, reply):
+        """queue a reply, it arrives after the latency and its transfer time,
+            or (garbage) is lost, arrives after the timeout, or is corrupted
+        """
+        ready = time.monotonic() + self.latency + self._transfer_time(reply)
+        if self.garbage and isinstance(reply, str) and random.random() < self.garbage:
+            failure = random.choice(['lost', 'late', 'empty', 'unknown', 'truncated'])
+            if failure == 'lost':
+                return
+            if failure == 'late':
+                ready += self.timeout / 1e3
+            else:
+                reply = {'empty': '', 'unknown': '?' + reply, 'truncated': reply[:len(reply) // 2]}[failure]
+        self._replies.append((ready, reply))
+
+    def write(self, message):
+        with self._lock:
+            self._check_session()
+            time.sleep(self._transfer_time(message))
+            self.cryostat.advance()
+            commands = message.split(self.separator) if self.separator else [message]
+            replies = [self.handle(command.strip()) for command in commands if command.strip()]
+            replies = [reply for reply in replies if reply is not None]
+            if len(replies) == 1:
+                # binary blocks (bytes) are answered one per message
+                self._reply(replies[0])
+            elif replies:
+                self._reply((self.separator or '').join(replies))
+
+    def read(self):
+        with self._lock:
+            self._check_session()
+            waiting = self._replies[0][0] - time.monotonic() if self._replies else None
+            if waiting is None or waiting > self.timeout / 1e3:
+                # nothing (yet): a late reply stays queued
+                time.sleep(self.timeout / 1e3)
+                raise timeouterror
+            time.sleep(max(waiting, 0.))
+            __, reply = self._replies.popleft()
+            offset, self._offset = self._offset, 0
+            if offset and isinstance(reply, bytes):
+                reply = reply[offset:]
+            elif offset:
+                reply = self._encoded(reply)[offset:-len(self.read_termination)].decode('latin-1')
+            return reply
+
+    def _encoded(self, reply):
+        return reply if isinstance(reply, bytes) else (reply + self.read_termination).encode('latin-1')
+
+    @property
+    def bytes_in_buffer(self):
+        """number of bytes which arrived and were not read yet"""
+        with self._lock:
+            self._check_session()
+            now = time.monotonic()
+            arrived = 0
+            for ready, reply in self._replies:
+                if ready > now:
+                    break
+                arrived += len(self._encoded(reply))
+            return arrived - self._offset
+
+    def read_bytes(self, count):
+        """read count bytes which arrived already (the raw replies, with their termination)"""
+        with self._lock:
+            self._check_session()
+            data = b''
+            while len(data) < count and self._replies and self._replies[0][0] <= time.monotonic():
+                encoded = self._encoded(self._replies[0][1])
+                taken = encoded[self._offset:self._offset + count - len(data)]
+                data += taken
+                self._offset += len(taken)
+                if self._offset >= len(encoded):
+                    self._replies.popleft()
+                    self._offset = 0
+            return data
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def read_raw(self):
+        return self._encoded(self.read())
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list, **kwargs):
+        """query a binary block (IEEE 488.2 definite length, '#<digits><length><data>')"""
+        self.write(message)
+        block = self.read_raw()
+        if block[:1] != b'#':
+            raise AssertionError('simulation: not a binary block: {!r}'.format(block[:20]))
+        digits = int(block[1:2])
+        length = int(block[2:2 + digits])
+        data = block[2 + digits:2 + digits + length]
+        return container(struct.unpack('{}{:d}{}'.format('>' if is_big_endian else '<',
+                                                         length // struct.calcsize(datatype), datatype), data))
+
+    def clear(self):
+        with self._lock:
+            self._replies.clear()
+            self._offset = 0
+
+    def close(self):
+        self.closed = True
+
+    def handle(self, command):
+        """process one command, return the reply (None if there is none)"""
+        raise NotImplementedError
+
+
+class SimulatedOxford(SimulatedResource):
+    """common part of the Oxford Instruments (ISOBUS) instruments
+
+        commands starting with '$' are not answered,
+        the others are answered with their first letter (and the value)
+    """
+    serial = True
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedOxford, self).__init__(*args, **kwargs)
+        self.control = 3
+
+    def handle(self, command):
+        quiet = command.startswith('$')
+        command = command.lstrip('$')
+        # the ISOBUS address, if any, is not needed on a line of its own
+        command = command.lstrip('@0123456789') if command.startswith('@') else command
+        if not command:
+            return None if quiet else '?'
+        try:
+            reply = self.handle_isobus(command[0], command[1:])
+        except (ValueError, KeyError, IndexError):
+            reply = None
+        if reply is None:
+            reply = '?' + command
+        return None if quiet else reply
+
+    def handle_isobus(self, letter, argument):
+        if letter == 'C':
+            self.control = int(argument)
+            return 'C'
+        if letter == 'R':
+            return 'R{:+.4f}'.format(self.variable(int(argument)))
+        return None
+
+    def variable(self, index):
+        raise KeyError(index)
+
+
+class SimulatedITC503(SimulatedOxford):
+    """ITC 503 temperature controller, controlling the VTI"""
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedITC503, self).__init__(*args, **kwargs)
+        self.pid = [1., 1., 0.]
+        self.sensor = 1
+        self.gas = 20.
+        self.sweep = dict()
+        self.pointer = [0, 0]
+        self.sweeping = 0
+
+    def handle_isobus(self, letter, argument):
+        c = self.cryostat
+        if letter == 'T':
+            with c.lock:
+                c.vti_setpoint = float(argument)
+            return 'T'
+        if letter == 'A':
+            with c.lock:
+                c.vti_auto = int(argument) in (1, 3)
+            return 'A'
+        if letter in 'PID':
+            self.pid['PID'.index(letter)] = float(argument)
+            return letter
+        if letter == 'H':
+            self.sensor = int(argument)
+            return 'H'
+        if letter == 'O':
+            with c.lock:
+                c.vti_heater_manual = float(argument)
+            return 'O'
+        if letter == 'G':
+            self.gas = float(argument)
+            return 'G'
+        if letter in 'xy':
+            self.pointer['xy'.index(letter)] = int(argument)
+            return letter
+        if letter == 's':
+            self.sweep[tuple(self.pointer)] = float(argument)
+            return 's'
+        if letter == 'S':
+            self.sweeping = int(argument)
+            return 'S'
+        if letter == 'X':
+            return 'X0A{:d}C{:d}S{:02d}H{:d}L0'.format(3 if c.vti_auto else 0, self.control,
+                                                      self.sweeping, self.sensor)
+        return super(SimulatedITC503, self).handle_isobus(letter, argument)
+
+    def variable(self, index):
+        c = self.cryostat
+        T_vti = self.sample('T_vti', lambda: self.noise(c.T_vti, absolute=2e-3))
+        return {0: c.vti_setpoint,
+                1: T_vti,
+                2: T_vti + 0.3,
+                3: self.sample('T_3', lambda: self.noise(c.T_sample, absolute=2e-3)),
+                4: c.vti_setpoint - T_vti,
+                5: c.vti_heater,
+                6: c.vti_heater * 0.4,
+                7: self.gas,
+                8: self.pid[0],
+                9: self.pid[1],
+                10: self.pid[2]}[index]
+
+
+class SimulatedILM211(SimulatedOxford):
+    """ILM 211 level meter: helium on channel 1, nitrogen on channel 2"""
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedILM211, self).__init__(*args, **kwargs)
+        self.fast = [False, False, False]
+
+    def handle_isobus(self, letter, argument):
+        if letter in 'ST':
+            self.fast[int(argument) - 1] = letter == 'T'
+            return letter
+        if letter == 'X':
+            return 'X210S{:02d}{:02d}{:02d}R00'.format(*[3 if fast else 2 for fast in self.fast])
+        return super(SimulatedILM211, self).handle_isobus(letter, argument)
+
+    def variable(self, index):
+        c = self.cryostat
+        # levels in tenths of a percent
+        return {1: round(c.helium * 10), 2: round(c.nitrogen * 10), 3: 0,
+                6: 120., 7: 0., 10: 0.}[index]
+
+
+class SimulatedIPS120(SimulatedOxford):
+    """IPS 120-10 magnet power supply"""
+
+    # field per current, T/A
+    ratio = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedIPS120, self).__init__(*args, **kwargs)
+        self.switch_heater = 1
+        self.mode = 1
+
+    def handle_isobus(self, letter, argument):
+        c = self.cryostat
+        if letter == 'A':
+            with c.lock:
+                c.field_activity = int(argument)
+            return 'A'
+        if letter == 'H':
+            self.switch_heater = int(argument)
+            return 'H'
+        if letter == 'J':
+            with c.lock:
+                c.field_setpoint = float(argument)
+            return 'J'
+        if letter == 'T':
+            with c.lock:
+                c.field_rate = float(argument)
+            return 'T'
+        if letter == 'M':
+            self.mode = int(argument)
+            return 'M'
+        if letter == 'X':
+            aim = {0: c.field, 1: c.field_setpoint, 2: 0.}[c.field_activity]
+            return 'X00A{:d}C{:d}H{:d}M{:d}{:d}P00'.format(c.field_activity, self.control, self.switch_heater,
+                                                           self.mode % 8, 0 if c.field == aim else 1)
+        return super(SimulatedIPS120, self).handle_isobus(letter, argument)
+
+    def variable(self, index):
+        c = self.cryostat
+        current = c.field / self.ratio
+        return {0: current, 1: 0.5 if c.field_activity else 0., 2: self.noise(current, absolute=1e-3),
+                3: 0., 4: current, 5: c.field_setpoint / self.ratio, 6: c.field_rate / self.ratio,
+                7: c.field, 8: c.field_setpoint, 9: c.field_rate, 10: 12.,
+                11: 0., 12: 0., 13: 0., 14: 0., 15: 5., 16: current, 17: 0., 18: c.field,
+                19: 0., 20: 0., 21: -120., 22: 120.}[index]
+
+
+class SimulatedLakeShore350(SimulatedResource):
+    """LakeShore 350 temperature controller, controlling the sample stage
+
+        settings which are not simulated are stored, and reported back as set,
+        service requests are raised for the operational status events
+    """
+    separator = ';'
+
+    # answers to the queries which are not computed, as after a reset
+    defaults = {'*IDN?': 'LSCI,MODEL350,SIM0001/SIM0001,1.0',
+                '*ESE?': '0', '*ESR?': '0', '*SRE?': '0', '*TST?': '0',
+                'OPSTE?': '0', 'BRIGT?': '32', 'LEDS?': '1', 'MODE?': '1', 'IEEE?': '1', 'INTSEL?': '0',
+                'TEMP?': '+29.500'}
+    for _channel in 'ABCD':
+        defaults['INTYPE? ' + _channel] = '3,1,0,1,1,0'
+        defaults['INCRV? ' + _channel] = '0'
+        defaults['FILTER? ' + _channel] = '0,10,2'
+        defaults['INNAME? ' + _channel] = '"Input {}"'.format(_channel)
+        defaults['TLIMIT? ' + _channel] = '+400.000'
+        defaults['ALARM? ' + _channel] = '0,+400.000,+0.000,+0.000,0,0,0'
+        defaults['ALARMST? ' + _channel] = '0,0'
+        defaults['RDGST? ' + _channel] = '0'
+    for _output in '1234':
+        defaults['OUTMODE? ' + _output] = '1,{},0'.format(_output if _output in '12' else '1')
+        defaults['PID? ' + _output] = '+50.0,+20.0,+0'
+        defaults['HTRSET? ' + _output] = '1,2,+0.000,1'
+        defaults['HTRST? ' + _output] = '0'
+        defaults['MOUT? ' + _output] = '+0.000'
+        defaults['TUNEST? ' + _output] = '0,{},0,0'.format(_output)
+        defaults['WARMUP? ' + _output] = '0,+0.000'
+        defaults['ANALOG? ' + _output] = '1,1,+0.000,+0.000,0'
+        defaults['AOUT? ' + _output] = '+0.000'
+    del _channel, _output
+
+    # operational status bits, see LakeShore350.OPST_bits
+    NRDG = 8
+    RAMP1 = 16
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedLakeShore350, self).__init__(*args, **kwargs)
+        self.settings = dict(self.defaults)
+        self.curves = dict()
+        self.sre = 0
+        self.opste = 0
+        self.opstr = 0
+        self._ramps_seen = cryostat.ramps_finished
+        self._reading_time = 0.
+        self._srq = threading.Event()
+        self._events_enabled = False
+
+    def _inputs(self):
+        c = self.cryostat
+        T = self.sample('T_sample', lambda: self.noise(c.T_sample, absolute=5e-4))
+        return {'A': T, 'B': self.sample('T_vti', lambda: self.noise(c.T_vti, absolute=5e-4)),
+                'C': T + 0.05, 'D': 300.}
+
+    def _update_status(self):
+        """latch the operational status events, raise a service request if enabled"""
+        c = self.cryostat
+        c.advance()
+        now = time.monotonic()
+        events = 0
+        if now - self._reading_time >= 1. / self.rate:
+            self._reading_time = now
+            events |= self.NRDG
+        if self._ramps_seen != c.ramps_finished:
+            self._ramps_seen = c.ramps_finished
+            events |= self.RAMP1
+        # a service request is raised when an enabled event is latched anew
+        if events & ~self.opstr & self.opste and self.sre & 128:
+            self._srq.set()
+        self.opstr |= events
+
+    def handle(self, command):
+        self._update_status()
+        c = self.cryostat
+        name, __, argument = command.partition(' ')
+        name = name.upper()
+        argument = argument.replace(' ', '')
+        arguments = argument.split(',') if argument else []
+
+        if name.endswith('?'):
+            return self.handle_query(name, arguments)
+
+        if name == 'SETP':
+            if arguments[0] == '1':
+                c.set_sample_target(float(arguments[1]))
+        elif name == 'RAMP':
+            if arguments[0] == '1':
+                with c.lock:
+                    c.sample_ramp = arguments[1] == '1'
+                    c.sample_rate = float(arguments[2])
+        elif name == 'RANGE':
+            if arguments[0] == '1':
+                with c.lock:
+                    c.sample_range = int(arguments[1])
+        elif name == '*SRE':
+            self.sre = int(argument)
+        elif name == 'OPSTE':
+            self.opste = int(argument)
+        elif name == '*CLS':
+            self.opstr = 0
+            self._srq.clear()
+        elif name == 'CRVDEL':
+            self.curves.pop(int(argument), None)
+        elif name == 'CRVHDR':
+            self.curves.setdefault(int(arguments[0]), dict())['header'] = ','.join(arguments[1:])
+        elif name == 'CRVPT':
+            self.curves.setdefault(int(arguments[0]), dict())[int(arguments[1])] = \
+                '{:+.6g},{:+.6g}'.format(float(arguments[2]), float(arguments[3]))
+        elif name + '? ' + (arguments[0] if arguments else '') in self.settings:
+            self.settings[name + '? ' + arguments[0]] = ','.join(arguments[1:])
+        else:
+            self.settings[name + '?'] = argument
+        return None
+
+    def handle_query(self, name, arguments):
+        c = self.cryostat
+        if name in ('KRDG?', 'SRDG?', 'CRDG?'):
+            inputs = self._inputs()
+            channel = arguments[0] if arguments else '0'
+            if name == 'SRDG?':
+                # a resistance thermometer
+                inputs = {key: 1000. / max(T, 0.1) for key, T in inputs.items()}
+            if name == 'CRDG?':
+                inputs = {key: T - 273.15 for key, T in inputs.items()}
+            if channel == '0':
+                return ','.join('{:+.4f}'.format(inputs[key]) for key in 'ABCD')
+            return '{:+.4f}'.format(inputs[channel])
+        if name == 'SETP?':
+            return '{:+.4f}'.format(c.sample_setpoint if arguments[0] == '1' else 0.)
+        if name == 'RAMP?':
+            return '{:d},{:+.2f}'.format(int(c.sample_ramp), c.sample_rate) if arguments[0] == '1' else '0,+0.00'
+        if name == 'RAMPST?':
+            return '{:d}'.format(int(not c.ramp_done)) if arguments[0] == '1' else '0'
+        if name == 'RANGE?':
+            return '{:d}'.format(c.sample_range) if arguments[0] == '1' else '0'
+        if name == 'HTR?':
+            return '{:+.2f}'.format(c.sample_heater if arguments[0] == '1' else 0.)
+        if name == '*OPC?':
+            return '1'
+        if name == '*STB?':
+            return '{:d}'.format(self._status_byte(clear=False))
+        if name == '*SRE?':
+            return '{:d}'.format(self.sre)
+        if name == 'OPSTE?':
+            return '{:d}'.format(self.opste)
+        if name == 'OPST?':
+            return '{:d}'.format(self.RAMP1 if c.ramp_done else 0)
+        if name == 'OPSTR?':
+            value, self.opstr = self.opstr, 0
+            return '{:d}'.format(value)
+        if name == 'CRVHDR?':
+            return self.curves.get(int(arguments[0]), dict()).get('header', 'User Curve,,3,+375.000,1')
+        if name == 'CRVPT?':
+            return self.curves.get(int(arguments[0]), dict()).get(int(arguments[1]), '+0.00000,+0.00000')
+        key = name + ' ' + arguments[0] if arguments else name
+        if key in self.settings:
+            return self.settings[key]
+        return None
+
+    def _status_byte(self, clear):
+        """the status byte, with RQS (64) if a service request is pending"""
+        stb = 128 if self.opstr & self.opste else 0
+        if self._srq.is_set():
+            stb |= 64
+            if clear:
+                self._srq.clear()
+        return stb
+
+    def read_stb(self):
+        """serial poll: the status byte, resets the service request"""
+        with self._lock:
+            self._update_status()
+            return self._status_byte(clear=True)
+
+    def enable_event(self, event_type, mechanism, context=None):
+        self._events_enabled = True
+
+    def disable_event(self, event_type, mechanism):
+        self._events_enabled = False
+
+    def discard_events(self, event_type, mechanism):
+        self._srq.clear()
+
+    def wait_on_event(self, event_type, timeout):
+        """wait for a service request, raises a timeout error if none came within timeout (ms)"""
+        deadline = time.monotonic() + timeout / 1e3
+        if not self._events_enabled:
+            time.sleep(timeout / 1e3)
+        while self._events_enabled:
+            with self._lock:
+                self._update_status()
+            if self._srq.wait(min(0.05, max(0., deadline - time.monotonic()))):
+                return
+            if time.monotonic() >= deadline:
+                break
+        raise timeouterror
+
+
+class SimulatedKeithley2182(SimulatedResource):
+    """Keithley 2182 nanovoltmeter, measuring a voltage which depends on the sample temperature
+
+        the trace buffer is filled in time after INIT: one reading per TRIG:TIM
+        interval, but not faster than the integration time (NPLC at 50 Hz, at least 1 ms),
+        TRAC:DATA? answers in ASCII or, after FORM:DATA REAL,32, as binary block
+    """
+    separator = ';'
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedKeithley2182, self).__init__(*args, **kwargs)
+        self.channel = 1
+        self.function = 'VOLT'
+        self.settings = {'*IDN?': 'KEITHLEY INSTRUMENTS INC.,MODEL 2182A,SIM0001,C02'}
+        self.binary = False
+        self.swapped = False
+        self.trace_points = 100
+        self.trace_interval = None
+        self.trace_count = 1
+        self.trace_started = None
+        self.trace = []
+        self.nplc = 1.
+
+    def reading(self):
+        c = self.cryostat
+        if self.function.startswith('TEMP'):
+            return self.sample('temperature', lambda: self.noise(c.T_sample, absolute=1e-2))
+        # a thermally activated sample resistance, measured with 1 uA
+        return self.sample('voltage', lambda: self.noise(1e-6 * c.sample_resistance(), absolute=10e-9))
+
+    def _fill_trace(self):
+        """append the readings taken since INIT"""
+        if self.trace_started is None:
+            return
+        interval = max(self.trace_interval or 0., self.nplc / 50., 1e-3)
+        taken = min(int((time.monotonic() - self.trace_started) / interval) + 1,
+                    self.trace_count, self.trace_points)
+        while len(self.trace) < taken:
+            # every reading of the trace is a new one
+            self._held.clear()
+            self.trace.append(self.reading())
+        if len(self.trace) >= min(self.trace_count, self.trace_points):
+            self.trace_started = None
+
+    def _trace_data(self):
+        self._fill_trace()
+        if not self.binary:
+            return ','.join('{:+.7E}'.format(value) for value in self.trace)
+        data = struct.pack('{}{:d}f'.format('<' if self.swapped else '>', len(self.trace)), *self.trace)
+        length = str(len(data))
+        return '#{:d}{}'.format(len(length), length).encode() + data + b'\n'
+
+    def handle(self, command):
+        name, __, argument = command.partition(' ')
+        name = name.upper().lstrip(':')
+        if name in ('SENS:CHAN', 'SENSE:CHANNEL'):
+            self.channel = int(argument)
+        elif name in ('SENS:FUNC', 'SENSE:FUNCTION'):
+            self.function = argument.strip('\'"').upper()
+        elif name == 'SENS:VOLT:NPLC':
+            self.nplc = float(argument)
+        elif name == 'FORM:DATA':
+            self.binary = argument.upper().startswith('REAL')
+        elif name == 'FORM:BORD':
+            self.swapped = argument.upper().startswith('SWAP')
+        elif name == 'TRAC:POIN':
+            self.trace_points = int(argument)
+        elif name == 'TRAC:CLE':
+            self.trace = []
+        elif name == 'TRIG:SOUR':
+            self.trace_interval = None if argument.upper().startswith('IMM') else self.trace_interval or 1.
+        elif name == 'TRIG:TIM':
+            self.trace_interval = float(argument)
+        elif name == 'TRIG:COUN':
+            self.trace_count = int(argument)
+        elif name == 'INIT':
+            self.trace = []
+            self.trace_started = time.monotonic()
+        elif name == 'ABOR':
+            self.trace_started = None
+        elif name == 'TRAC:POIN:ACT?':
+            self._fill_trace()
+            return str(len(self.trace))
+        elif name == 'TRAC:DATA?':
+            return self._trace_data()
+        elif name in ('SENS:DATA:FRES?', 'SENS:DATA?', 'SENS:DATA:LAT?', 'FETC?', 'READ?', 'MEAS?'):
+            return '{:+.7E}'.format(self.reading())
+        elif name.endswith('?'):
+            return self.settings.get(name, None)
+        else:
+            self.settings[name + '?'] = argument
+        return None
+
+
+class SimulatedKeithley6221(SimulatedResource):
+    """Keithley 6221 current source with a 2182A attached, running delta,
+        differential conductance and pulse delta measurements on the sample
+
+        after INIT:IMM, the readings fill the buffer in time: one per delay plus
+        one power line cycle (50 Hz) for delta and differential conductance,
+        one per pulse interval for pulse delta, the thermoelectric offset cancels
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SimulatedKeithley6221, self).__init__(*args, **kwargs)
+        self.settings = {'*IDN?': 'KEITHLEY INSTRUMENTS INC.,MODEL 6221,SIM0002,D03',
+                         'SOUR:DELT:NVPR?': '1'}
+        self.values = dict(DELT=dict(HIGH=1e-3, LOW=None, DEL=0.002, COUN=None),
+                           DCON=dict(STAR=0., STOP=1e-5, STEP=1e-6, DELT=1e-6, DEL=0.002),
+                           PDEL=dict(HIGH=1e-3, LOW=0., COUN=None, INT=5))
+        self.binary = False
+        self.swapped = False
+        self.armed = None
+        self.started = None
+        self.buffer_points = 100
+        self.buffer = []
+
+    def _period(self, mode):
+        if mode == 'PDEL':
+            return self.values['PDEL']['INT'] / 50.
+        return self.values[mode]['DEL'] + 1. / 50.
+
+    def _count(self, mode):
+        values = self.values[mode]
+        if mode == 'DCON':
+            return int(round((values['STOP'] - values['STAR']) / values['STEP'])) + 1
+        return values['COUN']
+
+    def _voltage(self, mode, index):
+        values = self.values[mode]
+        resistance = self.cryostat.sample_resistance()
+        if mode == 'DELT':
+            low = -values['HIGH'] if values['LOW'] is None else values['LOW']
+            step = (values['HIGH'] - low) / 2.
+        elif mode == 'DCON':
+            step = 2. * values['DELT']
+        else:
+            step = values['HIGH'] - values['LOW']
+        return self.noise(resistance * step, absolute=5e-9)
+
+    def _fill_buffer(self):
+        """append the readings taken since INIT:IMM"""
+        if self.started is None:
+            return
+        mode = self.armed
+        period = self._period(mode)
+        count = self._count(mode)
+        taken = int((time.monotonic() - self.started) / period)
+        taken = min(taken, self.buffer_points, count if count is not None else taken)
+        while len(self.buffer) < taken:
+            index = len(self.buffer)
+            self.buffer.append((self._voltage(mode, index), (index + 1) * period))
+        if count is not None and len(self.buffer) >= count or len(self.buffer) >= self.buffer_points:
+            self.started = None
+            self.armed = None
+
+    def _buffer_data(self, start, count):
+        self._fill_buffer()
+        values = [value for reading in self.buffer[start:start + count] for value in reading]
+        if not self.binary:
+            return ','.join('{:+.7E}'.format(value) for value in values)
+        data = struct.pack('{}{:d}d'.format('<' if self.swapped else '>', len(values)), *values)
+        length = str(len(data))
+        return '#{:d}{}'.format(len(length), length).encode() + data + b'\n'
+
+    def handle(self, command):
+        name, __, argument = command.partition(' ')
+        name = name.upper().lstrip(':')
+        parts = name.split(':')
+        if name == 'FORM:DATA':
+            self.binary = not argument.upper().startswith('ASC')
+        elif name == 'FORM:BORD':
+            self.swapped = argument.upper().startswith('SWAP')
+        elif name == 'TRAC:CLE':
+            self.buffer = []
+        elif name == 'TRAC:POIN':
+            self.buffer_points = int(argument)
+        elif name == 'TRAC:POIN:ACT?':
+            self._fill_buffer()
+            return str(len(self.buffer))
+        elif name == 'TRAC:DATA:SEL?':
+            start, count = (int(value) for value in argument.split(','))
+            return self._buffer_data(start, count)
+        elif name == 'TRAC:DATA?':
+            return self._buffer_data(0, len(self.buffer))
+        elif len(parts) == 3 and parts[0] == 'SOUR' and parts[1] in self.values and parts[2] == 'ARM':
+            self.armed = parts[1]
+            self.buffer = []
+        elif len(parts) == 3 and parts[0] == 'SOUR' and parts[1] in self.values and parts[2] == 'ARM?':
+            self._fill_buffer()
+            return '1' if self.armed == parts[1] else '0'
+        elif len(parts) == 3 and parts[0] == 'SOUR' and parts[1] in self.values and parts[2] in self.values[parts[1]]:
+            value = argument.upper()
+            self.values[parts[1]][parts[2]] = None if value == 'INF' else float(value)
+        elif name == 'INIT:IMM' or name == 'INIT':
+            if self.armed:
+                self.started = time.monotonic()
+        elif name == 'SOUR:SWE:ABOR':
+            self._fill_buffer()
+            self.started = None
+            self.armed = None
+        elif name.endswith('?'):
+            return self.settings.get(name, None)
+        else:
+            self.settings[name + '?'] = argument
+        return None
+
+
+class SimulatedIsobus(SimulatedResource):
+    """one serial line with several Oxford instruments daisy-chained (ISOBUS)
+
+        commands are routed by their address prefix ('@2R7', '$@1T5'),
+        the instruments on the line are set by the options of the address:
+            'SIM::ISOBUS::1=ITC503::2=IPS120::6=ILM211' (this is the default)
+    """
+    serial = True
+
+    def __init__(self, cryostat, instruments=None, **kwargs):
+        super(SimulatedIsobus, self).__init__(cryostat, **kwargs)
+        instruments = instruments or {1: 'ITC503', 2: 'IPS120', 6: 'ILM211'}
+        self.instruments = {number: SimulatedResourceManager.instruments[name.upper()](cryostat, latency=0.)
+                            for number, name in instruments.items()}
+
+    def handle(self, command):
+        quiet = '$' if command.startswith('$') else ''
+        command = command.lstrip('$')
+        if not command.startswith('@'):
+            return None if quiet else '?' + command
+        number = command[1:len(command) - len(command[1:].lstrip('0123456789'))]
+        if not number or int(number) not in self.instruments:
+            # nobody on the line answers
+            return None
+        return self.instruments[int(number)].handle(quiet + command[1 + len(number):])
+
+
+class SimulatedResourceManager(object):
+    """opens simulated resources by address, in place of visa.ResourceManager()"""
+
+    instruments = {'ITC503': SimulatedITC503,
+                   'ILM211': SimulatedILM211,
+                   'ILM200': SimulatedILM211,
+                   'IPS120': SimulatedIPS120,
+                   'LAKESHORE350': SimulatedLakeShore350,
+                   'KEITHLEY2182': SimulatedKeithley2182,
+                   'KEITHLEY6221': SimulatedKeithley6221,
+                   'ISOBUS': SimulatedIsobus}
+    # per instrument defaults: serial instruments are slow
+    options = {'ITC503': dict(latency=0.03, rate=2.),
+               'ILM211': dict(latency=0.03, rate=0.5),
+               'ILM200': dict(latency=0.03, rate=0.5),
+               'IPS120': dict(latency=0.03, rate=2.),
+               'LAKESHORE350': dict(latency=0.005, rate=10.),
+               'KEITHLEY2182': dict(latency=0.005, rate=20.),
+               'KEITHLEY6221': dict(latency=0.005, rate=20.),
+               'ISOBUS': dict(latency=0.03, rate=2.)}
+
+    def __init__(self, cryostat):
+        super(SimulatedResourceManager, self).__init__()
+        self.cryostat = cryostat
+        # the instruments keep their state when a session is closed and opened again
+        self._opened = dict()
+
+    def list_resources(self):
+        return tuple('SIM::{}'.format(name) for name in self.instruments)
+
+    def open_resource(self, address, **kwargs):
+        """open a simulated instrument, see the module docstring for the address format"""
+        if address in self._opened:
+            resource = self._opened[address]
+            resource.closed = False
+            resource.clear()
+            return resource
+        parts = address.split('::')
+        name = parts[1].upper() if len(parts) > 1 else ''
+        if name not in self.instruments:
+            raise AssertionError('simulation: unknown instrument in {}, available: {}'.format(
+                address, ', '.join(self.list_resources())))
+        options = dict(self.options[name])
+        for part in parts[2:]:
+            key, __, value = part.partition('=')
+            if key.isdigit():
+                # ISOBUS address of an instrument on the line
+                options.setdefault('instruments', dict())[int(key)] = value
+            elif key == 'speed':
+                self.cryostat.speed = float(value)
+            elif key in ('latency', 'garbage', 'rate', 'drop'):
+                options[key] = float(value)
+            else:
+                raise AssertionError('simulation: unknown option {} in {}'.format(key, address))
+        resource = self.instruments[name](self.cryostat, **options)
+        for key, value in kwargs.items():
+            setattr(resource, key, value)
+        self._opened[address] = resource
+        return resource
+
+
+resource_manager = SimulatedResourceManager(cryostat)
@@ -11,13 +11,30 @@ Classes:
     AbstractEventhandlingThread: a thread class, inheriting from AbstractThread,
         which is designed to be used for handling signal-events, not continuous loops
 
+    PollSchedule: decides which values of an instrument are due to be read
+        in a polling cycle, each value having its own interval
+
     Window_ui: a window class, which loads the UI definitions from a spcified .ui file,
         emits a signal upon closing
-"""
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
+    Window_plotting: a window class for plotting live data,
+        with a choice of plotting backends (see plotting_backends)
+
+    Window_plotting_database: a window class for plotting data from the database,
+        loading a coarse overview first, and more detail when zooming in
+
+    DatabaseTile_Fetcher: a thread-class, reading tiles of data from the database
+        for the Window_plotting_database
+
+    Window_dashboard: a window class showing several panels of live data,
+        sharing one time axis, configured by a layout file
+
+    Window_transport_statistics: a window class showing the instrumentation
+        of the instrument transports (latencies, lock waits, bytes, errors per command)
+
+    Window_Keithley6221: a window class to start and stop the delta, differential
+        conductance and pulse delta measurements of the Keithley6221
+"""
 
 from PyQt5.QtCore import QObject
 from PyQt5.QtCore import QThread
@@ -27,6 +44,19 @@ from PyQt5.QtCore import pyqtSlot
 from PyQt5 import QtWidgets
 from PyQt5.uic import loadUi
 
+import sqlite3
+import json
+import time
+import datetime
+
+import numpy as np
+
+import instrumentation
+from database_query import Tiler
+from database_query import TIMECOLUMN
+from plotting_backends import backends
+from plotting_backends import Dashboard_QPainter
+
 
 class AbstractThread(QObject):
     """Abstract thread class to be used with instruments """
@@ -108,6 +138,39 @@ class AbstractEventhandlingThread(AbstractThread):
         pass
 
 
+class PollSchedule(object):
+    """Schedule deciding which values of an instrument are read in a polling cycle
+
+        intervals: dict of the minimum time (seconds) between two reads, per key
+            keys which are not listed are read in every cycle
+
+        Keys which were never read (e.g. in the first cycle), or which were
+        invalidated (e.g. after the corresponding value was set) are due at once.
+    """
+
+    def __init__(self, intervals=None):
+        super(PollSchedule, self).__init__()
+        self.intervals = dict(intervals or {})
+        self._last = dict()
+
+    def due(self, keys):
+        """return the keys (in order) which are due to be read now"""
+        now = time.time()
+        return [key for key in keys if key not in self._last or
+                now - self._last[key] >= self.intervals.get(key, 0)]
+
+    def done(self, key):
+        """register a successful read of key"""
+        self._last[key] = time.time()
+
+    def invalidate(self, *keys):
+        """make keys due at once, all keys if none are given"""
+        if not keys:
+            self._last.clear()
+        for key in keys:
+            self._last.pop(key, None)
+
+
 class Window_ui(QtWidgets.QWidget):
     """Class for a small window, the UI of which is loaded from the .ui file
         emits a signal when being closed
@@ -139,66 +202,480 @@ class Window_ui(QtWidgets.QWidget):
 
 
 class Window_plotting(QtWidgets.QDialog):
-    
-    def __init__(self, data, label_x, label_y, title, parent=None):
+    """Window for plotting (live) data
+
+        data: list of [x, y] pairs, one for each trace
+        backend: name of the plotting backend to draw with (see plotting_backends.backends)
+            'matplotlib' for export-quality figures, 'qpainter' for fast live views
+        refresh: whether the plot should be redrawn regularly, to show live data,
+            every backend.refresh_interval seconds
+        lock: lock under which the (live) data lists are changed, they are copied under it
+        sig_refresh: signal emitted when the data changed (e.g. live_Logger.sig_appended),
+            if given, the data is only copied again after it was emitted
+    """
+
+    def __init__(self, data, label_x, label_y, title, parent=None, backend='matplotlib', refresh=True,
+                 lock=None, sig_refresh=None):
         super().__init__()
         self.data = data
         self.label_x = label_x
         self.label_y = label_y
         self.title = title
+        self.lock = lock
+        self.changed = True
 
-        # a figure instance to plot on
-        self.figure = Figure()
-
-        # this is the Canvas Widget that displays the `figure`
-        # it takes the `figure` instance as a parameter to __init__
-        self.canvas = FigureCanvas(self.figure)
-
-        # this is the Navigation widget
-        # it takes the Canvas widget and a parent
-        self.toolbar = NavigationToolbar(self.canvas, self)
-
-        # Just some button connected to `plot` method
-        # self.button = QtWidgets.QPushButton('Plot')
-        # self.button.clicked.connect(self.plot)
+        self.backend = backends[backend](parent=self)
 
         # set the layout
         layout = QtWidgets.QVBoxLayout()
-        layout.addWidget(self.toolbar)
-        layout.addWidget(self.canvas)
-        # layout.addWidget(self.button)
+        if self.backend.toolbar is not None:
+            layout.addWidget(self.backend.toolbar)
+        layout.addWidget(self.backend.widget)
         self.setLayout(layout)
-        self.lines = []
         self.plot_base()
 
         self.plot()
+        if sig_refresh is not None:
+            self.changed = False
+            sig_refresh.connect(self.data_changed)
+        if refresh:
+            self.timer_refresh = QTimer()
+            self.timer_refresh.timeout.connect(self.plot)
+            self.timer_refresh.start(int(self.backend.refresh_interval * 1e3))
 
     def plot_base(self):
-        self.ax = self.figure.add_subplot(111)
-
-        self.ax.set_title(self.title)
-        self.ax.set_xlabel(self.label_x)
-        self.ax.set_ylabel(self.label_y)
+        self.backend.setup(title=self.title, label_x=self.label_x, label_y=self.label_y)
 
-        # discards the old graph
         if not isinstance(self.data, list):
             self.data = [self.data]
-        self.ax.clear()
         for entry in self.data:
-            self.lines.append(self.ax.plot(entry[0], entry[1], '*-')[0])
+            self.backend.add_line(*self._copy(entry))
+
+    @staticmethod
+    def _as_array(values):
+        """numeric data as a float array, once, so it is not converted at every redraw"""
+        try:
+            return np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            return list(values)
 
+    def _copy(self, entry):
+        """copy x and y of one trace (under the lock, if given),
+            trimmed to their common length, keeping the newest points
+        """
+        if self.lock is None:
+            x, y = self._as_array(entry[0]), self._as_array(entry[1])
+        else:
+            with self.lock:
+                x, y = self._as_array(entry[0]), self._as_array(entry[1])
+        n = min(len(x), len(y))
+        return x[len(x) - n:], y[len(y) - n:]
+
+    @pyqtSlot()
+    def data_changed(self):
+        self.changed = True
+
+    @pyqtSlot()
     def plot(self):
-        ''' plot some not so random stuff '''
-        # create an axis
+        """update all traces with the current data (if it changed), redraw"""
+        if self.changed:
+            self.changed = False
+            for ct, entry in enumerate(self.data):
+                self.backend.set_data(ct, *self._copy(entry))
+        self.backend.redraw()
+
+    def closeEvent(self, event):
+        if hasattr(self, 'timer_refresh'):
+            self.timer_refresh.stop()
+        event.accept()
+
+
+class DatabaseTile_Fetcher(AbstractEventhandlingThread):
+    """Thread class reading data for a Window_plotting_database from the database
+
+        On start, a coarse overview of all requested series is sent.
+        Afterwards, every time range requested via the slot 'fetch'
+        is answered with data in a resolution fitting to the range.
+        The tiles which were read from the database are cached (LRU).
+
+        series: list of dicts with the keys 'table', 'x', 'y',
+            and 'table_x' if x is taken from another table than y,
+            x is then interpolated to the times of y
+    """
+
+    sig_overview = pyqtSignal(object)
+    sig_data = pyqtSignal(object)
+
+    def __init__(self, dbname, series, points=2000, **kwargs):
+        super().__init__(**kwargs)
+        self.dbname = dbname
+        self.series = series
+        self.points = points
+        self.tilers = []
+
+    def running(self):
+        """connect to the database (from within the thread), send the overview"""
+        # the connection must be created in the thread it is used in
+        self.conn = sqlite3.connect(self.dbname)
+        # one tiler per series, so that a NULL in one series does not drop points in another
+        self.tilers = []
+        try:
+            tilers = []
+            for entry in self.series:
+                if 'table_x' in entry:
+                    tilers.append((Tiler(self.conn, entry['table'], [entry['y']], points_per_tile=self.points // 2),
+                                   Tiler(self.conn, entry['table_x'], [entry['x']], points_per_tile=self.points // 2)))
+                else:
+                    tilers.append((Tiler(self.conn, entry['table'], list(dict.fromkeys([entry['x'], entry['y']])),
+                                         points_per_tile=self.points // 2), None))
+            self.tilers = tilers
+            self.sig_overview.emit(self._pick(lambda tiler: tiler.overview(points=self.points)))
+        except AssertionError as assertion:
+            self.sig_assertion.emit(assertion.args[0])
+        except sqlite3.Error as err:
+            self.sig_assertion.emit('Plotting: {}'.format(err))
+
+    def _pick(self, function):
+        """get the data from every tiler, return it as [x, y] per series"""
+        result = []
+        for entry, (tiler, tiler_x) in zip(self.series, self.tilers):
+            data = function(tiler)
+            y = data[tiler.columns.index(entry['y'])]
+            if tiler_x is None:
+                x = data[tiler.columns.index(entry['x'])]
+            else:
+                data_x = function(tiler_x)
+                if data_x.shape[1]:
+                    x = np.interp(data[tiler._idx_time], data_x[tiler_x._idx_time],
+                                  data_x[tiler_x.columns.index(entry['x'])], left=np.nan, right=np.nan)
+                else:
+                    x = np.full_like(y, np.nan)
+            result.append([x, y])
+        return result
+
+    @pyqtSlot(float, float)
+    def fetch(self, t_start, t_stop):
+        """send the data within the time range [t_start, t_stop]"""
+        try:
+            self.sig_data.emit(self._pick(lambda tiler: tiler.fetch(t_start, t_stop)))
+        except AssertionError as assertion:
+            self.sig_assertion.emit(assertion.args[0])
+        except sqlite3.Error as err:
+            self.sig_assertion.emit('Plotting: {}'.format(err))
+
+
+class Window_plotting_database(Window_plotting):
+    """Window for plotting data from the logging database
+
+        A coarse overview over the whole data is shown first,
+        when zooming in (if the x-axis is the time), only the visible time range
+        is fetched in higher resolution, in a separate thread.
+        errors: slot receiving the error messages of the fetching thread
+        (connected before it starts, so the first ones are not lost)
+    """
+
+    sig_fetch = pyqtSignal(float, float)
+
+    def __init__(self, dbname, series, label_x, label_y, title, parent=None, errors=None):
+        self.series = series
+        self.progressive = all(entry['x'] == TIMECOLUMN for entry in series)
+        data = [[np.empty(0), np.empty(0)] for entry in series]
+        super().__init__(data=data, label_x=label_x, label_y=label_y, title=title,
+                         parent=parent, backend='matplotlib', refresh=False)
+
+        self.requested = None
+        self.timer_zoom = QTimer()
+        self.timer_zoom.setSingleShot(True)
+        self.timer_zoom.timeout.connect(self.request_range)
+
+        self.fetcher = DatabaseTile_Fetcher(dbname=dbname, series=series)
+        self.thread = QThread()
+        self.fetcher.moveToThread(self.thread)
+        self.fetcher.sig_overview.connect(self.show_overview)
+        self.fetcher.sig_data.connect(self.show_data)
+        self.sig_fetch.connect(self.fetcher.fetch)
+        if errors is not None:
+            self.fetcher.sig_assertion.connect(errors)
+        self.thread.started.connect(self.fetcher.work)
+        self.thread.start()
 
+    def plot(self):
+        """update the lines with self.data, redraw once, keeping the axis limits"""
         for ct, entry in enumerate(self.data):
-            self.lines[ct].set_xdata(entry[0])
-            self.lines[ct].set_ydata(entry[1])
+            self.backend.set_data(ct, entry[0], entry[1])
+        self.backend.redraw(autoscale=False)
+
+    @pyqtSlot(object)
+    def show_overview(self, data):
+        """show the overview, scale the axes to it, start following the zoom"""
+        self.data = data
+        self.plot()
+        self.backend.redraw(autoscale=True)
+        if self.progressive:
+            self.requested = self.backend.ax.get_xlim()
+            self.backend.ax.callbacks.connect('xlim_changed', lambda ax: self.timer_zoom.start(250))
+
+    @pyqtSlot(object)
+    def show_data(self, data):
+        """show the data fetched for the visible range"""
+        self.data = data
+        self.plot()
+
+    def request_range(self):
+        """ask the fetching thread for the currently visible time range"""
+        xlim = self.backend.ax.get_xlim()
+        if xlim == self.requested:
+            return
+        self.requested = xlim
+        self.sig_fetch.emit(float(xlim[0]), float(xlim[1]))
+
+    def closeEvent(self, event):
+        self.thread.quit()
+        self.thread.wait()
+        event.accept()
+
+
+class Window_dashboard(QtWidgets.QDialog):
+    """Window showing several panels of live data, sharing one time axis
+
+        The live data is copied once per tick of the live logger (see refresh),
+        and all panels are redrawn together in a single repaint.
+
+        mainthread: the main window, holding data_live and dataLock_live
+        layoutfile: json file holding the layout, with
+            title: (optional)
+            span: (optional) number of seconds to show, counted back from the newest point
+            panels: list of panels, stacked vertically, each of which has
+                table: the instrument the data is taken from
+                y: list of values to plot
+                ylabel: (optional)
+    """
+
+    def __init__(self, mainthread, layoutfile, parent=None):
+        super().__init__()
+        self.mainthread = mainthread
+        self.layout_conf = dict(panels=[])
+
+        self.canvas = Dashboard_QPainter(parent=self, format_x=lambda tick:
+                                         datetime.datetime.fromtimestamp(tick).strftime('%H:%M:%S'))
+        self.canvas.label_x = 'time'
+        self.buttonLoad = QtWidgets.QPushButton('Load layout...')
+        self.buttonSave = QtWidgets.QPushButton('Save layout...')
+        self.buttonLoad.clicked.connect(lambda: self.load_layout(
+            QtWidgets.QFileDialog.getOpenFileName(self, 'Load layout', '', 'Layout (*.json)')[0]))
+        self.buttonSave.clicked.connect(lambda: self.save_layout(
+            QtWidgets.QFileDialog.getSaveFileName(self, 'Save layout', '', 'Layout (*.json)')[0]))
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.buttonLoad)
+        buttons.addWidget(self.buttonSave)
+        buttons.addStretch()
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+        self.load_layout(layoutfile)
+
+    def load_layout(self, filename):
+        """read the layout from a json file, redraw"""
+        if not filename:
+            return
+        with open(filename, 'r') as handle:
+            self.layout_conf = json.load(handle)
+        self.setWindowTitle(self.layout_conf.get('title', 'Dashboard'))
+        self.canvas.title = self.layout_conf.get('title', '')
+        self.canvas.span = self.layout_conf.get('span', None)
+        self.refresh()
+
+    def save_layout(self, filename):
+        """write the current layout to a json file"""
+        if not filename:
+            return
+        with open(filename, 'w') as handle:
+            json.dump(self.layout_conf, handle, indent=4)
 
-        self.ax.relim()
-        self.ax.autoscale_view()
+    @pyqtSlot()
+    def refresh(self):
+        """copy the live data for all panels at once, repaint all panels once"""
+        panels = []
+        with self.mainthread.dataLock_live:
+            data = getattr(self.mainthread, 'data_live', dict())
+            for panel in self.layout_conf['panels']:
+                instrument = data.get(panel['table'], dict())
+                times = np.array(instrument.get(TIMECOLUMN, []), dtype=float)
+                traces = []
+                for value in panel['y']:
+                    try:
+                        values = np.array(instrument.get(value, []), dtype=float)
+                    except (TypeError, ValueError):
+                        # not numeric data, cannot be drawn
+                        continue
+                    # both lists are appended together, but might be trimmed in between
+                    n = min(len(times), len(values))
+                    traces.append((times[len(times) - n:], values[len(values) - n:]))
+                panels.append(dict(traces=traces, label_y=panel.get('ylabel', panel['table'])))
+        self.canvas.panels = panels
+        self.canvas.update()
+
+
+class Window_transport_statistics(QtWidgets.QDialog):
+    """Window showing the statistics of the instrument transports, see instrumentation
+
+        one row per instrument and command, refreshed every `interval` seconds
+        times in ms, percentiles from the histograms (upper bin edges)
+    """
 
+    columns = ('instrument', 'command', 'transactions', 'mean', 'p50', 'p99', 'max',
+               'lock mean', 'lock p99', 'lock max', 'bytes sent', 'bytes received', 'errors')
+
+    def __init__(self, interval=1, parent=None):
+        super().__init__()
+        self.setWindowTitle('Transport statistics')
+        self.table = QtWidgets.QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setSortingEnabled(False)
+        self.buttonReset = QtWidgets.QPushButton('Reset')
+        self.buttonReset.clicked.connect(lambda: (instrumentation.reset(), self.refresh()))
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.buttonReset)
+        buttons.addStretch()
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+        self.resize(1000, 400)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(interval * 1e3))
+        self.refresh()
+
+    @pyqtSlot()
+    def refresh(self):
+        """fill the table with the current statistics"""
+        def formatted(value):
+            if value is None:
+                return '-'
+            return '{:.1f}'.format(value) if isinstance(value, float) else str(value)
+
+        rows = []
+        for instrument, commands in sorted(instrumentation.get_statistics().items()):
+            for command, values in sorted(commands.items()):
+                errors = ', '.join('{}: {}'.format(name, number) for name, number in sorted(values['errors'].items()))
+                rows.append((instrument, command, values['transactions'],
+                             values['latency_mean'], values['latency_p50'], values['latency_p99'],
+                             values['latency_max'], values['waited_mean'], values['waited_p99'],
+                             values['waited_max'], values['sent'], values['received'], errors))
+        self.table.setRowCount(len(rows))
+        for row, entries in enumerate(rows):
+            for column, value in enumerate(entries):
+                self.table.setItem(row, column, QtWidgets.QTableWidgetItem(formatted(value)))
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
 
-        # refresh canvas
-        self.canvas.draw()
-        QTimer.singleShot(3*1e3, self.plot)
+
+class Window_Keithley6221(QtWidgets.QDialog):
+    """Window to start and stop the measurements of the Keithley6221 (see Keithley6221_Updater)
+
+        the settings are emitted via sig_start, as taken by startMeasurement,
+        currents are entered in uA, delays in ms
+        the summary of the running measurement is shown via refresh (connect sig_Infodata)
+    """
+
+    sig_start = pyqtSignal(dict)
+    sig_stop = pyqtSignal()
+
+    modes = ('delta', 'dcon', 'pdelta')
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.setWindowTitle('Keithley6221')
+
+        def spinbox(value, minimum=-105e3, maximum=105e3, decimals=4):
+            box = QtWidgets.QDoubleSpinBox()
+            box.setRange(minimum, maximum)
+            box.setDecimals(decimals)
+            box.setValue(value)
+            return box
+
+        self.comboMode = QtWidgets.QComboBox()
+        self.comboMode.addItems(self.modes)
+        self.spinCurrent = spinbox(1.)
+        self.spinStart = spinbox(-10.)
+        self.spinStop = spinbox(10.)
+        self.spinStep = spinbox(1., minimum=1e-4)
+        self.spinDelay = spinbox(2., minimum=1., maximum=9999999., decimals=1)
+        self.spinCount = QtWidgets.QSpinBox()
+        self.spinCount.setRange(0, 65536)
+        self.spinCount.setValue(1000)
+        self.spinCount.setSpecialValueText('until stopped')
+        self.labelInfo = QtWidgets.QLabel('-')
+
+        self.buttonStart = QtWidgets.QPushButton('Start')
+        self.buttonStart.clicked.connect(lambda: self.sig_start.emit(self.settings()))
+        self.buttonStop = QtWidgets.QPushButton('Stop')
+        self.buttonStop.clicked.connect(lambda: self.sig_stop.emit())
+
+        form = QtWidgets.QFormLayout()
+        form.addRow('mode', self.comboMode)
+        form.addRow('current / delta (uA)', self.spinCurrent)
+        form.addRow('staircase start (uA)', self.spinStart)
+        form.addRow('staircase stop (uA)', self.spinStop)
+        form.addRow('staircase step (uA)', self.spinStep)
+        form.addRow('delay (ms)', self.spinDelay)
+        form.addRow('readings', self.spinCount)
+        form.addRow(self.labelInfo)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.buttonStart)
+        buttons.addWidget(self.buttonStop)
+        buttons.addStretch()
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(form)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.comboMode.currentIndexChanged.connect(self.enable_settings)
+        self.enable_settings()
+        self.setConnected(False)
+
+    @pyqtSlot()
+    def enable_settings(self):
+        """enable only the settings used by the selected mode"""
+        mode = self.comboMode.currentText()
+        for box in (self.spinStart, self.spinStop, self.spinStep):
+            box.setEnabled(mode == 'dcon')
+        self.spinCount.setEnabled(mode != 'dcon')
+        # the pulse delta timing is set by its width and interval, not by a delay
+        self.spinDelay.setEnabled(mode != 'pdelta')
+
+    def settings(self):
+        """the settings for startMeasurement, in A and s"""
+        mode = self.comboMode.currentText()
+        current = self.spinCurrent.value() * 1e-6
+        count = self.spinCount.value() or None
+        if mode == 'delta':
+            return dict(mode=mode, high=current, delay=self.spinDelay.value() * 1e-3, count=count)
+        if mode == 'dcon':
+            return dict(mode=mode, start=self.spinStart.value() * 1e-6, stop=self.spinStop.value() * 1e-6,
+                        step=self.spinStep.value() * 1e-6, delta=current,
+                        delay=self.spinDelay.value() * 1e-3)
+        return dict(mode=mode, high=current, count=count)
+
+    def setConnected(self, connected):
+        """enable the buttons only while the Keithley6221 thread is running"""
+        self.buttonStart.setEnabled(connected)
+        self.buttonStop.setEnabled(connected)
+        if not connected:
+            self.labelInfo.setText('-')
+
+    @pyqtSlot(dict)
+    def refresh(self, data):
+        """show the summary of the running measurement"""
+        resistance = data.get('Resistance_Ohm', None)
+        self.labelInfo.setText('{}, {} readings, R = {}'.format(
+            'running' if data.get('Running', 0) else 'idle', data.get('Readings', 0),
+            '-' if resistance is None else '{:.6g} Ohm'.format(resistance)))